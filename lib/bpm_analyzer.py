@@ -3,19 +3,43 @@
 Audio analysis (BPM/key/energy) helper.
 - Reads BPM from tags; if librosa is available, estimates BPM.
 - Extracts simple key (chroma max) and energy (RMS) when librosa is present.
+- --jobs N analyses N files at once in worker processes that import librosa
+  once and stay warm; a file running past --timeout gets its worker killed
+  and replaced, and a "timeout" row.
 Outputs TSV: path, bpm, confidence, method, key, key_confidence, energy_rms, beat_count, first_beat_sec.
+Rows are written in walk order whatever the order files finish in.
 """
 import argparse
 import csv
+import multiprocessing
 import subprocess
+import sys
+import time
+from functools import partial
+from multiprocessing.connection import wait
 from pathlib import Path
-from typing import List, Tuple, Any, Optional
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 
 try:
     import librosa  # type: ignore
 except Exception:
     librosa = None
 
+try:  # page cache hints and read order shared with scripts/hash_root.py
+    sys.path.append(str(Path(__file__).resolve().parents[1] / "scripts"))
+    from bulk_reader import CACHE_MODES, DEFAULT_CACHE_MODE, ORDERS, advised_paths, batches, physical_order  # type: ignore
+except Exception:
+    CACHE_MODES, DEFAULT_CACHE_MODE, ORDERS = ("keep",), "keep", ("walk",)
+
+    def advised_paths(paths: Iterable[Path], mode: str = "keep", readahead: int = 0) -> Iterator[Path]:
+        return iter(paths)
+
+    def batches(items: Iterable[Path], size: int = 4096) -> Iterator[List[Path]]:
+        yield list(items)
+
+    def physical_order(paths: Iterable[Path], order: str = "walk") -> List[Path]:
+        return list(paths)
+
 AUDIO_EXTS = {".mp3", ".wav", ".flac", ".m4a", ".aiff", ".aif", ".ogg"}
 
 
@@ -88,7 +112,165 @@ def audio_features(y_sr_beats: Any) -> Tuple[str, float, float, Optional[int], O
         return "", 0.0, 0.0, None, None
 
 
-def analyze(base: Path, out_tsv: Path, limit: int, max_duration: float, tempo_min: float, tempo_max: float) -> None:
+def analyze_file(path: Path, max_duration: float, tempo_min: float, tempo_max: float) -> List[Any]:
+    """TSV row (see module docstring) for one file."""
+    bpm, conf, method = bpm_from_tags(path)
+    y_sr = None
+    if bpm <= 0:
+        bpm, conf, method, y_sr = bpm_librosa(path, max_duration, tempo_min, tempo_max)
+    key, key_conf, energy, beat_count, first_beat_sec = audio_features(y_sr)
+    return [
+        str(path),
+        f"{bpm:.2f}" if bpm > 0 else "",
+        f"{conf:.2f}" if conf > 0 else "",
+        method,
+        key,
+        f"{key_conf:.2f}",
+        f"{energy:.4f}",
+        beat_count if beat_count is not None else "",
+        f"{first_beat_sec:.3f}" if first_beat_sec is not None else "",
+    ]
+
+
+def failed_row(path: Path, method: str) -> List[Any]:
+    """Row for a file whose analysis did not finish (timeout, crashed worker)."""
+    return [str(path), "", "", method, "", "0.00", "0.0000", "", ""]
+
+
+def _row_task(path: Path, settings: Tuple[float, float, float, str]) -> List[Any]:
+    max_duration, tempo_min, tempo_max, cache_mode = settings
+    row: List[Any] = []
+    for p in advised_paths([path], cache_mode):
+        row = analyze_file(p, max_duration, tempo_min, tempo_max)
+    return row
+
+
+def _worker(conn: Any, func: Callable[[Path], List[Any]]) -> None:
+    """Worker loop: (index, path) in, (index, row) out, until None or EOF."""
+    while True:
+        try:
+            task = conn.recv()
+        except (EOFError, OSError):
+            return
+        if task is None:
+            return
+        idx, path = task
+        try:
+            row = func(path)
+        except Exception:
+            row = failed_row(path, "error")
+        conn.send((idx, row))
+
+
+class _Slot:
+    def __init__(self, ctx: Any, func: Callable[[Path], List[Any]]) -> None:
+        self.conn, child = ctx.Pipe()
+        self.proc = ctx.Process(target=_worker, args=(child, func), daemon=True)
+        self.proc.start()
+        child.close()
+        self.task: Optional[int] = None
+        self.since = 0.0
+
+    def kill(self) -> None:
+        self.proc.kill()
+        self.proc.join()
+        self.conn.close()
+
+
+class AnalysisPool:
+    """Warm worker processes, one pipe each, so a stuck file costs only its own worker."""
+
+    def __init__(self, jobs: int, func: Callable[[Path], List[Any]], timeout: float = 0.0) -> None:
+        self.ctx = multiprocessing.get_context()
+        self.func = func
+        self.timeout = timeout
+        self.slots = [_Slot(self.ctx, func) for _ in range(jobs)]
+
+    def run(self, paths: List[Path]) -> Iterator[Tuple[Path, List[Any]]]:
+        """Yield (path, row) as files finish, dispatching them in the given order."""
+        pending = list(reversed(range(len(paths))))
+        busy = 0
+        while pending or busy:
+            for i, slot in enumerate(self.slots):
+                if slot.task is None and pending:
+                    if not slot.proc.is_alive():  # died while idle
+                        slot.kill()
+                        self.slots[i] = slot = _Slot(self.ctx, self.func)
+                    slot.task = pending.pop()
+                    slot.since = time.monotonic()
+                    slot.conn.send((slot.task, paths[slot.task]))
+                    busy += 1
+            ready = wait([s.conn for s in self.slots if s.task is not None], timeout=0.5)
+            for i, slot in enumerate(self.slots):
+                if slot.task is None:
+                    continue
+                idx = slot.task
+                if slot.conn in ready:
+                    try:
+                        _, row = slot.conn.recv()
+                    except (EOFError, OSError):  # worker died (decoder crash, OOM kill)
+                        row = failed_row(paths[idx], "worker_error")
+                        slot.kill()
+                        self.slots[i] = slot = _Slot(self.ctx, self.func)
+                elif self.timeout > 0 and time.monotonic() - slot.since > self.timeout:
+                    row = failed_row(paths[idx], "timeout")
+                    slot.kill()
+                    self.slots[i] = slot = _Slot(self.ctx, self.func)
+                else:
+                    continue
+                slot.task = None
+                busy -= 1
+                yield paths[idx], row
+
+    def close(self) -> None:
+        for slot in self.slots:
+            try:
+                slot.conn.send(None)
+            except OSError:
+                pass
+        for slot in self.slots:
+            slot.proc.join(timeout=5)
+            if slot.proc.is_alive():
+                slot.proc.kill()
+                slot.proc.join()
+            slot.conn.close()
+
+    def __enter__(self) -> "AnalysisPool":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+
+def in_order(paths: List[Path], results: Iterable[Tuple[Path, List[Any]]]) -> Iterator[List[Any]]:
+    """Rows of (path, row) results in the order of paths, each as soon as all earlier ones are in."""
+    done: Dict[Path, List[Any]] = {}
+    next_out = 0
+    for path, row in results:
+        done[path] = row
+        while next_out < len(paths) and paths[next_out] in done:
+            yield done.pop(paths[next_out])
+            next_out += 1
+
+
+def analyze(
+    base: Path,
+    out_tsv: Path,
+    limit: int,
+    max_duration: float,
+    tempo_min: float,
+    tempo_max: float,
+    cache_mode: str = "keep",
+    order: str = "walk",
+    jobs: int = 1,
+    timeout: float = 0.0,
+) -> None:
+    """Write one TSV row per audio file under base, in walk order.
+
+    With order "inode"/"extent" files are analysed in on-disk order, a batch at
+    a time. With jobs > 1 they are analysed by an AnalysisPool and a file
+    taking longer than timeout seconds (when > 0) is abandoned.
+    """
     files: List[Path] = [p for p in base.rglob("*") if p.suffix.lower() in AUDIO_EXTS and p.is_file()]
     if limit > 0:
         files = files[:limit]
@@ -98,24 +280,13 @@ def analyze(base: Path, out_tsv: Path, limit: int, max_duration: float, tempo_mi
         w.writerow(
             ["path", "bpm", "confidence", "method", "key", "key_confidence", "energy_rms", "beat_count", "first_beat_sec"]
         )
-        for p in files:
-            bpm, conf, method = bpm_from_tags(p)
-            y_sr = None
-            if bpm <= 0:
-                bpm, conf, method, y_sr = bpm_librosa(p, max_duration, tempo_min, tempo_max)
-            key, key_conf, energy, beat_count, first_beat_sec = audio_features(y_sr)
-            row = [
-                str(p),
-                f"{bpm:.2f}" if bpm > 0 else "",
-                f"{conf:.2f}" if conf > 0 else "",
-                method,
-                key,
-                f"{key_conf:.2f}",
-                f"{energy:.4f}",
-                beat_count if beat_count is not None else "",
-                f"{first_beat_sec:.3f}" if first_beat_sec is not None else "",
-            ]
-            w.writerow(row)
+        scheduled = [p for batch in batches(files) for p in physical_order(batch, order)]
+        task = partial(_row_task, settings=(max_duration, tempo_min, tempo_max, cache_mode))
+        if jobs > 1 and len(files) > 1:
+            with AnalysisPool(min(jobs, len(files)), task, timeout) as pool:
+                w.writerows(in_order(files, pool.run(scheduled)))
+        else:
+            w.writerows(in_order(files, ((p, task(p)) for p in scheduled)))
 
 
 def main():
@@ -126,6 +297,22 @@ def main():
     ap.add_argument("--max-duration", type=float, default=120.0, help="Max seconds to analyze per file (default 120s)")
     ap.add_argument("--tempo-min", type=float, default=60.0, help="Minimum acceptable BPM (default 60)")
     ap.add_argument("--tempo-max", type=float, default=200.0, help="Maximum acceptable BPM (default 200)")
+    ap.add_argument(
+        "--cache-mode",
+        choices=CACHE_MODES,
+        default=DEFAULT_CACHE_MODE,
+        help="Page cache: keep, drop (drop each file once analysed; default or DJPT_CACHE_MODE), direct (= drop here)",
+    )
+    ap.add_argument(
+        "--order",
+        choices=ORDERS,
+        default="walk",
+        help="Read order: walk (default), inode or extent (FIEMAP; for HDDs). Rows stay in walk order.",
+    )
+    ap.add_argument("--jobs", type=int, default=1, help="Files analysed in parallel worker processes (default 1)")
+    ap.add_argument(
+        "--timeout", type=float, default=300.0, help="Seconds per file before its worker is killed, with --jobs > 1 (0 = none)"
+    )
     args = ap.parse_args()
     analyze(
         Path(args.base).expanduser().resolve(),
@@ -134,6 +321,10 @@ def main():
         args.max_duration,
         args.tempo_min,
         args.tempo_max,
+        args.cache_mode,
+        args.order,
+        args.jobs,
+        args.timeout,
     )
 
 
@@ -8,6 +8,7 @@ import argparse
 import csv
 import os
 import pathlib
+import sqlite3
 import sys
 from collections import defaultdict
 from typing import List, Dict, Any
@@ -52,6 +53,37 @@ def extract_features(path_str: str, label: int = None) -> Dict[str, Any]:
         "digits": sum(c.isdigit() for c in name),
     }
 
+def store_plan_rows(store: pathlib.Path, plan: pathlib.Path) -> List[Dict[str, Any]]:
+    """Features of a plan imported into hash_store.sqlite (see scripts/hash_store.py).
+
+    Empty unless the store was imported from the plan TSV as it is now (same size and
+    mtime), so an edited TSV or a failed/late store write falls back to the TSV.
+    """
+    if not store.exists():
+        return []
+    try:
+        st = plan.stat()
+    except OSError:
+        return []
+    rows = []
+    conn = sqlite3.connect(str(store))
+    try:
+        fresh = conn.execute(
+            "SELECT 1 FROM plans WHERE name=? AND size=? AND mtime_ns=?",
+            (plan.stem, st.st_size, st.st_mtime_ns),
+        ).fetchone()
+        if not fresh:
+            return []
+        for action, path in conn.execute(
+            "SELECT action, path FROM plan_entries WHERE plan=? ORDER BY seq", (plan.stem,)
+        ):
+            rows.append(extract_features(path, 1 if action.upper() != "KEEP" else 0))
+    except sqlite3.Error as e:
+        print(f"[WARN] hash store: {e}", file=sys.stderr)
+    finally:
+        conn.close()
+    return rows
+
 def train_model(args):
     check_deps()
     plan_hash = pathlib.Path(args.plan_hash) if args.plan_hash else None
@@ -60,8 +92,16 @@ def train_model(args):
     
     rows = []
     
+    store_rows = []
+    if getattr(args, "hash_store", None) and plan_hash:
+        store_rows = store_plan_rows(pathlib.Path(args.hash_store), plan_hash)
+
+    # Priority 0: Hash plan imported into hash_store.sqlite (indexed, no TSV scan)
+    if store_rows:
+        rows = store_rows
+
     # Priority 1: Hash plan (Exact duplicates decisions)
-    if plan_hash and plan_hash.exists() and plan_hash.stat().st_size > 0:
+    elif plan_hash and plan_hash.exists() and plan_hash.stat().st_size > 0:
         with plan_hash.open() as f:
             for line in f:
                 parts = line.rstrip("\n").split("\t")
@@ -208,6 +248,7 @@ def main():
     train_parser.add_argument("--base", required=True, help="Base path for scanning")
     train_parser.add_argument("--plan-hash", help="Path to dupes_plan (hash)")
     train_parser.add_argument("--plan-name", help="Path to dupes_plan (name)")
+    train_parser.add_argument("--hash-store", help="hash_store.sqlite holding the imported hash plan")
     train_parser.add_argument("--features-out", help="Path to save features TSV")
     train_parser.add_argument("--model-out", required=True, help="Path to save model PKL")
     
@@ -21,7 +21,7 @@ import urllib.parse
 import urllib.request
 from collections import defaultdict
 from pathlib import Path
-from typing import Any, Dict, List, Tuple, Optional
+from typing import Any, Dict, Iterable, List, Tuple, Optional
 import importlib
 
 AUDIO_EXTS = {".mp3", ".wav", ".flac", ".m4a", ".aiff", ".aif", ".ogg"}
@@ -140,6 +140,12 @@ except Exception:  # pragma: no cover - optional path
     sf = None
     np = None
 
+try:  # page cache hints shared with scripts/hash_root.py
+    sys.path.append(str(Path(__file__).resolve().parents[1] / "scripts"))
+    from bulk_reader import CACHE_MODES, DEFAULT_CACHE_MODE, advised_paths  # type: ignore
+except Exception:  # pragma: no cover
+    CACHE_MODES, DEFAULT_CACHE_MODE, advised_paths = ("keep",), "keep", None
+
 try:  # optional onnx/tflite
     import onnxruntime as ort  # type: ignore
 except Exception:  # pragma: no cover
@@ -149,6 +155,7 @@ try:
 except Exception:  # pragma: no cover
     tflite = None
 
+_cache_mode = DEFAULT_CACHE_MODE
 _onnx_warned = False
 _tflite_warned = False
 _clip_warned = False
@@ -202,6 +209,13 @@ def list_audio(base: Path, limit: int) -> List[Path]:
     return files
 
 
+def cache_advised(files: List[Path]) -> Iterable[Path]:
+    """Iterate files, dropping each from the page cache once the loop moves on (--cache-mode)."""
+    if advised_paths is None:
+        return iter(files)
+    return advised_paths(files, _cache_mode)
+
+
 def hash_embedding(path: Path, dim: int = 16) -> List[float]:
     h = hashlib.sha256(str(path).encode("utf-8")).digest()
     vals = []
@@ -578,7 +592,7 @@ def write_embeddings(base: Path, out: Path, limit: int, model_choice: str, offli
     tflite_interp = None
     if not use_tf and not offline and model_choice == "musicgen_tflite":
         tflite_interp = load_tflite_interpreter(model_choice)
-    for p in files:
+    for p in cache_advised(files):
         if use_tf and model is not None:
             audio = load_audio_16k(p)
             emb, _ = model_embed_and_tag(model, audio)
@@ -628,7 +642,7 @@ def write_tags(base: Path, out: Path, limit: int, model_choice: str, offline: bo
     tflite_interp = None
     if not use_tf and not offline and model_choice == "musicgen_tflite":
         tflite_interp = load_tflite_interpreter(model_choice)
-    for p in files:
+    for p in cache_advised(files):
         tags: List[str] = []
         method = f"{model_choice}_mock"
         if use_tf and model is not None:
@@ -683,7 +697,7 @@ def write_anomalies(base: Path, out_tsv: Path, limit: int) -> None:
     files = list_audio(base, limit)
     out_tsv.parent.mkdir(parents=True, exist_ok=True)
     rows: List[Dict[str, Any]] = []
-    for p in files:
+    for p in cache_advised(files):
         silence_ratio = 0.0
         clipping = 0.0
         clicks = 0.0
@@ -755,7 +769,7 @@ def write_segments(base: Path, out_tsv: Path, limit: int) -> None:
     except Exception:
         have_librosa = False
 
-    for p in files:
+    for p in cache_advised(files):
         onsets: List[float] = []
         beats: List[float] = []
         tempo_val: float = 0.0
@@ -824,7 +838,7 @@ def write_garbage(base: Path, out_tsv: Path, limit: int) -> None:
     files = list_audio(base, limit)
     out_tsv.parent.mkdir(parents=True, exist_ok=True)
     rows: List[Tuple[str, float, str, float, float]] = []
-    for p in files:
+    for p in cache_advised(files):
         score = 0.0
         flags = []
         try:
@@ -885,7 +899,7 @@ def write_loudness(base: Path, out_tsv: Path, limit: int, target_lufs: float = -
     out_tsv.parent.mkdir(parents=True, exist_ok=True)
     rows: List[Tuple[str, float, float, float, float, float, str, str]] = []
     tol = float(os.environ.get("DJPT_GAIN_TOL", "1.5"))
-    for p in files:
+    for p in cache_advised(files):
         lufs = 0.0
         crest = 0.0
         dyn_range = 0.0
@@ -948,7 +962,7 @@ def write_mastering(base: Path, out_tsv: Path, limit: int, target_lufs: float =
     files = list_audio(base, limit)
     out_tsv.parent.mkdir(parents=True, exist_ok=True)
     rows: List[Tuple[str, float, float, float, float, str]] = []
-    for p in files:
+    for p in cache_advised(files):
         lufs = -120.0
         peak_db = -120.0
         crest = 0.0
@@ -1179,7 +1193,7 @@ def write_music_tags(base: Path, out_tsv: Path, limit: int) -> None:
     with out_tsv.open("w", newline="", encoding="utf-8") as f:
         w = csv.writer(f, delimiter="\t")
         w.writerow(["path", "tags_json", "method"])
-        for p in files:
+        for p in cache_advised(files):
             tags = heuristic_tags(p)
             method = "heuristic_multi"
             if clap_sess and clap_input:
@@ -1423,6 +1437,12 @@ def main():
     ap = argparse.ArgumentParser()
     common_offline = argparse.ArgumentParser(add_help=False)
     common_offline.add_argument("--offline", action="store_true", help="Forzar modo offline/heurístico (equivale a DJPT_OFFLINE=1).")
+    common_offline.add_argument(
+        "--cache-mode",
+        choices=CACHE_MODES,
+        default=DEFAULT_CACHE_MODE,
+        help="Page cache: keep, drop (soltar cada audio tras leerlo; default o DJPT_CACHE_MODE), direct (= drop aquí).",
+    )
     sub = ap.add_subparsers(dest="mode", required=True)
 
     p_emb = sub.add_parser("embeddings", parents=[common_offline])
@@ -1505,6 +1525,8 @@ def main():
     )
 
     args = ap.parse_args()
+    global _cache_mode
+    _cache_mode = args.cache_mode
     offline = getattr(args, "offline", False) or is_offline_env()
     if getattr(args, "offline", False):
         os.environ["DJPT_OFFLINE"] = "1"
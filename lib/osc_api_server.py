@@ -8,6 +8,7 @@ Requires: python3; optional python-osc for OSC listener.
 import argparse
 import json
 import os
+import sqlite3
 import threading
 import time
 import urllib.parse
@@ -34,8 +35,36 @@ def tail_file(path: Path, limit: int = 50) -> List[str]:
         return []
 
 
+def store_plan_entries(store: Path, plan: Path) -> Optional[int]:
+    """Rows of plan as imported into hash_store.sqlite (indexed count).
+
+    None when the store is missing or was not imported from the plan TSV as it is now
+    (size/mtime recorded at import differ), so callers read the TSV instead.
+    """
+    if not store.exists():
+        return None
+    try:
+        st = plan.stat()
+        conn = sqlite3.connect(f"file:{store}?mode=ro", uri=True)
+        try:
+            fresh = conn.execute(
+                "SELECT 1 FROM plans WHERE name=? AND size=? AND mtime_ns=?",
+                (plan.stem, st.st_size, st.st_mtime_ns),
+            ).fetchone()
+            row = conn.execute("SELECT COUNT(*) FROM plan_entries WHERE plan=?", (plan.stem,)).fetchone()
+        finally:
+            conn.close()
+    except (OSError, sqlite3.Error):
+        return None
+    return row[0] if fresh and row else None
+
+
 def dupes_summary(state_dir: Path) -> Dict[str, Any]:
     plan = state_dir / "plans" / "dupes_plan.tsv"
+    entries = store_plan_entries(state_dir / "hash_store.sqlite", plan)
+    if entries is not None:
+        # Same count as the TSV read below, which treats the first row as a header
+        return {"path": str(plan), "entries": max(entries - 1, 0)}
     if not plan.exists():
         return {"path": None, "entries": 0}
     try:
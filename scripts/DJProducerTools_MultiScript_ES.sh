@@ -471,6 +471,9 @@ SHARED_CORPUS_DIR=""
 SAFETY_PROMPTED=0
 VENV_ACTIVE=0
 PYTHON_BIN="python3"
+TOOLS_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+HASH_CACHE_DB=""
+HASH_STORE_DB=""
 ML_ENV_DISABLED=0
 ML_PKGS_BASIC="numpy pandas"
 ML_PKG_BASIC_MB=300
@@ -479,6 +482,12 @@ ML_PKG_EVO_MB=450
 ML_PKGS_TF="tensorflow"
 ML_PKG_TF_MB=600
 PROFILES_DIR=""
+DJPT_HASH_ALGO="${DJPT_HASH_ALGO:-sha256}"
+DJPT_HASH_WORKERS="${DJPT_HASH_WORKERS:-4}"
+DJPT_FLAC_MD5="${DJPT_FLAC_MD5:-0}"
+# Orden de lectura para hash/scrub/BPM: walk, inode o extent (FIEMAP; menos saltos en HDD).
+DJPT_READ_ORDER="${DJPT_READ_ORDER:-walk}"
+HASH_ALGO="sha256"
 
 pause_enter() {
   printf "%sPulsa ENTER para continuar...%s" "$C_YLW" "$C_RESET"
@@ -587,6 +596,8 @@ init_paths() {
   ML_MODEL_PATH="$STATE_DIR/ml_model.pkl"
   ML_FEATURES_FILE="$STATE_DIR/ml_features.tsv"
   ML_PRED_REPORT="$REPORTS_DIR/ml_predictions.tsv"
+  HASH_CACHE_DB="$STATE_DIR/hash_cache.sqlite"
+  HASH_STORE_DB="$STATE_DIR/hash_store.sqlite"
   ensure_dirs
   mkdir -p "$PROFILES_DIR"
   touch "$BASE_HISTORY_FILE" "$GENERAL_HISTORY_FILE" "$AUDIO_HISTORY_FILE"
@@ -619,6 +630,10 @@ save_conf() {
     printf 'DRYRUN_FORCE=%q\n' "$DRYRUN_FORCE"
     printf 'ML_ENV_DISABLED=%q\n' "$ML_ENV_DISABLED"
     printf 'SHARED_CORPUS_DIR=%q\n' "$SHARED_CORPUS_DIR"
+    printf 'DJPT_HASH_ALGO=%q\n' "$DJPT_HASH_ALGO"
+    printf 'DJPT_HASH_WORKERS=%q\n' "$DJPT_HASH_WORKERS"
+    printf 'DJPT_FLAC_MD5=%q\n' "$DJPT_FLAC_MD5"
+    printf 'DJPT_READ_ORDER=%q\n' "$DJPT_READ_ORDER"
   } >"$CONF_FILE"
 }
 
@@ -967,6 +982,8 @@ print_menu() {
   printf "  %s67)%s Auto-cues por onsets (librosa)\n" "$C_GRN" "$C_RESET"
   printf "  %s68)%s Instalar deps Python en venv (pyserial, python-osc, librosa, soundfile)\n" "$C_GRN" "$C_RESET"
   printf "  %s69)%s Sincronizar corpus compartido (hashes/ML entre discos)\n" "$C_GRN" "$C_RESET"
+  printf "  %s70)%s Scrub de integridad en segundo plano (limitado, reanudable)\n" "$C_GRN" "$C_RESET"
+  printf "  %s71)%s Control de ingesta: ¿descargas nuevas ya en la biblioteca?\n" "$C_GRN" "$C_RESET"
 
   printf "\n"
   printf "%sL)%s Librerías DJ & Cues (submenú)\n" "$C_GRN" "$C_RESET"
@@ -1168,6 +1185,35 @@ action_8_backup_dj() {
   pause_enter
 }
 
+resolve_hash_algo() {
+  # DJPT_HASH_ALGO=sha256|blake2b|xxh3_128; cualquier valor distinto de sha256 requiere python3.
+  HASH_ALGO="${DJPT_HASH_ALGO:-sha256}"
+  if [ "$HASH_ALGO" != "sha256" ] && ! { ensure_python_bin >/dev/null 2>&1 && [ -f "$TOOLS_DIR/hash_cache.py" ]; }; then
+    printf "%s[WARN]%s DJPT_HASH_ALGO=%s requiere python3; se usa sha256.\n" "$C_YLW" "$C_RESET" "$HASH_ALGO"
+    HASH_ALGO="sha256"
+  fi
+}
+
+store_import() {
+  # Copia un índice de hashes / plan TSV en hash_store.sqlite (consultas indexadas; sin bloquear).
+  # Args: subcomando de hash_store.py, TSV, opciones extra.
+  if ensure_python_bin >/dev/null 2>&1 && [ -f "$TOOLS_DIR/hash_store.py" ] && [ -f "$2" ]; then
+    "$PYTHON_BIN" "$TOOLS_DIR/hash_store.py" --db "$HASH_STORE_DB" "$@" >/dev/null 2>&1 || true
+  fi
+}
+
+hash_file_list() {
+  # stdin: una ruta por línea; stdout: hash<TAB>ruta (algoritmo: HASH_ALGO).
+  # Con python3 la caché por stat (hash_cache.sqlite) evita rehashear archivos sin cambios.
+  if ensure_python_bin >/dev/null 2>&1 && [ -f "$TOOLS_DIR/hash_cache.py" ]; then
+    "$PYTHON_BIN" "$TOOLS_DIR/hash_cache.py" digest --cache "$HASH_CACHE_DB" --algo "$HASH_ALGO" 2>/dev/null
+  else
+    while IFS= read -r f; do
+      printf "%s\t%s\n" "$(shasum -a 256 "$f" 2>/dev/null | awk '{print $1}')" "$f"
+    done
+  fi
+}
+
 action_9_hash_index() {
   out="$REPORTS_DIR/hash_index.tsv"
   if [ -s "$out" ]; then
@@ -1183,7 +1229,8 @@ action_9_hash_index() {
 
   confirm_heavy "Hash index completo (SHA-256)" || return
   print_header
-  printf "%s[INFO]%s Generando índice SHA-256 -> %s\n" "$C_CYN" "$C_RESET" "$out"
+  resolve_hash_algo
+  printf "%s[INFO]%s Generando índice %s -> %s\n" "$C_CYN" "$C_RESET" "$HASH_ALGO" "$out"
   total=$(find "$BASE_PATH" -type f 2>/dev/null | wc -l | tr -d ' ')
   if [ "$total" -eq 0 ]; then
     >"$out"
@@ -1191,17 +1238,43 @@ action_9_hash_index() {
     pause_enter
     return
   fi
+  # Python: un solo proceso, hash en paralelo y reemplazo atómico de hash_index.tsv.
+  if ensure_python_bin >/dev/null 2>&1 && [ -f "$TOOLS_DIR/hash_index.py" ]; then
+    # DJPT_FLAC_MD5=1: los .flac se identifican por el MD5 de audio de STREAMINFO (se leen 42 bytes).
+    flac_opt=()
+    [ "${DJPT_FLAC_MD5:-0}" = "1" ] && flac_opt=(--flac-md5)
+    "$PYTHON_BIN" "$TOOLS_DIR/hash_index.py" --root "$BASE_PATH" --out "$out" --algo "$HASH_ALGO" "${flac_opt[@]}" \
+      --workers "$DJPT_HASH_WORKERS" --cache "$HASH_CACHE_DB" --order "$DJPT_READ_ORDER" --progress 2>/dev/null |
+      while IFS=$'\t' read -r _ percent rel; do
+        status_line "HASH" "$percent" "$rel"
+      done
+    rc=${PIPESTATUS[0]}
+    finish_status_line
+    if [ "$rc" -ne 0 ]; then
+      printf "%s[ERR]%s Falló hash_index.py; se conserva el %s anterior.\n" "$C_RED" "$C_RESET" "$out"
+      pause_enter
+      return
+    fi
+    store_import import-index "$out" --root "$BASE_PATH"
+    # Sketch Bloom del índice (~1.8 MB por millón de archivos): comparar otros discos sin copiar el TSV.
+    if [ -f "$TOOLS_DIR/index_sketch.py" ]; then
+      "$PYTHON_BIN" "$TOOLS_DIR/index_sketch.py" export --index "$out" --out "$REPORTS_DIR/hash_index.djsk" || true
+    fi
+    printf "%s[OK]%s Generado %s\n" "$C_GRN" "$C_RESET" "$out"
+    pause_enter
+    return
+  fi
   count=0
-  >"$out"
-  find "$BASE_PATH" -type f 2>/dev/null | while IFS= read -r f; do
+  printf "# djpt-hash-index v1 algo=%s\n" "$HASH_ALGO" >"$out"
+  find "$BASE_PATH" -type f 2>/dev/null | hash_file_list | while IFS=$'\t' read -r h f; do
     count=$((count + 1))
     percent=$((count * 100 / total))
     rel="${f#$BASE_PATH/}"
     status_line "HASH" "$percent" "$rel"
-    h=$(shasum -a 256 "$f" 2>/dev/null | awk '{print $1}')
     printf "%s\t%s\t%s\n" "$h" "$rel" "$f" >>"$out"
   done
   finish_status_line
+  store_import import-index "$out" --root "$BASE_PATH"
   printf "%s[OK]%s Generado %s\n" "$C_GRN" "$C_RESET" "$out"
   pause_enter
 }
@@ -1209,48 +1282,86 @@ action_9_hash_index() {
 action_10_dupes_plan() {
   print_header
   hash_file="$REPORTS_DIR/hash_index.tsv"
-  if [ ! -f "$hash_file" ]; then
-    printf "%s[WARN]%s No hay hash_index.tsv, generando primero.\n" "$C_YLW" "$C_RESET"
-    action_9_hash_index
+  cascade=0
+  dupes_mode="EXACT"
+  if ensure_python_bin >/dev/null 2>&1 && [ -f "$TOOLS_DIR/build_dupe_plan.py" ]; then
+      printf "Modo de duplicados: 1) EXACT (bytes)  2) AUDIO_PAYLOAD (solo audio, ignora tags ID3/FLAC/MP4) [1]: "
+    read -r mode_choice
+    [ "$mode_choice" = "2" ] && dupes_mode="AUDIO_PAYLOAD"
+  fi
+  if [ "$dupes_mode" = "EXACT" ] && [ ! -f "$hash_file" ]; then
+    if ensure_python_bin >/dev/null 2>&1 && [ -f "$TOOLS_DIR/build_dupe_plan.py" ]; then
+      printf "No hay hash_index.tsv. ¿Usar cascada rápida (tamaño -> 64KiB inicio/fin -> hash completo solo si coinciden)? [Y/n]: "
+      read -r use_cascade
+      if [ -z "$use_cascade" ] || [[ "$use_cascade" =~ ^[Yy]$ ]]; then
+        cascade=1
+      fi
+    fi
+    if [ "$cascade" -eq 0 ]; then
+      printf "%s[WARN]%s No hay hash_index.tsv, generando primero.\n" "$C_YLW" "$C_RESET"
+      action_9_hash_index
+    fi
   fi
   hash_file="$REPORTS_DIR/hash_index.tsv"
-  if [ ! -f "$hash_file" ]; then
+  if [ "$dupes_mode" = "EXACT" ] && [ "$cascade" -eq 0 ] && [ ! -f "$hash_file" ]; then
     printf "%s[ERR]%s No se pudo generar hash_index.tsv.\n" "$C_RED" "$C_RESET"
     pause_enter
     return
   fi
   plan_tsv="$PLANS_DIR/dupes_plan.tsv"
   plan_json="$PLANS_DIR/dupes_plan.json"
-  printf "%s[INFO]%s Generando plan de duplicados EXACTO.\n" "$C_CYN" "$C_RESET"
-  awk '
-  {
-    h=$1
-    rel=$2
-    full=$3
-    key=h
-    count[key]++
-    path[key, count[key]] = full
-  }
-  END {
-    for (k in count) {
-      if (count[k] > 1) {
-        keep_done=0
-        for (i=1; i<=count[k]; i++) {
-          f = path[k,i]
-          if (keep_done==0) {
-            action="KEEP"
-            keep_done=1
-          } else {
-            action="QUARANTINE"
+  printf "%s[INFO]%s Generando plan de duplicados %s.\n" "$C_CYN" "$C_RESET" "$dupes_mode"
+  if [ "$dupes_mode" = "AUDIO_PAYLOAD" ]; then
+    printf "%s[INFO]%s Hash solo del audio (empareja copias con tags reescritos).\n" "$C_CYN" "$C_RESET"
+    "$PYTHON_BIN" "$TOOLS_DIR/build_dupe_plan.py" --audio-payload --root "$BASE_PATH" --workers "$DJPT_HASH_WORKERS" \
+      --plan "$plan_tsv" --report "$REPORTS_DIR/dupes_audio_payload_report.txt" --cache "$HASH_CACHE_DB" || {
+      printf "%s[ERR]%s Falló el plan por audio (revisa scripts/build_dupe_plan.py).\n" "$C_RED" "$C_RESET"
+      pause_enter
+      return
+    }
+  elif [ "$cascade" -eq 1 ]; then
+    printf "%s[INFO]%s Escaneo en cascada (solo lee archivos que pueden ser duplicados).\n" "$C_CYN" "$C_RESET"
+    flac_opt=()
+    [ "${DJPT_FLAC_MD5:-0}" = "1" ] && flac_opt=(--flac-md5)
+    "$PYTHON_BIN" "$TOOLS_DIR/build_dupe_plan.py" --cascade --root "$BASE_PATH" "${flac_opt[@]}" \
+      --plan "$plan_tsv" --report "$REPORTS_DIR/dupes_cascade_report.txt" --cache "$HASH_CACHE_DB" || {
+      printf "%s[ERR]%s Falló la cascada de duplicados (revisa scripts/build_dupe_plan.py).\n" "$C_RED" "$C_RESET"
+      pause_enter
+      return
+    }
+  else
+    awk '
+    {
+      h=$1
+      rel=$2
+      full=$3
+      key=h
+      count[key]++
+      path[key, count[key]] = full
+    }
+    END {
+      for (k in count) {
+        if (count[k] > 1) {
+          keep_done=0
+          for (i=1; i<=count[k]; i++) {
+            f = path[k,i]
+            if (keep_done==0) {
+              action="KEEP"
+              keep_done=1
+            } else {
+              action="QUARANTINE"
+            }
+            printf "%s\t%s\t%s\n", k, action, f
           }
-          printf "%s\t%s\t%s\n", k, action, f
         }
       }
-    }
-  }' "$hash_file" >"$plan_tsv"
+    }' "$hash_file" >"$plan_tsv"
+  fi
+  store_import import-plan "$plan_tsv"
   {
     echo "{"
     echo "  \"type\": \"dupes_plan\","
+    echo "  \"mode\": \"$dupes_mode\","
     echo "  \"entries\": ["
     first=1
     while IFS=$'\t' read -r h action f; do
@@ -1296,6 +1407,28 @@ action_11_quarantine_from_plan() {
     y|Y) ;;
     *) printf "%s[INFO]%s Cancelado.\n" "$C_CYN" "$C_RESET"; pause_enter; return ;;
   esac
+  if ensure_python_bin >/dev/null 2>&1 && [ -f "$TOOLS_DIR/quarantine_executor.py" ]; then
+    # Python: ejecutor con journal (rename en el mismo filesystem, copia verificada entre discos; relanzar reanuda).
+    qx_dry=""
+    if [ "$SAFE_MODE" -eq 1 ] || [ "$DJ_SAFE_LOCK" -eq 1 ]; then
+      qx_dry="--dry-run"
+    fi
+    printf "Modo: 1) mover a quarantine  2) enlazar en sitio (reflink/hardlink, mismo filesystem) [1]: "
+    read -r qx_mode
+    if [ "$qx_mode" = "2" ]; then
+      # Las copias en el mismo filesystem pasan a ser reflinks/hardlinks del KEEP; el resto queda para el modo 1.
+      "$PYTHON_BIN" "$TOOLS_DIR/quarantine_executor.py" --quarantine-dir "$QUAR_DIR" \
+        $qx_dry link --plan "$plan_tsv" || \
+        printf "%s[WARN]%s El enlazado reportó errores (ver %s).\n" "$C_YLW" "$C_RESET" "$QUAR_DIR/link_journal.tsv"
+      pause_enter
+      return
+    fi
+    "$PYTHON_BIN" "$TOOLS_DIR/quarantine_executor.py" --quarantine-dir "$QUAR_DIR" --workers "$DJPT_HASH_WORKERS" \
+      $qx_dry apply --plan "$plan_tsv" || \
+      printf "%s[WARN]%s El ejecutor de quarantine reportó errores (ver %s).\n" "$C_YLW" "$C_RESET" "$QUAR_DIR/quarantine_journal.tsv"
+    pause_enter
+    return
+  fi
   while IFS=$'\t' read -r h action f; do
     if [ "$action" != "QUARANTINE" ]; then
       continue
@@ -1324,6 +1457,7 @@ action_12_quarantine_manager() {
     printf "%s1)%s Listar archivos en quarantine\n" "$C_YLW" "$C_RESET"
     printf "%s2)%s Restaurar todo (si SAFE_MODE=0 y DJ_SAFE_LOCK=0)\n" "$C_YLW" "$C_RESET"
     printf "%s3)%s Borrar definitivamente todo (si SAFE_MODE=0 y DJ_SAFE_LOCK=0)\n" "$C_YLW" "$C_RESET"
+    printf "%s4)%s Deshacer enlaces en sitio (volver a copias independientes)\n" "$C_YLW" "$C_RESET"
     printf "%sB)%s Volver\n" "$C_YLW" "$C_RESET"
     printf "%sOpción:%s " "$C_BLU" "$C_RESET"
     read -r qop
@@ -1343,7 +1477,11 @@ action_12_quarantine_manager() {
           printf "Confirmar (YES para continuar): "
           read -r ans
           if [ "$ans" = "YES" ]; then
-            find "$QUAR_DIR" -type f 2>/dev/null | while IFS= read -r f; do
+            # Lo movido con journal vuelve a su ruta original; el resto va a _RESTORED_FROM_QUARANTINE.
+            if [ -f "$QUAR_DIR/quarantine_journal.tsv" ] && ensure_python_bin >/dev/null 2>&1 && [ -f "$TOOLS_DIR/quarantine_executor.py" ]; then
+              "$PYTHON_BIN" "$TOOLS_DIR/quarantine_executor.py" --quarantine-dir "$QUAR_DIR" --workers "$DJPT_HASH_WORKERS" restore || true
+            fi
+            find "$QUAR_DIR" -type f ! -name quarantine_journal.tsv ! -name link_journal.tsv 2>/dev/null | while IFS= read -r f; do
               rel="${f#$QUAR_DIR/}"
               dest="$BASE_PATH/_RESTORED_FROM_QUARANTINE/$rel"
               mkdir -p "$(dirname "$dest")"
@@ -1364,12 +1502,36 @@ action_12_quarantine_manager() {
           printf "Confirmar (YES para continuar): "
           read -r ans2
           if [ "$ans2" = "YES" ]; then
-            rm -rf "$QUAR_DIR"/*
+            # link_journal.tsv describe archivos fuera de quarantine (enlaces en sitio); se conserva para la opción 4.
+            find "$QUAR_DIR" -mindepth 1 -maxdepth 1 ! -name link_journal.tsv -exec rm -rf {} + 2>/dev/null || true
             printf "%s[OK]%s Quarantine vaciado.\n" "$C_GRN" "$C_RESET"
             pause_enter
           fi
         fi
         ;;
+      4)
+        ensure_safety_guard
+        if [ ! -f "$QUAR_DIR/link_journal.tsv" ] || ! ensure_python_bin >/dev/null 2>&1; then
+          printf "%s[WARN]%s No hay journal de enlaces (%s).\n" "$C_YLW" "$C_RESET" "$QUAR_DIR/link_journal.tsv"
+        else
+          qx_dry=""
+          if [ "$SAFE_MODE" -eq 1 ] || [ "$DJ_SAFE_LOCK" -eq 1 ]; then
+            qx_dry="--dry-run"
+          fi
+          ans4="YES"
+          if [ -z "$qx_dry" ]; then
+            # Cada reflink/hardlink vuelve a ser una copia completa: puede recuperar todo el espacio que ahorró el dedupe.
+            printf "%s[WARN]%s Deshacer enlaces: cada archivo enlazado vuelve a ser una copia completa (usa espacio en disco).\n" "$C_YLW" "$C_RESET"
+            printf "Confirmar (YES para continuar): "
+            read -r ans4
+          fi
+          if [ "$ans4" = "YES" ]; then
+            "$PYTHON_BIN" "$TOOLS_DIR/quarantine_executor.py" --quarantine-dir "$QUAR_DIR" $qx_dry unlink || \
+              printf "%s[WARN]%s Deshacer enlaces reportó errores.\n" "$C_YLW" "$C_RESET"
+          fi
+        fi
+        pause_enter
+        ;;
       B|b)
         break ;;
       *)
@@ -1744,7 +1906,7 @@ action_compare_hash_indexes() {
   printf "Hash index A (ENTER usa reports/hash_index.tsv): "
   read -e -r file_a
   [ -z "$file_a" ] && file_a="$REPORTS_DIR/hash_index.tsv"
-  printf "Hash index B (drag & drop): "
+  printf "Hash index B (drag & drop; también vale un sketch .djsk del otro disco): "
   read -e -r file_b
   if [ ! -f "$file_a" ] || [ ! -f "$file_b" ]; then
     printf "%s[ERR]%s Archivo(s) inválidos.\n" "$C_RED" "$C_RESET"
@@ -1753,13 +1915,54 @@ action_compare_hash_indexes() {
   fi
   out_missing="$REPORTS_DIR/hash_compare_missing_$(date +%s).tsv"
   out_extra="$REPORTS_DIR/hash_compare_extra_$(date +%s).tsv"
-  awk '{print $1"\t"$3}' "$file_a" | sort >"$STATE_DIR/hash_a.tmp"
-  awk '{print $1"\t"$3}' "$file_b" | sort >"$STATE_DIR/hash_b.tmp"
-  comm -23 "$STATE_DIR/hash_a.tmp" "$STATE_DIR/hash_b.tmp" >"$out_extra"
-  comm -13 "$STATE_DIR/hash_a.tmp" "$STATE_DIR/hash_b.tmp" >"$out_missing"
+  case "$file_b" in
+    *.djsk)
+      # B es un sketch (index_sketch.py export): solo se calcula "en A, no en B", sin el TSV de B.
+      if ! ensure_python_bin >/dev/null 2>&1 || [ ! -f "$TOOLS_DIR/index_sketch.py" ] ||
+        ! "$PYTHON_BIN" "$TOOLS_DIR/index_sketch.py" check --sketch "$file_b" --index "$file_a" --out "$out_extra"; then
+        printf "%s[ERR]%s Falló la comprobación del sketch (revisa scripts/index_sketch.py).\n" "$C_RED" "$C_RESET"
+        pause_enter
+        return
+      fi
+      printf "%s[OK]%s Sketch: solo se listan entradas de A que faltan en B (verifica en el otro disco con index_sketch.py verify).\n" "$C_GRN" "$C_RESET"
+      printf "  Extra en A vs B: %s\n" "$out_extra"
+      pause_enter
+      return
+      ;;
+  esac
+  if ensure_python_bin >/dev/null 2>&1 && [ -f "$TOOLS_DIR/hash_compare.py" ]; then
+    # Python: ordenación externa de ambos índices + un solo merge-join (comparación por contenido/hash).
+    "$PYTHON_BIN" "$TOOLS_DIR/hash_compare.py" --a "$file_a" --b "$file_b" --by hash --parallel \
+      --missing-in-b "$out_extra" --missing-in-a "$out_missing" --tmp-dir "$STATE_DIR" || {
+      printf "%s[ERR]%s Falló la comparación de hashes (revisa scripts/hash_compare.py).\n" "$C_RED" "$C_RESET"
+      pause_enter
+      return
+    }
+  else
+    awk '{print $1"\t"$3}' "$file_a" | sort >"$STATE_DIR/hash_a.tmp"
+    awk '{print $1"\t"$3}' "$file_b" | sort >"$STATE_DIR/hash_b.tmp"
+    comm -23 "$STATE_DIR/hash_a.tmp" "$STATE_DIR/hash_b.tmp" >"$out_extra"
+    comm -13 "$STATE_DIR/hash_a.tmp" "$STATE_DIR/hash_b.tmp" >"$out_missing"
+  fi
   printf "%s[OK]%s Diferencias generadas:\n" "$C_GRN" "$C_RESET"
   printf "  Extra en A vs B: %s\n" "$out_extra"
   printf "  Faltante en A vs B: %s\n" "$out_missing"
+  if ensure_python_bin >/dev/null 2>&1 && [ -f "$TOOLS_DIR/mirror_sync.py" ]; then
+    printf "¿Sincronizar B desde A ahora (copiar solo lo que falta/cambió por ruta)? (y/N): "
+    read -r sync_ans
+    case "$sync_ans" in
+      y|Y)
+        # Copia lo que B no tiene de A (por ruta relativa) con copias paralelas verificadas y lo añade a B; relanzar reanuda.
+        sync_dry=""
+        if [ "$SAFE_MODE" -eq 1 ] || [ "$DJ_SAFE_LOCK" -eq 1 ] || [ "$DRYRUN_FORCE" -eq 1 ]; then
+          sync_dry="--dry-run"
+        fi
+        "$PYTHON_BIN" "$TOOLS_DIR/mirror_sync.py" --a "$file_a" --b "$file_b" --workers "$DJPT_HASH_WORKERS" \
+          --tmp-dir "$STATE_DIR" $sync_dry || \
+          printf "%s[WARN]%s El mirror sync reportó errores (relanza para reintentar lo que falta).\n" "$C_YLW" "$C_RESET"
+        ;;
+    esac
+  fi
   pause_enter
 }
 
@@ -1779,11 +1982,26 @@ action_mirror_integrity_check() {
   missing_in_b="$REPORTS_DIR/mirror_missing_in_B_$(date +%s).tsv"
   missing_in_a="$REPORTS_DIR/mirror_missing_in_A_$(date +%s).tsv"
   mismatch="$REPORTS_DIR/mirror_hash_mismatch_$(date +%s).tsv"
-  awk -F'\t' '{map[$2]=$1} END {for (p in map) print p"\t"map[p]}' "$file_a" | sort >"$STATE_DIR/mirror_a.tmp"
-  awk -F'\t' '{map[$2]=$1} END {for (p in map) print p"\t"map[p]}' "$file_b" | sort >"$STATE_DIR/mirror_b.tmp"
-  join -v1 -t$'\t' "$STATE_DIR/mirror_a.tmp" "$STATE_DIR/mirror_b.tmp" >"$missing_in_b"
-  join -v2 -t$'\t' "$STATE_DIR/mirror_a.tmp" "$STATE_DIR/mirror_b.tmp" >"$missing_in_a"
-  join -t$'\t' "$STATE_DIR/mirror_a.tmp" "$STATE_DIR/mirror_b.tmp" | awk -F'\t' '{if ($2!=$3) print $1"\tA:"$2"\tB:"$3}' >"$mismatch"
+  merkle_ok=0
+  if ensure_python_bin >/dev/null 2>&1 && [ -f "$TOOLS_DIR/merkle_index.py" ]; then
+    # Diff Merkle: solo se visitan carpetas con digest distinto. Los .merkle se guardan en
+    # $STATE_DIR/merkle (los índices pueden estar en discos de solo lectura) y se rehacen si el índice cambia.
+    # Una carpeta que falta se lista archivo por archivo, como el fallback awk (--collapse-folders: una vez como "rel/").
+    mkdir -p "$STATE_DIR/merkle"
+    if "$PYTHON_BIN" "$TOOLS_DIR/merkle_index.py" diff --a "$file_a" --b "$file_b" --sidecar-dir "$STATE_DIR/merkle" \
+      --missing-in-b "$missing_in_b" --missing-in-a "$missing_in_a" --mismatch "$mismatch"; then
+      merkle_ok=1
+    else
+      printf "%s[WARN]%s Falló el diff Merkle; se usa la comparación simple.\n" "$C_YLW" "$C_RESET"
+    fi
+  fi
+  if [ "$merkle_ok" -eq 0 ]; then
+    awk -F'\t' '{map[$2]=$1} END {for (p in map) print p"\t"map[p]}' "$file_a" | sort >"$STATE_DIR/mirror_a.tmp"
+    awk -F'\t' '{map[$2]=$1} END {for (p in map) print p"\t"map[p]}' "$file_b" | sort >"$STATE_DIR/mirror_b.tmp"
+    join -v1 -t$'\t' "$STATE_DIR/mirror_a.tmp" "$STATE_DIR/mirror_b.tmp" >"$missing_in_b"
+    join -v2 -t$'\t' "$STATE_DIR/mirror_a.tmp" "$STATE_DIR/mirror_b.tmp" >"$missing_in_a"
+    join -t$'\t' "$STATE_DIR/mirror_a.tmp" "$STATE_DIR/mirror_b.tmp" | awk -F'\t' '{if ($2!=$3) print $1"\tA:"$2"\tB:"$3}' >"$mismatch"
+  fi
   printf "%s[OK]%s Mirror check generado:\n" "$C_GRN" "$C_RESET"
   printf "  Falta en B: %s\n" "$missing_in_b"
   printf "  Falta en A: %s\n" "$missing_in_a"
@@ -1891,6 +2109,74 @@ action_69_shared_corpus() {
   pause_enter
 }
 
+action_70_scrub() {
+  # Re-verificación con ritmo limitado contra los índices; las marcas de verificación persisten en scrub_state.sqlite.
+  print_header
+  printf "%s[INFO]%s Scrub de integridad en segundo plano: re-verifica archivos indexados contra su hash, con ritmo limitado para no saturar el disco.\n" "$C_CYN" "$C_RESET"
+  if ! ensure_python_bin >/dev/null 2>&1 || [ ! -f "$TOOLS_DIR/scrub.py" ]; then
+    printf "%s[ERR]%s Python / scrub.py no disponible.\n" "$C_RED" "$C_RESET"
+    pause_enter
+    return
+  fi
+  scrub_idx=()
+  for f in "$REPORTS_DIR/hash_index.tsv" "$STATE_DIR/external_hashes.tsv"; do
+    [ -s "$f" ] && scrub_idx+=(--index "$f")
+  done
+  if [ "${#scrub_idx[@]}" -eq 0 ]; then
+    printf "%s[WARN]%s No hay hash_index.tsv / external_hashes.tsv (ejecuta antes la opción 9).\n" "$C_YLW" "$C_RESET"
+    pause_enter
+    return
+  fi
+  printf "Presupuesto de lectura MB/s (ENTER=20): "
+  read -r scrub_mb
+  printf "Minutos para esta ejecución (ENTER=30, 0=hasta terminar): "
+  read -r scrub_min
+  scrub_report="$REPORTS_DIR/scrub_hash_mismatch_$(date +%s).tsv"
+  "$PYTHON_BIN" "$TOOLS_DIR/scrub.py" --db "$STATE_DIR/scrub_state.sqlite" run "${scrub_idx[@]}" \
+    --mb-per-s "${scrub_mb:-20}" --max-minutes "${scrub_min:-30}" --order "$DJPT_READ_ORDER" --report "$scrub_report" \
+    --cache "$HASH_CACHE_DB"
+  rc=$?
+  if [ "$rc" -eq 2 ]; then
+    printf "%s[WARN]%s Corrupción detectada: %s\n" "$C_YLW" "$C_RESET" "$scrub_report"
+  else
+    [ -s "$scrub_report" ] || rm -f "$scrub_report"
+    printf "%s[OK]%s Scrub terminado (relanza para continuar; primero van los verificados hace más tiempo).\n" "$C_GRN" "$C_RESET"
+  fi
+  pause_enter
+}
+
+action_71_ingest_gate() {
+  # Solo se hashean los archivos entrantes y se buscan en el índice binario de la biblioteca (hash_index.djdx).
+  print_header
+  printf "%s[INFO]%s Control de ingesta: qué archivos entrantes ya están en la biblioteca (NEW / DUPLICATE / SUSPECT_NEAR_DUPLICATE).\n" "$C_CYN" "$C_RESET"
+  if ! ensure_python_bin >/dev/null 2>&1 || [ ! -f "$TOOLS_DIR/ingest.py" ]; then
+    printf "%s[ERR]%s Python / ingest.py no disponible.\n" "$C_RED" "$C_RESET"
+    pause_enter
+    return
+  fi
+  if [ ! -s "$REPORTS_DIR/hash_index.tsv" ]; then
+    printf "%s[WARN]%s No existe reports/hash_index.tsv (ejecuta antes la opción 9).\n" "$C_YLW" "$C_RESET"
+    pause_enter
+    return
+  fi
+  printf "Carpeta entrante (drag & drop): "
+  read -e -r incoming
+  incoming=$(strip_quotes "$incoming")
+  if [ ! -e "$incoming" ]; then
+    printf "%s[ERR]%s Carpeta inválida.\n" "$C_RED" "$C_RESET"
+    pause_enter
+    return
+  fi
+  ingest_report="$REPORTS_DIR/ingest_$(date +%s).tsv"
+  if "$PYTHON_BIN" "$TOOLS_DIR/ingest.py" check --index "$REPORTS_DIR/hash_index.tsv" --incoming "$incoming" \
+    --workers "$DJPT_HASH_WORKERS" --out "$ingest_report"; then
+    printf "%s[OK]%s Reporte: %s\n" "$C_GRN" "$C_RESET" "$ingest_report"
+  else
+    printf "%s[ERR]%s Falló el control de ingesta.\n" "$C_RED" "$C_RESET"
+  fi
+  pause_enter
+}
+
 action_toggle_ml() {
   print_header
   if [ "${ML_ENV_DISABLED:-0}" -eq 1 ]; then
@@ -1929,6 +2215,7 @@ action_ml_evo_manager() {
         --base "$BASE_PATH" \
         --plan-hash "$PLAN_HASH" \
         --plan-name "$PLAN_NAME" \
+        --hash-store "$HASH_STORE_DB" \
         --features-out "$ML_FEATURES_FILE" \
         --model-out "$ML_MODEL_PATH"
         
@@ -2823,7 +3110,7 @@ action_49_advanced_analysis() {
   if ! ensure_python_deps "BPM" "librosa" "soundfile"; then
     pause_enter; return
   fi
-  "$PYTHON_BIN" "lib/bpm_analyzer.py" --base "$BASE_PATH" --out "$out" --limit 200 2>/dev/null || {
+  "$PYTHON_BIN" "lib/bpm_analyzer.py" --base "$BASE_PATH" --out "$out" --limit 200 --order "$DJPT_READ_ORDER" 2>/dev/null || {
     printf "%s[ERR]%s Falló análisis BPM (revisa lib/bpm_analyzer.py y dependencias ffprobe/librosa).\n" "$C_RED" "$C_RESET"
     pause_enter; return
   }
@@ -3711,6 +3998,8 @@ EOSUM
             }
           }
         }' "$hash_tmp" >"$plan_hash"
+        store_import import-external "$hash_tmp"
+        store_import import-plan "$plan_hash"
 
         {
           printf "HASH_DUPES_REPORT\n"
@@ -3810,6 +4099,34 @@ EOSUM
         printf "Raíces separadas por coma (ej: /Volumes/DiscoA,/Volumes/DiscoB; ENTER usa GENERAL_ROOT=%s): " "${GENERAL_ROOT:-$BASE_PATH}"
         read -e -r rl
         [ -n "$rl" ] && roots_line="$rl"
+        if ensure_python_bin >/dev/null 2>&1 && [ -f "$TOOLS_DIR/merkle_index.py" ]; then
+          # Índice Merkle: un digest de contenido por árbol de carpetas, árboles idénticos en una pasada.
+          resolve_hash_algo
+          IFS=',' read -r -a MROOTS <<<"$roots_line"
+          plan_m="$PLANS_DIR/matrioshka_report.tsv"
+          clean_plan="$PLANS_DIR/matrioshka_clean_plan.tsv"
+          mkdir -p "$STATE_DIR/merkle" "$PLANS_DIR"
+          merkle_args=()
+          for r in "${MROOTS[@]}"; do
+            r_trim=$(printf "%s" "$r" | xargs)
+            [ -d "$r_trim" ] || { printf "%s[WARN]%s Raíz inválida: %s\n" "$C_YLW" "$C_RESET" "$r_trim"; continue; }
+            m_out="$STATE_DIR/merkle/$(printf "%s" "$r_trim" | cksum | awk '{print $1}').merkle"
+            printf "%s[INFO]%s Índice Merkle: %s\n" "$C_CYN" "$C_RESET" "$r_trim"
+            "$PYTHON_BIN" "$TOOLS_DIR/merkle_index.py" build --root "$r_trim" --out "$m_out" --algo "$HASH_ALGO" \
+              --workers "$DJPT_HASH_WORKERS" --cache "$HASH_CACHE_DB" && merkle_args+=(--index "$m_out")
+          done
+          if [ "${#merkle_args[@]}" -eq 0 ]; then
+            printf "%s[WARN]%s Ninguna raíz válida.\n" "$C_YLW" "$C_RESET"
+            pause_enter
+            continue
+          fi
+          "$PYTHON_BIN" "$TOOLS_DIR/merkle_index.py" dupes "${merkle_args[@]}" --report "$plan_m" --plan "$clean_plan"
+          hits=$(wc -l <"$plan_m" | tr -d ' ')
+          printf "%s[OK]%s Reporte matrioshkas: %s (coincidencias: %s)\n" "$C_GRN" "$C_RESET" "$plan_m" "$hits"
+          printf "%s[OK]%s Plan de limpieza matrioshkas: %s\n" "$C_GRN" "$C_RESET" "$clean_plan"
+          pause_enter
+          continue
+        fi
         printf "Profundidad máxima a analizar (1=solo raíz, 2=subcarpetas, 3=sub-sub; ENTER=3): "
         read -e -r md
         [ -z "$md" ] && md=3
@@ -4681,6 +4998,8 @@ main_loop() {
       67) action_audio_cues_onsets ;;
       68) action_install_all_python_deps ;;
       69) action_69_shared_corpus ;;
+      70) action_70_scrub ;;
+      71) action_71_ingest_gate ;;
       C|c) action_chat_cli ;;
       L|l) submenu_L_libraries ;;
       D|d) submenu_D_dupes_general ;;
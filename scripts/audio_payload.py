@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Tag-agnostic "audio payload" hashing for DJProducerTools.
+Hashes only the encoded audio of a file, so copies whose tags were rewritten
+by Serato/Rekordbox/iTunes still share a digest. Nothing is decoded; only
+container headers are parsed:
+- MP3/AAC: skip leading ID3v2 tags and trailing ID3v1, APEv2, Lyrics3v2 and
+  ID3v2 footer tags.
+- FLAC: skip every metadata block (STREAMINFO, VORBIS_COMMENT, PICTURE...).
+- MP4/M4A: hash only the mdat atoms (moov/udta/ilst hold the tags).
+- WAV/AIFF: hash only the data/SSND chunk (LIST/id3 chunks hold the tags).
+- Ogg: hash only the bodies of audio pages. Header pages (comments, cover
+  art) are skipped by packet count for Vorbis (3) and Opus (2); other codecs
+  skip every page up to the first one with a real granule position.
+Files whose layout is not recognised fall back to the whole file.
+FLAC files can also be identified without reading their audio at all: the
+STREAMINFO block stores an MD5 of the decoded samples (flac_md5).
+Output: "digest<TAB>payload_bytes<TAB>path" per file.
+"""
+import argparse
+import os
+import sys
+from pathlib import Path
+
+from hash_root import BLOCK_SIZE, DEFAULT_ALGO, FLAC_MD5_PREFIX, _read_buffer, available_algos, new_hasher
+
+AUDIO_EXTS = {".mp3", ".wav", ".flac", ".m4a", ".aiff", ".aif", ".ogg"}
+# Header packets at the start of an Ogg stream, by identification packet magic.
+OGG_HEADER_PACKETS = {b"\x01vorbis": 3, b"OpusHead": 2}
+OGG_HEADER_GRANULES = (0, 2**64 - 1)
+
+
+def is_audio(path):
+    return os.path.splitext(str(path))[1].lower() in AUDIO_EXTS
+
+
+def _read_at(fh, offset, size):
+    fh.seek(offset)
+    return fh.read(size)
+
+
+def _synchsafe(data):
+    return (data[0] << 21) | (data[1] << 14) | (data[2] << 7) | data[3]
+
+
+def _skip_id3v2(fh, start, end):
+    """Offset after the ID3v2 tags at start (taggers sometimes stack several)."""
+    while end - start >= 10:
+        head = _read_at(fh, start, 10)
+        if head[:3] != b"ID3":
+            break
+        size = 10 + _synchsafe(head[6:10]) + (10 if head[5] & 0x10 else 0)
+        start += size
+    return start
+
+
+def _strip_tail_tags(fh, start, end):
+    """Offset where trailing ID3v1 / APEv2 / Lyrics3v2 / ID3v2-footer tags begin."""
+    while end > start:
+        if end - start >= 128 and _read_at(fh, end - 128, 3) == b"TAG":
+            end -= 128
+            continue
+        if end - start >= 32:
+            footer = _read_at(fh, end - 32, 32)
+            if footer[:8] == b"APETAGEX":
+                tag_size = int.from_bytes(footer[12:16], "little")
+                flags = int.from_bytes(footer[20:24], "little")
+                end -= tag_size + (32 if flags & 0x80000000 else 0)
+                continue
+        if end - start >= 15 and _read_at(fh, end - 9, 9) == b"LYRICS200":
+            size = _read_at(fh, end - 15, 6)
+            if size.isdigit():
+                end -= int(size) + 15
+                continue
+        if end - start >= 10:
+            footer = _read_at(fh, end - 10, 10)
+            if footer[:3] == b"3DI":
+                end -= _synchsafe(footer[6:10]) + 20
+                continue
+        break
+    return end
+
+
+def _flac_ranges(fh, start, end):
+    pos = start + 4
+    while True:
+        head = _read_at(fh, pos, 4)
+        if len(head) < 4:
+            return None
+        pos += 4 + int.from_bytes(head[1:4], "big")
+        if head[0] & 0x80:
+            break
+    return [(pos, end - pos)]
+
+
+def _mp4_ranges(fh, size):
+    ranges = []
+    pos = 0
+    while pos + 8 <= size:
+        head = _read_at(fh, pos, 8)
+        atom_size = int.from_bytes(head[:4], "big")
+        header = 8
+        if atom_size == 1:
+            atom_size = int.from_bytes(_read_at(fh, pos + 8, 8), "big")
+            header = 16
+        elif atom_size == 0:
+            atom_size = size - pos
+        if atom_size < header:
+            return None
+        if head[4:8] == b"mdat":
+            ranges.append((pos + header, min(atom_size, size - pos) - header))
+        pos += atom_size
+    return ranges or None
+
+
+def _chunk_ranges(fh, size, audio_id, byteorder):
+    """RIFF (little endian) / IFF (big endian) chunk walk; return the audio chunk."""
+    pos = 12
+    while pos + 8 <= size:
+        head = _read_at(fh, pos, 8)
+        chunk_size = int.from_bytes(head[4:8], byteorder)
+        if head[:4] == audio_id:
+            return [(pos + 8, min(chunk_size, size - pos - 8))]
+        pos += 8 + chunk_size + (chunk_size & 1)
+    return None
+
+
+def _ogg_ranges(fh, size):
+    ranges = []
+    pos = 0
+    headers = None  # header packets still to skip; None = unknown codec
+    audio = False
+    while pos + 27 <= size:
+        head = _read_at(fh, pos, 27)
+        if head[:4] != b"OggS":
+            return None
+        lacing = fh.read(head[26])
+        body = sum(lacing)
+        body_start = pos + 27 + len(lacing)
+        if pos == 0:
+            magic = _read_at(fh, body_start, 8)
+            headers = OGG_HEADER_PACKETS.get(magic[:7], OGG_HEADER_PACKETS.get(magic))
+        if audio:
+            ranges.append((body_start, body))
+        elif headers is not None:
+            # Audio starts on the page after the one where the last header packet
+            # ends; a packet ends at the first lacing value below 255.
+            headers -= sum(1 for n in lacing if n < 255)
+            audio = headers <= 0
+        elif int.from_bytes(head[6:14], "little") not in OGG_HEADER_GRANULES:
+            # Header pages have granule 0, or -1 where no packet ends on them
+            # (a comment packet with cover art spans several pages).
+            audio = True
+            ranges.append((body_start, body))
+        pos = body_start + body
+    return ranges or None
+
+
+def payload_ranges(path):
+    """List of (offset, length) ranges holding the encoded audio, or None if unknown."""
+    with open(path, "rb") as fh:
+        size = os.fstat(fh.fileno()).st_size
+        head = fh.read(12)
+        if head[4:8] == b"ftyp":
+            ranges = _mp4_ranges(fh, size)
+        elif head[:4] == b"RIFF" and head[8:12] == b"WAVE":
+            ranges = _chunk_ranges(fh, size, b"data", "little")
+        elif head[:4] == b"FORM" and head[8:12] in (b"AIFF", b"AIFC"):
+            ranges = _chunk_ranges(fh, size, b"SSND", "big")
+        elif head[:4] == b"OggS":
+            ranges = _ogg_ranges(fh, size)
+        else:
+            start = _skip_id3v2(fh, 0, size)
+            end = _strip_tail_tags(fh, start, size)
+            if _read_at(fh, start, 4) == b"fLaC":
+                ranges = _flac_ranges(fh, start, end)
+            else:
+                ranges = [(start, end - start)]
+    if not ranges or any(off < 0 or length < 0 or off + length > size for off, length in ranges):
+        return None
+    if sum(length for _, length in ranges) == 0:
+        return None  # tag-only file: an empty payload would pair unrelated files
+    return ranges
+
+
+def flac_md5(path):
+    """Hex MD5 of the decoded audio stored in FLAC STREAMINFO; None if absent or unset (all zero)."""
+    with open(path, "rb") as fh:
+        start = _skip_id3v2(fh, 0, os.fstat(fh.fileno()).st_size)
+        # "fLaC", block header (type 0 = STREAMINFO), 34-byte STREAMINFO ending in the MD5.
+        head = _read_at(fh, start, 42)
+    if len(head) < 42 or head[:4] != b"fLaC" or head[4] & 0x7F != 0:
+        return None
+    md5 = head[26:42]
+    return None if md5 == bytes(16) else md5.hex()
+
+
+def flac_identity(path):
+    """FLAC_MD5_PREFIX + STREAMINFO MD5 for .flac files that carry one, else None."""
+    if not str(path).lower().endswith(".flac"):
+        return None
+    try:
+        md5 = flac_md5(path)
+    except OSError:
+        return None
+    return FLAC_MD5_PREFIX + md5 if md5 else None
+
+
+def with_flac_md5(hash_func):
+    """Wrap hash_func(path) so .flac files with a STREAMINFO MD5 are not read further."""
+
+    def wrapper(path):
+        return flac_identity(path) or hash_func(path)
+
+    return wrapper
+
+
+def hash_payload(path, algo=DEFAULT_ALGO, block_size=BLOCK_SIZE, ranges=None):
+    """Hex digest of the audio payload; the whole file when the layout is unknown."""
+    if ranges is None:
+        ranges = payload_ranges(path)
+    h = new_hasher(algo)
+    buf, view = _read_buffer(block_size)
+    with open(path, "rb", buffering=0) as fh:
+        if ranges is None:
+            ranges = [(0, os.fstat(fh.fileno()).st_size)]
+        for offset, length in ranges:
+            fh.seek(offset)
+            while length > 0:
+                n = fh.readinto(view[: min(length, block_size)])
+                if not n:
+                    break
+                h.update(view[:n])
+                length -= n
+    return h.hexdigest()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hash the audio payload of files, ignoring tags.")
+    parser.add_argument("paths", nargs="+", type=Path, help="Audio files")
+    parser.add_argument("--algo", choices=available_algos(), default=DEFAULT_ALGO, help="Digest algorithm")
+    args = parser.parse_args()
+
+    rc = 0
+    for path in args.paths:
+        try:
+            ranges = payload_ranges(path)
+            digest = hash_payload(path, args.algo, ranges=ranges)
+        except OSError as exc:
+            print(f"[ERROR] {path}: {exc}", file=sys.stderr)
+            rc = 1
+            continue
+        payload = sum(length for _, length in ranges) if ranges else path.stat().st_size
+        print(f"{digest}\t{payload}\t{path}")
+    sys.exit(rc)
+
+
+if __name__ == "__main__":
+    main()
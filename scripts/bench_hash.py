@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+Hashing benchmarks for DJProducerTools.
+- workers: files/s and MB/s of hash_root.hash_paths for several worker counts.
+  Pass one --root per device (e.g. an SSD and an HDD volume) to compare them.
+- algos: MB/s of every available digest algorithm for several block sizes,
+  on an in-memory buffer (pure CPU) or on the files of --root (warm cache).
+- reader: read() loop vs readinto() buffer vs mmap vs raw hashlib on the same
+  bytes, for the files of --root (warm cache).
+- cache: cold-read MB/s per bulk_reader cache mode (keep/drop/direct), and how
+  much of a "hot" working set (the first --hot-files files, read beforehand)
+  is still in the page cache after scanning the rest. Residency is measured
+  with mincore(); the hot set is only evicted when the scan outgrows free RAM,
+  so scan_resident_pct (the page cache a scan leaves behind) is the number
+  that predicts it on smaller runs.
+- order: cold-read files/s and MB/s of --root in walk, inode and extent
+  (FIEMAP) order, plus jump_GB: the summed distance between the end of one
+  file's first extent and the start of the next, i.e. how far a disk head
+  travels. On SSDs and VM disks only jump_GB is telling.
+Output: TSV on stdout (or --out).
+"""
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+from bulk_reader import CACHE_MODES, ORDERS, evict, first_extent, physical_order, resident_pages
+from hash_root import BLOCK_SIZE, available_algos, hash_file, hash_paths, new_hasher
+
+
+def parse_int_list(text):
+    return [int(x) for x in text.split(",") if x.strip()]
+
+
+def collect_files(root, max_files):
+    files = []
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                continue
+            files.append((path, size))
+            if max_files > 0 and len(files) >= max_files:
+                return files
+    return files
+
+
+def timed_hash(files, **kwargs):
+    sizes = dict(files)
+    done = 0
+    nbytes = 0
+    t0 = time.perf_counter()
+    for path, digest in hash_paths([p for p, _ in files], **kwargs):
+        if digest is None:
+            continue
+        done += 1
+        nbytes += sizes[path]
+    return done, nbytes, time.perf_counter() - t0
+
+
+def write_rows(rows, out_path):
+    fh = out_path.open("w", encoding="utf-8") if out_path else sys.stdout
+    try:
+        for row in rows:
+            fh.write("\t".join(str(c) for c in row) + "\n")
+    finally:
+        if out_path:
+            fh.close()
+
+
+def bench_workers(args):
+    counts = parse_int_list(args.workers)
+    rows = [["root", "workers", "files", "bytes", "seconds", "files_s", "MB_s"]]
+    for root in args.root:
+        root = root.expanduser()
+        # With --disjoint every worker count reads its own slice of files, so a
+        # run never profits from the page cache warmed by the previous one.
+        want = args.max_files * len(counts) if args.disjoint and args.max_files > 0 else args.max_files
+        files = collect_files(root, want)
+        if not files:
+            print(f"[WARN] No files under '{root}'.", file=sys.stderr)
+            continue
+        for idx, n in enumerate(counts):
+            batch = files[idx :: len(counts)] if args.disjoint else files
+            done, nbytes, secs = timed_hash(batch, workers=n, io_per_device=args.io_per_device)
+            secs = max(secs, 1e-9)
+            rows.append(
+                [root, n, done, nbytes, f"{secs:.3f}", f"{done / secs:.1f}", f"{nbytes / secs / 1e6:.1f}"]
+            )
+            print(f"[INFO] {root} workers={n}: {done / secs:.1f} files/s", file=sys.stderr)
+    write_rows(rows, args.out)
+
+
+def bench_algos(args):
+    block_sizes = parse_int_list(args.block_sizes)
+    files = collect_files(args.root.expanduser(), args.max_files) if args.root else []
+    if files:
+        source = str(args.root)
+        nbytes = sum(size for _, size in files)
+        for path, _ in files:  # warm the page cache so only hashing is measured
+            hash_file(path, "sha256")
+    else:
+        source = "memory"
+        data = memoryview(os.urandom(args.size_mb * 1024 * 1024))
+        nbytes = len(data)
+    rows = [["source", "algo", "block_size", "bytes", "seconds", "MB_s"]]
+    for algo in available_algos():
+        for block in block_sizes:
+            t0 = time.perf_counter()
+            if files:
+                for path, _ in files:
+                    hash_file(path, algo, block)
+            else:
+                h = new_hasher(algo)
+                for off in range(0, nbytes, block):
+                    h.update(data[off : off + block])
+                h.hexdigest()
+            secs = max(time.perf_counter() - t0, 1e-9)
+            rows.append([source, algo, block, nbytes, f"{secs:.3f}", f"{nbytes / secs / 1e6:.1f}"])
+            print(f"[INFO] {algo} block={block}: {nbytes / secs / 1e6:.1f} MB/s", file=sys.stderr)
+    write_rows(rows, args.out)
+
+
+def read_loop_hash(path, algo, block_size):
+    # Pre-readinto implementation, kept as the baseline.
+    h = new_hasher(algo)
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(block_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def bench_reader(args):
+    files = collect_files(args.root.expanduser(), args.max_files)
+    if not files:
+        print(f"[WARN] No files under '{args.root}'.", file=sys.stderr)
+        return
+    nbytes = sum(size for _, size in files)
+    blobs = []
+    for path, _ in files:  # warm cache + raw bytes for the hashlib ceiling
+        with open(path, "rb") as fh:
+            blobs.append(fh.read())
+    modes = {
+        "read": lambda p: read_loop_hash(p, args.algo, args.block_size),
+        "readinto": lambda p: hash_file(p, args.algo, args.block_size),
+        "mmap": lambda p: hash_file(p, args.algo, args.block_size, mmap_min_size=1),
+    }
+    rows = [["mode", "algo", "block_size", "bytes", "seconds", "MB_s"]]
+    for mode, func in modes.items():
+        t0 = time.perf_counter()
+        for path, _ in files:
+            func(path)
+        secs = max(time.perf_counter() - t0, 1e-9)
+        rows.append([mode, args.algo, args.block_size, nbytes, f"{secs:.3f}", f"{nbytes / secs / 1e6:.1f}"])
+    t0 = time.perf_counter()
+    for blob in blobs:
+        h = new_hasher(args.algo)
+        h.update(blob)
+        h.hexdigest()
+    secs = max(time.perf_counter() - t0, 1e-9)
+    rows.append(["hashlib_raw", args.algo, "", nbytes, f"{secs:.3f}", f"{nbytes / secs / 1e6:.1f}"])
+    write_rows(rows, args.out)
+
+
+def residency(files):
+    """Percentage of the pages of files present in the page cache."""
+    resident = total = 0
+    for path, _ in files:
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            continue
+        try:
+            r, t = resident_pages(fd)
+        finally:
+            os.close(fd)
+        resident += r
+        total += t
+    return 100.0 * resident / total if total else 0.0
+
+
+def bench_cache(args):
+    files = collect_files(args.root.expanduser(), args.max_files)
+    hot, scan = files[: args.hot_files], files[args.hot_files :]
+    if not scan:
+        print(f"[WARN] Need more than {args.hot_files} files under '{args.root}'.", file=sys.stderr)
+        return
+    nbytes = sum(size for _, size in scan)
+    rows = [["mode", "files", "bytes", "seconds", "MB_s", "hot_before_pct", "hot_after_pct", "scan_resident_pct"]]
+    for mode in [m for m in args.modes.split(",") if m]:
+        if mode not in CACHE_MODES:
+            print(f"[WARN] Unknown mode '{mode}' skipped.", file=sys.stderr)
+            continue
+        for path, _ in scan:  # cold start for every mode
+            evict(path)
+        for path, _ in hot:
+            hash_file(path, args.algo)
+        hot_before = residency(hot)
+        t0 = time.perf_counter()
+        for path, _ in scan:
+            hash_file(path, args.algo, args.block_size, cache_mode=mode)
+        secs = max(time.perf_counter() - t0, 1e-9)
+        row = [mode, len(scan), nbytes, f"{secs:.3f}", f"{nbytes / secs / 1e6:.1f}"]
+        rows.append(row + [f"{hot_before:.1f}", f"{residency(hot):.1f}", f"{residency(scan):.1f}"])
+        print(f"[INFO] {mode}: {nbytes / secs / 1e6:.1f} MB/s", file=sys.stderr)
+    write_rows(rows, args.out)
+
+
+def head_travel(paths, sizes):
+    """Bytes between consecutive first extents (end of one to start of the next); None without FIEMAP."""
+    travel = 0
+    last_end = None
+    for path in paths:
+        start = first_extent(path)
+        if start is None:
+            continue
+        if last_end is not None:
+            travel += abs(start - last_end)
+        last_end = start + sizes[path]
+    return travel if last_end is not None else None
+
+
+def bench_order(args):
+    files = collect_files(args.root.expanduser(), args.max_files)
+    if not files:
+        print(f"[WARN] No files under '{args.root}'.", file=sys.stderr)
+        return
+    sizes = dict(files)
+    paths = [p for p, _ in files]
+    rows = [["order", "files", "bytes", "sort_seconds", "seconds", "files_s", "MB_s", "jump_GB"]]
+    for order in [o for o in args.orders.split(",") if o]:
+        if order not in ORDERS:
+            print(f"[WARN] Unknown order '{order}' skipped.", file=sys.stderr)
+            continue
+        for path in paths:
+            evict(path)
+        t0 = time.perf_counter()
+        scheduled = physical_order(paths, order)
+        sort_secs = time.perf_counter() - t0
+        travel = head_travel(scheduled, sizes)
+        for path in paths:  # FIEMAP/stat above must not warm the data
+            evict(path)
+        done, nbytes, secs = timed_hash(files, workers=args.workers, order=order)
+        secs = max(secs, 1e-9)
+        rows.append(
+            [
+                order,
+                done,
+                nbytes,
+                f"{sort_secs:.3f}",
+                f"{secs:.3f}",
+                f"{done / secs:.1f}",
+                f"{nbytes / secs / 1e6:.1f}",
+                f"{travel / 1e9:.2f}" if travel is not None else "",
+            ]
+        )
+        print(f"[INFO] {order}: {done / secs:.1f} files/s, {nbytes / secs / 1e6:.1f} MB/s", file=sys.stderr)
+    write_rows(rows, args.out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DJProducerTools hashing benchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    w = subparsers.add_parser("workers", help="Throughput per worker count")
+    w.add_argument("--root", type=Path, action="append", required=True, help="Root to scan (repeatable).")
+    w.add_argument("--workers", default="1,2,4,8", help="Comma separated worker counts (default 1,2,4,8).")
+    w.add_argument("--io-per-device", type=int, default=0, help="Per-device read limit passed to hash_paths.")
+    w.add_argument("--max-files", type=int, default=500, help="Files per run (0 = all).")
+    w.add_argument("--disjoint", action="store_true", help="Use a different file slice for each worker count.")
+    w.add_argument("--out", type=Path, default=None, help="Write TSV here instead of stdout.")
+
+    a = subparsers.add_parser("algos", help="Throughput per algorithm and block size")
+    a.add_argument("--root", type=Path, default=None, help="Hash files under this root instead of memory.")
+    a.add_argument("--max-files", type=int, default=200, help="Files to hash with --root (0 = all).")
+    a.add_argument("--size-mb", type=int, default=256, help="In-memory buffer size (default 256 MB).")
+    a.add_argument(
+        "--block-sizes", default="65536,262144,1048576,4194304", help="Comma separated block sizes in bytes."
+    )
+    a.add_argument("--out", type=Path, default=None, help="Write TSV here instead of stdout.")
+
+    r = subparsers.add_parser("reader", help="read() vs readinto() vs mmap vs raw hashlib")
+    r.add_argument("--root", type=Path, required=True, help="Root with sample files.")
+    r.add_argument("--max-files", type=int, default=200, help="Files to hash (0 = all).")
+    r.add_argument("--algo", choices=available_algos(), default="sha256", help="Digest algorithm.")
+    r.add_argument("--block-size", type=int, default=BLOCK_SIZE, help="Block size in bytes.")
+    r.add_argument("--out", type=Path, default=None, help="Write TSV here instead of stdout.")
+
+    c = subparsers.add_parser("cache", help="Cold-read MB/s and hot-set survival per page cache mode")
+    c.add_argument("--root", type=Path, required=True, help="Root with sample files (larger than RAM for survival).")
+    c.add_argument("--max-files", type=int, default=0, help="Files to use (0 = all).")
+    c.add_argument("--hot-files", type=int, default=20, help="First N files form the hot working set.")
+    c.add_argument("--modes", default=",".join(CACHE_MODES), help="Comma separated cache modes.")
+    c.add_argument("--algo", choices=available_algos(), default="sha256", help="Digest algorithm.")
+    c.add_argument("--block-size", type=int, default=BLOCK_SIZE, help="Block size in bytes.")
+    c.add_argument("--out", type=Path, default=None, help="Write TSV here instead of stdout.")
+
+    o = subparsers.add_parser("order", help="Walk order vs inode / physical extent order, cold cache")
+    o.add_argument("--root", type=Path, required=True, help="Root to scan (ideally on the HDD in question).")
+    o.add_argument("--max-files", type=int, default=0, help="Files to use (0 = all).")
+    o.add_argument("--orders", default=",".join(ORDERS), help="Comma separated orders (default walk,inode,extent).")
+    o.add_argument("--workers", type=int, default=1, help="Hash workers (default 1).")
+    o.add_argument("--out", type=Path, default=None, help="Write TSV here instead of stdout.")
+
+    args = parser.parse_args()
+    if args.command == "workers":
+        bench_workers(args)
+    elif args.command == "algos":
+        bench_algos(args)
+    elif args.command == "reader":
+        bench_reader(args)
+    elif args.command == "cache":
+        bench_cache(args)
+    elif args.command == "order":
+        bench_order(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,32 +1,191 @@
 #!/usr/bin/env python3
 import argparse
 import collections
+import hashlib
+import itertools
+import os
+import sys
+from array import array
+from functools import partial
 from pathlib import Path
 
+from hash_root import (
+    DEFAULT_ALGO,
+    INDEX_HEADER_PREFIX,
+    available_algos,
+    hash_file,
+    hash_paths,
+    index_header,
+    read_index_options,
+    sha256_file,
+    walk_files,
+)
+from sorted_index import RUN_LINES, merge_runs, sorted_runs
 
-def parse_hash_index(path):
-    entries = collections.defaultdict(list)
+# Head and tail bytes hashed in the cascade's second stage.
+PARTIAL_BYTES = 64 * 1024
+# End of a DigestTable chain.
+NO_LINK = 0xFFFFFFFF
+
+
+class ByteInterner:
+    """Set of byte strings kept in one blob; intern() returns stable ids in first-seen order.
+
+    Lookups go through an open-addressing table of ids in array('I'), so no
+    Python object is kept per string.
+    """
+
+    def __init__(self):
+        self.blob = bytearray()
+        self.ends = array("Q")
+        self.slots = array("I", bytes(4 * 1024))  # id + 1 (0 = empty), power-of-two size
+
+    def __len__(self):
+        return len(self.ends)
+
+    def __getitem__(self, i):
+        return self.blob[self.ends[i - 1] if i else 0 : self.ends[i]]
+
+    def _grow(self):
+        self.slots = slots = array("I", bytes(8 * len(self.slots)))
+        mask = len(slots) - 1
+        for n in range(len(self.ends)):
+            i = hash(bytes(self[n])) & mask
+            while slots[i]:
+                i = (i + 1) & mask
+            slots[i] = n + 1
+
+    def intern(self, key):
+        """(id, new) of the byte string key."""
+        slots, ends, blob = self.slots, self.ends, self.blob
+        mask = len(slots) - 1
+        i = hash(key) & mask
+        while True:
+            n = slots[i]
+            if not n:
+                break
+            n -= 1
+            if blob[ends[n - 1] if n else 0 : ends[n]] == key:
+                return n, False
+            i = (i + 1) & mask
+        blob += key
+        ends.append(len(blob))
+        n = len(ends)
+        slots[i] = n
+        if 2 * n > len(slots):
+            self._grow()
+        return n - 1, True
+
+
+class DigestTable:
+    """digest -> paths in first-seen order, stored compactly for multi-drive indexes.
+
+    Hex digests are interned as binary keys (their id is the group id), each
+    path is an interned directory prefix plus an interned file name (mirrored
+    drives share names), and paths sharing a digest are chained through
+    array('I') links, so no Python object is kept per path. items() yields
+    (digest, [paths]) exactly as a dict of lists would.
+    """
+
+    def __init__(self):
+        self.digests = ByteInterner()
+        self.names = ByteInterner()
+        self.dirs = []
+        self.dir_ids = {}
+        self.group_last = array("I")  # digest id -> newest path id of its group
+        self.link = array("I")  # path id -> previous path id of its group
+        self.dir_of = array("I")
+        self.name_of = array("I")
+
+    @staticmethod
+    def _key(digest):
+        """0x00 + binary digest for lowercase hex, 0x01 + UTF-8 for anything else (flacmd5:...)."""
+        try:
+            key = bytes.fromhex(digest)
+        except ValueError:
+            key = None
+        if key is not None and key.hex() == digest:
+            return b"\x00" + key
+        return b"\x01" + digest.encode("utf-8", "surrogateescape")
+
+    def extend(self, entries):
+        """Add (digest, path) pairs."""
+        dirs, dir_ids, link, group_last = self.dirs, self.dir_ids, self.link, self.group_last
+        intern_digest, intern_name = self.digests.intern, self.names.intern
+        add_dir, add_name, add_link = self.dir_of.append, self.name_of.append, link.append
+        key_of, sep = self._key, os.sep
+        for digest, path in entries:
+            pid = len(link)
+            cut = path.rfind(sep) + 1
+            prefix = path[:cut]
+            dir_id = dir_ids.get(prefix)
+            if dir_id is None:
+                dir_id = dir_ids[prefix] = len(dirs)
+                dirs.append(prefix)
+            add_dir(dir_id)
+            add_name(intern_name(path[cut:].encode("utf-8", "surrogateescape"))[0])
+            group, new = intern_digest(key_of(digest))
+            if new:
+                add_link(NO_LINK)
+                group_last.append(pid)
+            else:
+                add_link(group_last[group])
+                group_last[group] = pid
+
+    def path(self, pid):
+        return self.dirs[self.dir_of[pid]] + self.names[self.name_of[pid]].decode("utf-8", "surrogateescape")
+
+    def __len__(self):
+        return len(self.link)
+
+    def duplicate_count(self):
+        return sum(1 for pid in self.group_last if self.link[pid] != NO_LINK)
+
+    def items(self):
+        link, path = self.link, self.path
+        for group, pid in enumerate(self.group_last):
+            key = self.digests[group]
+            digest = key[1:].hex() if key[0] == 0 else key[1:].decode("utf-8", "surrogateescape")
+            ids = []
+            while pid != NO_LINK:
+                ids.append(pid)
+                pid = link[pid]
+            ids.reverse()
+            yield digest, [path(i) for i in ids]
+
+
+def _hash_index_entries(path):
     with path.open("r", encoding="utf-8", errors="ignore") as fh:
         for line in fh:
+            if line.startswith(INDEX_HEADER_PREFIX):
+                continue
             parts = line.rstrip("\n").split("\t")
             if len(parts) < 3:
                 continue
-            h = parts[0]
-            full = parts[2]
-            entries[h].append(full)
-    return entries
+            yield parts[0], parts[2]
 
 
-def parse_external(path):
-    entries = collections.defaultdict(list)
+def _external_entries(path):
     with path.open("r", encoding="utf-8", errors="ignore") as fh:
         for line in fh:
+            if line.startswith(INDEX_HEADER_PREFIX):
+                continue
             parts = line.rstrip("\n").split("\t", 1)
             if len(parts) != 2:
                 continue
-            h, full = parts
-            entries[h].append(full)
-    return entries
+            yield parts
+
+
+def parse_hash_index(path, table=None):
+    table = DigestTable() if table is None else table
+    table.extend(_hash_index_entries(path))
+    return table
+
+
+def parse_external(path, table=None):
+    table = DigestTable() if table is None else table
+    table.extend(_external_entries(path))
+    return table
 
 
 def write_plan(entries, plan_path):
@@ -39,25 +198,336 @@ def write_plan(entries, plan_path):
                 plan.write(f"{h}\t{action}\t{p}\n")
 
 
-def write_tmp(entries, tmp_path):
+def write_tmp(entries, tmp_path, algo=DEFAULT_ALGO, flac_md5=False):
     with tmp_path.open("w", encoding="utf-8") as tmp:
+        tmp.write(index_header(algo, flac_md5))
         for h, paths in entries.items():
             for p in paths:
                 tmp.write(f"{h}\t{p}\n")
 
 
+def partial_digest(path, size):
+    h = hashlib.sha256()
+    with open(path, "rb") as fh:
+        h.update(fh.read(PARTIAL_BYTES))
+        if size > PARTIAL_BYTES:
+            fh.seek(max(size - PARTIAL_BYTES, PARTIAL_BYTES))
+            h.update(fh.read(PARTIAL_BYTES))
+    return h.hexdigest()
+
+
+def cascade_groups(files, stats, workers=1, hash_func=sha256_file, identity=None):
+    """Find exact duplicates reading as little as possible.
+
+    1) group by size, 2) hash first+last PARTIAL_BYTES of same-size files,
+    3) full-hash only files whose partial digest still collides.
+    identity(path) may return a ready-made key (e.g. a FLAC STREAMINFO MD5)
+    that takes the file out of the cascade; None sends it through.
+    Returns {digest: [paths]} with paths in walk order.
+    """
+    order = {}
+    by_size = collections.defaultdict(list)
+    groups = collections.defaultdict(list)
+    for path, size in files:
+        order[path] = len(order)
+        stats["files"] += 1
+        stats["bytes_total"] += size
+        key = identity(path) if identity is not None else None
+        if key:
+            stats["identified"] += 1
+            groups[key].append(path)
+            continue
+        by_size[size].append(path)
+
+    full_candidates = []
+    for size, paths in by_size.items():
+        if len(paths) < 2:
+            continue
+        if size <= 2 * PARTIAL_BYTES:
+            # The partial read would cover the whole file anyway.
+            full_candidates.extend((p, size) for p in paths)
+            continue
+        by_partial = collections.defaultdict(list)
+        for p in paths:
+            try:
+                by_partial[partial_digest(p, size)].append(p)
+            except OSError:
+                continue
+            stats["bytes_read"] += 2 * PARTIAL_BYTES
+        for same in by_partial.values():
+            if len(same) > 1:
+                full_candidates.extend((p, size) for p in same)
+
+    sizes = dict(full_candidates)
+    for path, digest in hash_paths([p for p, _ in full_candidates], workers=workers, hash_func=hash_func):
+        if digest is None:
+            continue
+        stats["bytes_read"] += sizes[path]
+        stats["full_hashed"] += 1
+        groups[digest].append(path)
+
+    dupes = [(h, sorted(p, key=order.get)) for h, p in groups.items() if len(p) > 1]
+    dupes.sort(key=lambda item: order[item[1][0]])
+    return dict(dupes)
+
+
+def _payload_ranges(path):
+    from audio_payload import payload_ranges
+
+    try:
+        return payload_ranges(path)
+    except OSError:
+        return None
+
+
+def payload_groups(files, stats, workers=1, hash_func=None):
+    """Group audio files whose encoded audio is identical, whatever their tags.
+
+    Container headers give each file's payload length without reading the
+    audio, so only files sharing a payload length are hashed.
+    hash_func(path, ranges=...) defaults to audio_payload.hash_payload.
+    Returns {digest: [paths]} with paths in walk order.
+    """
+    from audio_payload import hash_payload, is_audio
+
+    if hash_func is None:
+        hash_func = hash_payload
+    order = {}
+    sizes = {}
+    for path, size in files:
+        if not is_audio(path):
+            continue
+        order[path] = len(order)
+        sizes[path] = size
+        stats["files"] += 1
+        stats["bytes_total"] += size
+
+    ranges = {}
+    by_length = collections.defaultdict(list)
+    for path, found in hash_paths(list(order), workers=workers, hash_func=_payload_ranges):
+        if found is None:
+            # Unknown layout: fall back to the whole file, still grouped by length.
+            stats["unparsed"] += 1
+            found = [(0, sizes[path])]
+        ranges[path] = found
+        by_length[sum(length for _, length in found)].append(path)
+
+    candidates = [p for paths in by_length.values() if len(paths) > 1 for p in paths]
+    groups = collections.defaultdict(list)
+    for path, digest in hash_paths(candidates, workers=workers, hash_func=lambda p: hash_func(p, ranges=ranges[p])):
+        if digest is None:
+            continue
+        stats["bytes_read"] += sum(length for _, length in ranges[path])
+        stats["full_hashed"] += 1
+        groups[digest].append(path)
+
+    dupes = [(h, sorted(p, key=order.get)) for h, p in groups.items() if len(p) > 1]
+    dupes.sort(key=lambda item: order[item[1][0]])
+    return dict(dupes)
+
+
+def check_index_options(args):
+    """(algo, flac_md5) shared by --hash-index and --external; exits if they differ."""
+    # Digests from different algorithms must never be grouped together.
+    options = read_index_options(args.hash_index)
+    external_options = read_index_options(args.external)
+    algo = options["algo"]
+    if external_options["algo"] != algo:
+        print(
+            f"[ERROR] {args.hash_index} uses {algo} but {args.external} uses {external_options['algo']}; "
+            "rehash one of them with the same --algo.",
+            file=sys.stderr,
+        )
+        sys.exit(1)
+    flac_md5 = options["flac"] == "md5"
+    if (external_options["flac"] == "md5") != flac_md5:
+        print(
+            f"[ERROR] Only one of {args.hash_index} and {args.external} identifies FLAC files by "
+            "STREAMINFO MD5; rehash one of them with the same --flac-md5 setting.",
+            file=sys.stderr,
+        )
+        sys.exit(1)
+    return algo, flac_md5
+
+
+def write_index_report(args, algo, processed, dupe_hashes, mode=""):
+    with args.report.open("w", encoding="utf-8") as report:
+        report.write(f"HASH_DUPES_REPORT{mode}\n")
+        report.write(f"Roots: {args.external.parents[0]}\n")
+        report.write(f"Algoritmo: {algo}\n")
+        report.write(f"Archivos procesados: {processed}\n")
+        report.write(f"Hashes con duplicados: {dupe_hashes}\n")
+        report.write(f"Plan: {args.plan}\n")
+
+
+def plan_from_indexes(args):
+    algo, flac_md5 = check_index_options(args)
+    # Base entries first, then external ones, in one table (grouped by digest).
+    merged = DigestTable()
+    parse_hash_index(args.hash_index, merged)
+    parse_external(args.external, merged)
+
+    write_tmp(merged, args.tmp, algo, flac_md5)
+    write_plan(merged, args.plan)
+
+    write_index_report(args, algo, len(merged), merged.duplicate_count())
+
+
+def keyed_lines(path, source, columns):
+    """Lines "hash<TAB>source<TAB>seq<TAB>full" of an index, so a bytewise sort groups
+    equal hashes and keeps --hash-index entries first, each in file order."""
+    header = INDEX_HEADER_PREFIX.encode()
+    with open(path, "rb") as fh:
+        for seq, line in enumerate(fh):
+            if line.startswith(header):
+                continue
+            parts = line.rstrip(b"\n").split(b"\t", columns - 1)
+            if len(parts) < columns:
+                continue
+            full = parts[2].split(b"\t", 1)[0] if columns == 3 else parts[1]
+            yield b"%s\t%d\t%012d\t%s\n" % (parts[0], source, seq, full)
+
+
+def streamed_groups(sources, tmp_dir, run_lines):
+    """Yield (hash, [paths]) in hash order from several indexes in bounded memory.
+
+    Every source is split into sorted runs on disk, then all runs are
+    heap-merged (merge join): only one hash group is held at a time.
+    """
+    runs = []
+    try:
+        for source, (path, columns) in enumerate(sources):
+            runs.extend(sorted_runs(keyed_lines(path, source, columns), tmp_dir, run_lines))
+    except BaseException:
+        for run in runs:
+            os.unlink(run)
+        raise
+    merged = merge_runs(runs)
+    for digest, lines in itertools.groupby(merged, key=lambda line: line.split(b"\t", 1)[0]):
+        yield digest, [line.rstrip(b"\n").split(b"\t", 3)[3] for line in lines]
+
+
+def plan_streaming(args):
+    algo, flac_md5 = check_index_options(args)
+    sources = [(args.hash_index, 3), (args.external, 2)]
+    processed = 0
+    dupe_hashes = 0
+    with args.tmp.open("wb") as tmp, args.plan.open("wb") as plan:
+        tmp.write(index_header(algo, flac_md5).encode("utf-8"))
+        for digest, paths in streamed_groups(sources, args.tmp.parent, args.run_lines):
+            processed += len(paths)
+            for p in paths:
+                tmp.write(b"%s\t%s\n" % (digest, p))
+            if len(paths) < 2:
+                continue
+            dupe_hashes += 1
+            for idx, p in enumerate(paths):
+                plan.write(b"%s\t%s\t%s\n" % (digest, b"KEEP" if idx == 0 else b"QUARANTINE", p))
+    write_index_report(args, algo, processed, dupe_hashes, " (streaming)")
+
+
+def plan_cascade(args):
+    hash_func = partial(hash_file, algo=args.algo)
+    cache = None
+    if args.cache:
+        from hash_cache import HashCache
+
+        cache = HashCache(args.cache)
+        hash_func = cache.cached(hash_func, args.algo)
+
+    identity = None
+    if args.flac_md5:
+        from audio_payload import flac_identity as identity
+
+    stats = collections.Counter()
+    roots = [r.expanduser() for r in args.root]
+    groups = cascade_groups(walk_files(roots), stats, workers=args.workers, hash_func=hash_func, identity=identity)
+    if cache is not None:
+        cache.close()
+
+    if args.tmp:
+        write_tmp(groups, args.tmp, args.algo, args.flac_md5)
+    write_plan(groups, args.plan)
+
+    total = stats["bytes_total"]
+    pct = 100.0 * stats["bytes_read"] / total if total else 0.0
+    with args.report.open("w", encoding="utf-8") as report:
+        report.write("HASH_DUPES_REPORT (cascade)\n")
+        report.write(f"Roots: {', '.join(str(r) for r in roots)}\n")
+        report.write(f"Algoritmo: {args.algo}\n")
+        report.write(f"Archivos procesados: {stats['files']}\n")
+        if args.flac_md5:
+            report.write(f"FLAC identificados por MD5 STREAMINFO: {stats['identified']}\n")
+        report.write(f"Archivos con hash completo: {stats['full_hashed']}\n")
+        report.write(f"Bytes leídos: {stats['bytes_read']} de {total} ({pct:.1f}%)\n")
+        report.write(f"Hashes con duplicados: {len(groups)}\n")
+        report.write(f"Plan: {args.plan}\n")
+
+
+def plan_audio_payload(args):
+    from audio_payload import hash_payload
+
+    cache_algo = f"audio_payload-{args.algo}"
+    cache = None
+    if args.cache:
+        from hash_cache import HashCache
+
+        cache = HashCache(args.cache)
+
+    def hash_func(path, ranges):
+        func = partial(hash_payload, algo=args.algo, ranges=ranges)
+        return cache.cached(func, cache_algo)(path) if cache is not None else func(path)
+
+    stats = collections.Counter()
+    roots = [r.expanduser() for r in args.root]
+    groups = payload_groups(walk_files(roots), stats, workers=args.workers, hash_func=hash_func)
+    if cache is not None:
+        cache.close()
+
+    if args.tmp:
+        write_tmp(groups, args.tmp, cache_algo)
+    write_plan(groups, args.plan)
+
+    with args.report.open("w", encoding="utf-8") as report:
+        report.write("AUDIO_PAYLOAD_DUPES_REPORT\n")
+        report.write(f"Roots: {', '.join(str(r) for r in roots)}\n")
+        report.write(f"Algoritmo: {args.algo} (solo audio, sin tags)\n")
+        report.write(f"Archivos de audio procesados: {stats['files']}\n")
+        report.write(f"Sin formato reconocido (hash completo): {stats['unparsed']}\n")
+        report.write(f"Archivos con hash de audio: {stats['full_hashed']}\n")
+        report.write(f"Bytes leídos: {stats['bytes_read']} de {stats['bytes_total']}\n")
+        report.write(f"Hashes con duplicados: {len(groups)}\n")
+        report.write(f"Plan: {args.plan}\n")
+
+
+def record_in_store(args):
+    """Import the plan (and, in index mode, both indexes) into the hash store."""
+    from hash_store import HashStore, external_rows, index_algo, index_root, index_rows, read_tsv
+
+    store = HashStore(args.store)
+    try:
+        if not (args.cascade or args.audio_payload):
+            algo = index_algo(args.hash_index)
+            store.import_rows(index_root(args.hash_index), index_rows(args.hash_index), algo)
+            store.import_rows(f"external:{args.external}", external_rows(args.external), algo)
+        store.import_plan(args.plan.stem, read_tsv(args.plan, 3), args.plan)
+    except ValueError as exc:
+        print(f"[WARN] Hash store no actualizado: {exc}", file=sys.stderr)
+    finally:
+        store.close()
+    print(f"[OK] Hash store: {args.store}")
+
+
 def main():
     parser = argparse.ArgumentParser(description="Regenerate duplicate plan + report.")
     parser.add_argument(
         "--hash-index",
         type=Path,
-        required=True,
         help="hash_index.tsv (BASE_PATH)",
     )
     parser.add_argument(
         "--external",
         type=Path,
-        required=True,
         help="external_hashes.tsv",
     )
     parser.add_argument(
@@ -69,7 +539,6 @@ def main():
     parser.add_argument(
         "--tmp",
         type=Path,
-        required=True,
         help="General hashes tmp storage",
     )
     parser.add_argument(
@@ -78,29 +547,84 @@ def main():
         required=True,
         help="Report path",
     )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Index mode: external-sort both indexes by hash and merge-join them (flat memory)",
+    )
+    parser.add_argument(
+        "--run-lines",
+        type=int,
+        default=RUN_LINES,
+        help=f"Lines per sorted run in --stream mode (default {RUN_LINES})",
+    )
+    parser.add_argument(
+        "--cascade",
+        action="store_true",
+        help="Scan --root dirs directly: size -> 64KiB head/tail -> full hash (no index needed)",
+    )
+    parser.add_argument(
+        "--audio-payload",
+        action="store_true",
+        help="Scan --root dirs and pair audio files by encoded audio only (ignores ID3/FLAC/MP4 tags)",
+    )
+    parser.add_argument(
+        "--flac-md5",
+        action="store_true",
+        help="In --cascade mode, pair .flac files by their STREAMINFO audio MD5 without reading them",
+    )
+    parser.add_argument(
+        "--root",
+        type=Path,
+        action="append",
+        default=[],
+        help="Root to scan in --cascade/--audio-payload mode (repeatable)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Concurrent hashes in --cascade/--audio-payload mode",
+    )
+    parser.add_argument(
+        "--cache",
+        type=Path,
+        default=None,
+        help="Optional hash_cache.sqlite for --cascade/--audio-payload hashes",
+    )
+    parser.add_argument(
+        "--store",
+        type=Path,
+        default=None,
+        help="Optional hash_store.sqlite: also record the indexes and the plan there",
+    )
+    parser.add_argument(
+        "--algo",
+        choices=available_algos(),
+        default=DEFAULT_ALGO,
+        help="Hash algorithm in --cascade/--audio-payload mode (index mode reads it from the index header)",
+    )
 
     args = parser.parse_args()
-    base_entries = parse_hash_index(args.hash_index)
-    external_entries = parse_external(args.external)
-
-    merged = collections.defaultdict(list)
-    for h, paths in base_entries.items():
-        merged[h].extend(paths)
-    for h, paths in external_entries.items():
-        merged[h].extend(paths)
+    if args.cascade and args.audio_payload:
+        parser.error("--cascade and --audio-payload are mutually exclusive")
+    if args.cascade or args.audio_payload:
+        if not args.root:
+            parser.error("--cascade/--audio-payload require at least one --root")
+        if args.cascade:
+            plan_cascade(args)
+        else:
+            plan_audio_payload(args)
+    else:
+        if not (args.hash_index and args.external and args.tmp):
+            parser.error("--hash-index, --external and --tmp are required without --cascade/--audio-payload")
+        if args.stream:
+            plan_streaming(args)
+        else:
+            plan_from_indexes(args)
 
-    write_tmp(merged, args.tmp)
-    write_plan(merged, args.plan)
-
-    dupe_hashes = [h for h, p in merged.items() if len(p) > 1]
-    processed = sum(len(p) for p in merged.values())
-
-    with args.report.open("w", encoding="utf-8") as report:
-        report.write("HASH_DUPES_REPORT\n")
-        report.write(f"Roots: {args.external.parents[0]}\n")
-        report.write(f"Archivos procesados: {processed}\n")
-        report.write(f"Hashes con duplicados: {len(dupe_hashes)}\n")
-        report.write(f"Plan: {args.plan}\n")
+    if args.store:
+        record_in_store(args)
 
     print(f"[OK] Plan duplicados: {args.plan}")
     print(f"[OK] Reporte: {args.report}")
@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+Page-cache-friendly bulk reads for DJProducerTools.
+
+Hashing or analysing a whole library reads every file once; left alone, the
+kernel keeps all of it in the page cache and evicts what is actually in use
+(the tracks loaded in Serato, the DJ software's database). Readers here take a
+cache mode:
+  keep    plain reads, kernel defaults
+  drop    POSIX_FADV_SEQUENTIAL + WILLNEED ahead of the reader, DONTNEED behind
+          it and on close. Files that were already mostly resident when opened
+          count as "hot" (someone else is using them) and are left cached.
+  direct  bypass the cache: O_DIRECT with page-aligned buffers on Linux,
+          F_NOCACHE on macOS; falls back to drop where the filesystem refuses it.
+Without posix_fadvise (macOS has none) drop reads plainly. The default is
+drop, or DJPT_CACHE_MODE when set to one of the modes (anything else warns
+and keeps drop).
+
+Read order (--order) matters on spinning drives, where walk order makes the
+head seek across the platter:
+  walk    as listed
+  inode   by (device, inode number), a cheap proxy for on-disk placement
+  extent  by (device, first physical extent) from the FIEMAP ioctl on Linux;
+          files without a mapped extent fall back to inode order
+Files are read in that order batch by batch while results keep input order.
+"""
+import argparse
+import ctypes
+import ctypes.util
+import errno
+import mmap
+import os
+import struct
+import sys
+import threading
+from contextlib import contextmanager
+
+CACHE_MODES = ("keep", "drop", "direct")
+BLOCK_SIZE = 1024 * 1024
+# Readahead requested ahead of the reader, and the step at which consumed pages are dropped.
+WINDOW = 8 * 1024 * 1024
+# Files at least this resident when opened are treated as hot and never dropped.
+HOT_FRACTION = 0.5
+PAGE = mmap.PAGESIZE
+F_NOCACHE = 48  # macOS <sys/fcntl.h>
+ORDERS = ("walk", "inode", "extent")
+# Files reordered at a time: enough to sweep a directory tree, bounded memory.
+ORDER_BATCH = 4096
+FS_IOC_FIEMAP = 0xC020660B
+_FIEMAP = struct.Struct("=QQLLLL")  # fm_start, fm_length, fm_flags, fm_mapped_extents, fm_extent_count, reserved
+_EXTENT = struct.Struct("=QQQQQLLLL")  # fe_logical, fe_physical, fe_length, reserved64[2], fe_flags, reserved[3]
+
+def _default_cache_mode():
+    """DJPT_CACHE_MODE, checked here so a typo does not surface mid-run as a ValueError."""
+    mode = os.environ.get("DJPT_CACHE_MODE", "drop")
+    if mode not in CACHE_MODES:
+        print(f"[WARN] DJPT_CACHE_MODE={mode!r} is not one of {', '.join(CACHE_MODES)}; using drop", file=sys.stderr)
+        return "drop"
+    return mode
+
+
+DEFAULT_CACHE_MODE = _default_cache_mode()
+_HAS_FADVISE = hasattr(os, "posix_fadvise")
+_buffers = threading.local()
+_libc = None
+
+
+def _advise(fd, offset, length, advice):
+    if _HAS_FADVISE:
+        try:
+            os.posix_fadvise(fd, offset, length, advice)
+        except OSError:
+            pass
+
+
+def _libc_mincore():
+    global _libc
+    if _libc is None:
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+            libc.mmap.restype = ctypes.c_void_p
+            libc.mmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_long]
+            libc.munmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+            libc.mincore.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_void_p]
+            _libc = libc
+        except (OSError, AttributeError):
+            _libc = False
+    return _libc
+
+
+def resident_pages(fd, size=None):
+    """(resident, total) pages of an open file in the page cache; (0, 0) when unknown.
+
+    Maps the file without touching it and asks mincore(), so no page is read.
+    """
+    if size is None:
+        size = os.fstat(fd).st_size
+    libc = _libc_mincore()
+    if not libc or size <= 0:
+        return 0, 0
+    addr = libc.mmap(None, size, mmap.PROT_READ, mmap.MAP_SHARED, fd, 0)
+    if addr in (None, ctypes.c_void_p(-1).value):
+        return 0, 0
+    try:
+        pages = (size + PAGE - 1) // PAGE
+        vec = (ctypes.c_ubyte * pages)()
+        if libc.mincore(addr, size, vec) != 0:
+            return 0, 0
+        return pages - bytes(vec).count(0), pages
+    finally:
+        libc.munmap(addr, size)
+
+
+def resident_fraction(path):
+    """Share of path's pages in the page cache (0.0 when unknown or empty)."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        resident, total = resident_pages(fd)
+    finally:
+        os.close(fd)
+    return resident / total if total else 0.0
+
+
+def evict(path):
+    """Drop path's clean pages from the page cache (a no-op without posix_fadvise)."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        _advise(fd, 0, 0, getattr(os, "POSIX_FADV_DONTNEED", 0))
+    finally:
+        os.close(fd)
+
+
+def _is_hot(fd, size):
+    resident, total = resident_pages(fd, size)
+    return bool(total) and resident >= total * HOT_FRACTION
+
+
+def _open_direct(path):
+    """fd opened to bypass the page cache, or None where that is unsupported."""
+    if hasattr(os, "O_DIRECT"):
+        try:
+            return os.open(path, os.O_RDONLY | os.O_DIRECT)
+        except OSError as exc:
+            if exc.errno != errno.EINVAL:  # tmpfs and some FUSE mounts refuse O_DIRECT
+                raise
+            return None
+    if sys.platform == "darwin":
+        import fcntl
+
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            fcntl.fcntl(fd, F_NOCACHE, 1)
+        except OSError:
+            pass
+        return fd
+    return None
+
+
+def _buffer(block_size, aligned):
+    """Per-thread reusable read buffer; page-aligned (anonymous mmap) for O_DIRECT."""
+    key = ("direct" if aligned else "plain", block_size)
+    if getattr(_buffers, "key", None) != key:
+        buf = mmap.mmap(-1, block_size) if aligned else bytearray(block_size)
+        _buffers.key, _buffers.buf, _buffers.view = key, buf, memoryview(buf)
+    return _buffers.buf, _buffers.view
+
+
+def read_chunks(path, mode=DEFAULT_CACHE_MODE, block_size=BLOCK_SIZE):
+    """Yield memoryviews over successive blocks of path, honouring the cache mode.
+
+    Each view is only valid until the next one is requested (the buffer is reused).
+    """
+    if mode not in CACHE_MODES:
+        raise ValueError(f"unknown cache mode: {mode}")
+    fd = None
+    aligned = False
+    if mode == "direct":
+        block_size = max(PAGE, (block_size + PAGE - 1) // PAGE * PAGE)
+        fd = _open_direct(path)
+        aligned = fd is not None and hasattr(os, "O_DIRECT")
+        if fd is None:
+            mode = "drop"
+    if fd is None:
+        fd = os.open(path, os.O_RDONLY)
+    with open(fd, "rb", buffering=0) as fh:
+        size = os.fstat(fd).st_size
+        dropping = mode == "drop" and _HAS_FADVISE and not _is_hot(fd, size)
+        if dropping:
+            _advise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            _advise(fd, 0, WINDOW, os.POSIX_FADV_WILLNEED)
+        buf, view = _buffer(block_size, aligned)
+        pos = dropped = 0
+        while True:
+            n = fh.readinto(buf)
+            if not n:
+                break
+            yield view[:n]
+            pos += n
+            if dropping and pos - dropped >= WINDOW:
+                _advise(fd, pos, WINDOW, os.POSIX_FADV_WILLNEED)
+                _advise(fd, dropped, pos - dropped, os.POSIX_FADV_DONTNEED)
+                dropped = pos
+        if dropping:
+            _advise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+
+
+@contextmanager
+def advised(path, mode=DEFAULT_CACHE_MODE, readahead=0):
+    """Cache hints around a read done by someone else (librosa, soundfile, ffmpeg).
+
+    On entry the first `readahead` bytes are prefetched (0 = none); on exit the
+    file is dropped from the page cache unless it was hot. Third-party decoders
+    cannot use O_DIRECT, so direct behaves like drop here.
+    """
+    if mode == "keep" or not _HAS_FADVISE:
+        yield
+        return
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        yield
+        return
+    hot = _is_hot(fd, os.fstat(fd).st_size)
+    if not hot and readahead > 0:
+        _advise(fd, 0, readahead, os.POSIX_FADV_WILLNEED)
+    try:
+        yield
+    finally:
+        if not hot:
+            _advise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        os.close(fd)
+
+
+def advised_paths(paths, mode=DEFAULT_CACHE_MODE, readahead=0):
+    """Yield paths, each under advised() until the next one is requested."""
+    for path in paths:
+        with advised(path, mode, readahead):
+            yield path
+
+
+def first_extent(path):
+    """Physical byte offset of path's first extent (Linux FIEMAP), or None when unknown."""
+    if not sys.platform.startswith("linux"):
+        return None
+    import fcntl
+
+    buf = bytearray(_FIEMAP.pack(0, 0xFFFFFFFFFFFFFFFF, 0, 0, 1, 0) + bytes(_EXTENT.size))
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return None
+    try:
+        fcntl.ioctl(fd, FS_IOC_FIEMAP, buf)
+    except OSError:  # ENOTTY / EOPNOTSUPP: no FIEMAP on this filesystem
+        return None
+    finally:
+        os.close(fd)
+    if not _FIEMAP.unpack_from(buf)[3]:
+        return None  # empty, inline or not yet allocated
+    return _EXTENT.unpack_from(buf, _FIEMAP.size)[1] or None
+
+
+def physical_key(path, order="inode"):
+    """Sort key placing path where it sits on its device."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return (0, 0, 0)
+    if order == "extent":
+        physical = first_extent(path)
+        if physical is not None:
+            return (st.st_dev, 0, physical)
+    return (st.st_dev, 1, st.st_ino)
+
+
+def physical_order(paths, order="inode"):
+    """paths sorted for reading in the given order (a list; walk keeps input order)."""
+    if order not in ORDERS:
+        raise ValueError(f"unknown read order: {order}")
+    if order == "walk":
+        return list(paths)
+    return sorted(paths, key=lambda p: physical_key(p, order))
+
+
+def batches(items, size=ORDER_BATCH):
+    """Yield lists of up to size consecutive items."""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def add_order_argument(parser):
+    parser.add_argument(
+        "--order",
+        choices=ORDERS,
+        default="walk",
+        help="Read order: walk (default), inode, or extent (FIEMAP first extent; for HDDs). "
+        "Output order does not change.",
+    )
+
+
+def add_cache_mode_argument(parser):
+    parser.add_argument(
+        "--cache-mode",
+        choices=CACHE_MODES,
+        default=DEFAULT_CACHE_MODE,
+        help="Page cache use: keep (kernel default), drop (readahead, then drop files once read; "
+        "default, or DJPT_CACHE_MODE), direct (bypass the cache).",
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Page cache residency of files (mincore).")
+    parser.add_argument("paths", nargs="+", help="Files to inspect")
+    parser.add_argument("--evict", action="store_true", help="Drop the files from the page cache first")
+    args = parser.parse_args()
+    for path in args.paths:
+        try:
+            if args.evict:
+                evict(path)
+            print(f"{resident_fraction(path) * 100:6.1f}%\t{path}")
+        except OSError as exc:
+            print(f"[ERROR] {path}: {exc}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
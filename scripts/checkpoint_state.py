@@ -1,19 +1,216 @@
 # coding: utf-8
+"""
+Checkpoints of the key state files + disk state.
+Files are split into line-aligned, content-defined chunks stored once,
+zlib-compressed, under checkpoints/chunks/<aa>/<sha256>.z; each checkpoint is
+a folder with manifest.json (chunk list per file) and checkpoint.log. A line
+ends a chunk when its CRC matches CUT_MASK, so an edit or an appended line
+only changes the chunks around it and the rest are shared with earlier
+checkpoints. Files whose size and mtime match the previous checkpoint reuse
+its chunk list without being read.
+"""
 import argparse
-import shutil
-import subprocess
+import hashlib
+import json
+import os
+import zlib
 from datetime import datetime
 from pathlib import Path
 
+MANIFEST = "manifest.json"
+CUT_MASK = 0x7FF  # ~1 cut every 2048 lines
+MIN_CHUNK = 64 * 1024
+MAX_CHUNK = 4 * 1024 * 1024
+LEVEL = 6
 
-def df_summary(targets):
+
+def disk_summary(targets):
+    """One df-like line per existing target, from os.statvfs."""
     rows = []
     for t in targets:
-        result = subprocess.run(["df", "-h", str(t)], capture_output=True, text=True, check=True)
-        rows.append(result.stdout.strip())
+        try:
+            st = os.statvfs(t)
+        except OSError:
+            continue
+        total = st.f_blocks * st.f_frsize
+        avail = st.f_bavail * st.f_frsize
+        used = total - st.f_bfree * st.f_frsize
+        pct = round(100 * used / (used + avail)) if used + avail else 0
+        rows.append(f"{t}\tsize {_human(total)}\tused {_human(used)}\tavail {_human(avail)}\t{pct}%")
     return rows
 
 
+def _human(n):
+    for unit in ("B", "K", "M", "G", "T"):
+        if n < 1024 or unit == "T":
+            return f"{n:.1f}{unit}" if unit != "B" else f"{n}B"
+        n /= 1024
+
+
+def iter_chunks(path):
+    """Yield the content-defined chunks of a file (line-aligned, MIN_CHUNK..MAX_CHUNK bytes)."""
+    buf = []
+    size = 0
+    with open(path, "rb") as fh:
+        for line in fh:
+            while len(line) > MAX_CHUNK:  # binary or unterminated data
+                yield b"".join(buf) + line[: MAX_CHUNK - size]
+                line = line[MAX_CHUNK - size :]
+                buf, size = [], 0
+            buf.append(line)
+            size += len(line)
+            if size >= MAX_CHUNK or (size >= MIN_CHUNK and zlib.crc32(line) & CUT_MASK == 0):
+                yield b"".join(buf)
+                buf, size = [], 0
+    if buf:
+        yield b"".join(buf)
+
+
+class ChunkStore:
+    """Compressed chunks keyed by sha256, one file each."""
+
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def path(self, digest):
+        return self.root / digest[:2] / f"{digest}.z"
+
+    def put(self, data):
+        """Store data once; returns (digest, bytes written)."""
+        digest = hashlib.sha256(data).hexdigest()
+        target = self.path(digest)
+        if target.exists():
+            return digest, 0
+        target.parent.mkdir(parents=True, exist_ok=True)
+        packed = zlib.compress(data, LEVEL)
+        tmp = target.with_suffix(".tmp")
+        tmp.write_bytes(packed)
+        os.replace(tmp, target)
+        return digest, len(packed)
+
+    def get(self, digest):
+        data = zlib.decompress(self.path(digest).read_bytes())
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise ValueError(f"chunk corrupto: {digest}")
+        return data
+
+    def digests(self):
+        for p in self.root.glob("*/*.z"):
+            yield p.stem
+
+
+def checkpoints(chk_root):
+    """Checkpoint folders with a manifest, oldest first."""
+    return sorted(p.parent for p in chk_root.glob(f"*/{MANIFEST}"))
+
+
+def load_manifest(folder):
+    with (folder / MANIFEST).open(encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+def save(chk_root, files, desc, disk_targets):
+    """Write a new checkpoint; returns (folder, stats)."""
+    store = ChunkStore(chk_root / "chunks")
+    previous = {}
+    existing = checkpoints(chk_root)
+    if existing:
+        previous = {f["source"]: f for f in load_manifest(existing[-1])["files"]}
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    dest = chk_root / timestamp
+    n = 1
+    while dest.exists():
+        dest = chk_root / f"{timestamp}_{n}"
+        n += 1
+    dest.mkdir(parents=True)
+    stats = {"files": 0, "reused": 0, "bytes": 0, "chunks": 0, "new_chunks": 0, "stored": 0}
+    entries = []
+    log_lines = [f"{datetime.now().isoformat()} - {desc}"]
+    for candidate in files:
+        if not candidate.exists():
+            continue
+        st = candidate.stat()
+        prev = previous.get(str(candidate))
+        if prev and prev["size"] == st.st_size and prev["mtime_ns"] == st.st_mtime_ns:
+            entry = dict(prev, name=candidate.name)
+            stats["reused"] += 1
+            log_lines.append(f"unchanged {candidate}")
+        else:
+            whole = hashlib.sha256()
+            chunks = []
+            for data in iter_chunks(candidate):
+                whole.update(data)
+                digest, written = store.put(data)
+                chunks.append(digest)
+                if written:
+                    stats["new_chunks"] += 1
+                    stats["stored"] += written
+            entry = {
+                "name": candidate.name,
+                "source": str(candidate),
+                "size": st.st_size,
+                "mtime_ns": st.st_mtime_ns,
+                "sha256": whole.hexdigest(),
+                "chunks": chunks,
+            }
+            log_lines.append(f"stored {candidate} ({len(chunks)} chunks)")
+        stats["files"] += 1
+        stats["bytes"] += entry["size"]
+        stats["chunks"] += len(entry["chunks"])
+        entries.append(entry)
+    disk = disk_summary(disk_targets)
+    log_lines.append("disk summary:")
+    log_lines.extend(disk)
+    (dest / "checkpoint.log").write_text("\n".join(log_lines) + "\n", encoding="utf-8")
+    manifest = {"created": datetime.now().isoformat(), "desc": desc, "files": entries, "disk": disk}
+    tmp = dest / (MANIFEST + ".tmp")
+    tmp.write_text(json.dumps(manifest, indent=1), encoding="utf-8")
+    os.replace(tmp, dest / MANIFEST)  # a checkpoint exists once its manifest does
+    return dest, stats
+
+
+def restore(chk_root, folder, target_dir):
+    """Rebuild every file of a checkpoint into target_dir (whole-file sha256 checked)."""
+    store = ChunkStore(chk_root / "chunks")
+    target_dir.mkdir(parents=True, exist_ok=True)
+    restored = []
+    for entry in load_manifest(folder)["files"]:
+        out = target_dir / entry["name"]
+        tmp = out.with_name(out.name + ".tmp")
+        whole = hashlib.sha256()
+        with tmp.open("wb") as fh:
+            for digest in entry["chunks"]:
+                data = store.get(digest)
+                whole.update(data)
+                fh.write(data)
+        if whole.hexdigest() != entry["sha256"]:
+            tmp.unlink()
+            raise ValueError(f"sha256 distinto al restaurar {entry['name']}")
+        os.replace(tmp, out)
+        os.utime(out, ns=(entry["mtime_ns"], entry["mtime_ns"]))
+        restored.append(out)
+    return restored
+
+
+def gc(chk_root):
+    """Delete chunks no manifest references (after checkpoint folders were removed)."""
+    store = ChunkStore(chk_root / "chunks")
+    live = set()
+    for folder in checkpoints(chk_root):
+        for entry in load_manifest(folder)["files"]:
+            live.update(entry["chunks"])
+    removed = 0
+    for digest in list(store.digests()):
+        if digest not in live:
+            store.path(digest).unlink()
+            removed += 1
+    return removed
+
+
+def _dir_size(path):
+    return sum(p.stat().st_size for p in path.rglob("*") if p.is_file())
+
+
 def main():
     parser = argparse.ArgumentParser(description="Save checkpoint of key files + disk state.")
     parser.add_argument(
@@ -34,37 +231,53 @@ def main():
         default="manual checkpoint",
         help="Short description of this checkpoint.",
     )
+    parser.add_argument("--list", action="store_true", help="List checkpoints and exit.")
+    parser.add_argument("--restore", type=str, default=None, help="Checkpoint id (folder name) to restore.")
+    parser.add_argument(
+        "--to", type=Path, default=None, help="Restore target folder (default: <checkpoint>/restored)."
+    )
+    parser.add_argument("--gc", action="store_true", help="Remove chunks no checkpoint uses anymore.")
 
     args = parser.parse_args()
     base = args.base
     state_dir = args.state_dir or base / "_DJProducerTools"
     chk_root = state_dir / "checkpoints"
-    chk_root.mkdir(exist_ok=True)
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    dest = chk_root / timestamp
-    dest.mkdir()
+    chk_root.mkdir(parents=True, exist_ok=True)
+
+    if args.list:
+        for folder in checkpoints(chk_root):
+            m = load_manifest(folder)
+            size = sum(f["size"] for f in m["files"])
+            print(f"{folder.name}\t{len(m['files'])} files\t{_human(size)}\t{m['desc']}")
+        return
+    if args.restore:
+        folder = chk_root / args.restore
+        if not (folder / MANIFEST).exists():
+            print(f"[ERROR] No existe el checkpoint (o no tiene {MANIFEST}): {folder}")
+            raise SystemExit(1)
+        for out in restore(chk_root, folder, args.to or folder / "restored"):
+            print(f"[OK] restaurado {out}")
+        return
+    if args.gc:
+        print(f"[OK] chunks eliminados: {gc(chk_root)}")
+        return
+
     files_to_copy = [
         state_dir / "reports" / "hash_index.tsv",
         state_dir / "reports" / "general_hash_dupes_report.txt",
         state_dir / "plans" / "general_hash_dupes_plan.tsv",
+        state_dir / "plans" / "dupes_plan.tsv",
+        state_dir / "plans" / "consolidation_plan.tsv",
+        state_dir / "external_hashes.tsv",
     ]
-    if (state_dir / "plans" / "consolidation_plan.tsv").exists():
-        files_to_copy.append(state_dir / "plans" / "consolidation_plan.tsv")
-    if (state_dir / "external_hashes.tsv").exists():
-        files_to_copy.append(state_dir / "external_hashes.tsv")
-    log = dest / "checkpoint.log"
-    with log.open("w", encoding="utf-8") as fh:
-        fh.write(f"{datetime.now().isoformat()} - {args.desc}\n")
-        for candidate in files_to_copy:
-            if candidate.exists():
-                target = dest / candidate.name
-                shutil.copy2(candidate, target)
-                fh.write(f"copied {candidate} -> {target}\n")
-        fh.write("df summary:\n")
-        for line in df_summary([base, Path("/Volumes/SanDisk SSD"), Path("/Volumes/samsung PSSDT7")]):
-            fh.write(line + "\n")
-
-    print(f"[CHECKPOINT] saved to {dest}")
+    dest, stats = save(
+        chk_root, files_to_copy, args.desc, [base, Path("/Volumes/SanDisk SSD"), Path("/Volumes/samsung PSSDT7")]
+    )
+    print(
+        f"[CHECKPOINT] saved to {dest} | archivos {stats['files']} ({stats['reused']} sin cambios) | "
+        f"{_human(stats['bytes'])} en {stats['chunks']} chunks, nuevos {stats['new_chunks']} "
+        f"({_human(stats['stored'])} comprimidos) | store total {_human(_dir_size(chk_root / 'chunks'))}"
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Persistent content-hash cache for DJProducerTools.
+Digests are keyed on (st_dev, st_ino, st_size, st_mtime_ns), so moved/renamed
+files on the same volume reuse their digest and only new or modified files are
+read. Volumes that get a new st_dev on remount simply miss the cache.
+
+CLI:
+  digest  read paths from stdin, print "digest<TAB>path" (used by action_9_hash_index)
+  stats   print number of cached entries
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import threading
+from functools import partial
+from pathlib import Path
+
+from hash_root import DEFAULT_ALGO, available_algos, hash_file
+
+COMMIT_EVERY = 500
+
+
+class HashCache:
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.hits = 0
+        self.misses = 0
+        self.conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS file_hashes ("
+            " dev INTEGER, ino INTEGER, size INTEGER, mtime_ns INTEGER,"
+            " algo TEXT, digest TEXT,"
+            " PRIMARY KEY (dev, ino, size, mtime_ns, algo))"
+        )
+
+    def lookup(self, st, algo=DEFAULT_ALGO):
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT digest FROM file_hashes WHERE dev=? AND ino=? AND size=? AND mtime_ns=? AND algo=?",
+                (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns, algo),
+            ).fetchone()
+        return row[0] if row else None
+
+    def store(self, st, digest, algo=DEFAULT_ALGO):
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO file_hashes VALUES (?, ?, ?, ?, ?, ?)",
+                (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns, algo, digest),
+            )
+            self._pending += 1
+            if self._pending >= COMMIT_EVERY:
+                self.conn.commit()
+                self._pending = 0
+
+    def cached(self, hash_func, algo=DEFAULT_ALGO):
+        """Wrap hash_func(path) so cache hits skip reading the file."""
+
+        def wrapper(path):
+            st = os.stat(path)
+            digest = self.lookup(st, algo)
+            with self._lock:
+                if digest is not None:
+                    self.hits += 1
+                else:
+                    self.misses += 1
+            if digest is not None:
+                return digest
+            digest = hash_func(path)
+            after = os.stat(path)
+            # Only trust the digest if the file did not change while we read it.
+            if (after.st_size, after.st_mtime_ns) == (st.st_size, st.st_mtime_ns):
+                self.store(st, digest, algo)
+            return digest
+
+        return wrapper
+
+    def count(self):
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM file_hashes").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self.conn.commit()
+            self.conn.close()
+
+
+def digest_stream(cache, lines, out, algo=DEFAULT_ALGO):
+    hasher = cache.cached(partial(hash_file, algo=algo), algo)
+    for line in lines:
+        path = line.rstrip("\n")
+        if not path:
+            continue
+        try:
+            digest = hasher(path)
+        except OSError:
+            digest = ""
+        print(f"{digest}\t{path}", file=out, flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stat-keyed hash cache (dev, inode, size, mtime_ns).")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    d = subparsers.add_parser("digest", help="Hash paths read from stdin using the cache")
+    d.add_argument("--cache", type=Path, required=True, help="hash_cache.sqlite path")
+    d.add_argument("--algo", choices=available_algos(), default=DEFAULT_ALGO, help="Digest algorithm")
+    s = subparsers.add_parser("stats", help="Show cache size")
+    s.add_argument("--cache", type=Path, required=True, help="hash_cache.sqlite path")
+    args = parser.parse_args()
+
+    cache = HashCache(args.cache)
+    try:
+        if args.command == "digest":
+            digest_stream(cache, sys.stdin, sys.stdout, args.algo)
+            print(f"[INFO] Cache hits: {cache.hits}, hashed: {cache.misses}", file=sys.stderr)
+        elif args.command == "stats":
+            print(f"[INFO] {args.cache}: {cache.count()} cached digests")
+    finally:
+        cache.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Streaming comparison of two hash indexes for DJProducerTools.
+Both indexes (hash_index.tsv "hash, rel, full" or external "hash, full") are
+external-sorted into runs on disk and merge-joined in one pass, so neither is
+ever held in memory and no awk/sort/comm/join temp files are left behind.
+- --by hash: content comparison. Entries whose digest is absent from the
+  other index go to --missing-in-b (only in A) / --missing-in-a (only in B)
+  as "hash<TAB>path".
+- --by path: mirror check keyed on the relative path. Entries only in one
+  side are written as "rel<TAB>hash"; same path with another digest goes to
+  --mismatch as "rel<TAB>A:hash<TAB>B:hash".
+--parallel sorts A and B in two processes. Phase timings go to stderr.
+"""
+import argparse
+import collections
+import itertools
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from hash_root import INDEX_HEADER_PREFIX, read_index_options
+from sorted_index import RUN_LINES, merge_runs, sorted_runs
+
+
+def keyed_lines(path, by):
+    """Lines "key<TAB>value" of an index: hash/full path (--by hash) or rel/hash (--by path)."""
+    header = INDEX_HEADER_PREFIX.encode()
+    with open(path, "rb") as fh:
+        for line in fh:
+            if line.startswith(header):
+                continue
+            parts = line.rstrip(b"\n").split(b"\t", 2)
+            if len(parts) < 2:
+                continue
+            if by == "path":
+                yield b"%s\t%s\n" % (parts[1], parts[0])
+            else:
+                yield b"%s\t%s\n" % (parts[0], parts[-1])
+
+
+def sort_index(path, by, tmp_dir, run_lines=RUN_LINES):
+    """(sorted run paths, seconds) for one index."""
+    start = time.monotonic()
+    runs = sorted_runs(keyed_lines(path, by), tmp_dir, run_lines)
+    return runs, time.monotonic() - start
+
+
+def grouped(runs):
+    """Yield (key, [values]) in key order from sorted runs (removed once read)."""
+    for key, lines in itertools.groupby(merge_runs(runs), key=lambda line: line.split(b"\t", 1)[0]):
+        yield key, [line.rstrip(b"\n").split(b"\t", 1)[1] for line in lines]
+
+
+def merge_join(a, b):
+    """Yield (key, values_a, values_b) over two key-ordered group streams; a missing side is []."""
+    ga = next(a, None)
+    gb = next(b, None)
+    while ga is not None or gb is not None:
+        if gb is None or (ga is not None and ga[0] < gb[0]):
+            yield ga[0], ga[1], []
+            ga = next(a, None)
+        elif ga is None or gb[0] < ga[0]:
+            yield gb[0], [], gb[1]
+            gb = next(b, None)
+        else:
+            yield ga[0], ga[1], gb[1]
+            ga = next(a, None)
+            gb = next(b, None)
+
+
+def compare(runs_a, runs_b, by, outputs, stats):
+    """Merge-join the sorted runs and write the MISSING_IN_B / MISSING_IN_A / MISMATCH lines."""
+    for key, va, vb in merge_join(grouped(runs_a), grouped(runs_b)):
+        if va and vb:
+            if by == "path" and va[0] != vb[0]:
+                stats["MISMATCH"] += 1
+                outputs["MISMATCH"].write(b"%s\tA:%s\tB:%s\n" % (key, va[0], vb[0]))
+            continue
+        status = "MISSING_IN_B" if va else "MISSING_IN_A"
+        values = va or vb
+        stats[status] += len(values)
+        if by == "path":
+            outputs[status].write(b"%s\t%s\n" % (key, values[0]))
+        else:
+            outputs[status].writelines(b"%s\t%s\n" % (key, v) for v in values)
+
+
+class _StatusWriter:
+    """stdout target: prefixes each line with its status, like merkle_index.py diff."""
+
+    def __init__(self, status):
+        self.prefix = status.encode() + b"\t"
+
+    def write(self, line):
+        sys.stdout.buffer.write(self.prefix + line)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Streaming merge-join comparison of two hash indexes.")
+    parser.add_argument("--a", type=Path, required=True, help="Index A")
+    parser.add_argument("--b", type=Path, required=True, help="Index B")
+    parser.add_argument(
+        "--by",
+        choices=("hash", "path"),
+        default="hash",
+        help="hash: content present on one side only; path: mirror check by relative path",
+    )
+    parser.add_argument("--missing-in-b", type=Path, default=None, help="Write entries only in A here")
+    parser.add_argument("--missing-in-a", type=Path, default=None, help="Write entries only in B here")
+    parser.add_argument("--mismatch", type=Path, default=None, help="--by path: same path, other digest")
+    parser.add_argument("--parallel", action="store_true", help="Sort A and B in two processes")
+    parser.add_argument(
+        "--run-lines", type=int, default=RUN_LINES, help=f"Lines per sorted run (default {RUN_LINES})"
+    )
+    parser.add_argument("--tmp-dir", type=Path, default=None, help="Directory for sorted runs (default: A's)")
+    args = parser.parse_args()
+
+    for path in (args.a, args.b):
+        if not path.is_file():
+            print(f"[ERROR] No existe: {path}", file=sys.stderr)
+            sys.exit(1)
+    algo_a = read_index_options(args.a)["algo"]
+    algo_b = read_index_options(args.b)["algo"]
+    if algo_a != algo_b:
+        print(f"[ERROR] {args.a} uses {algo_a} but {args.b} uses {algo_b}.", file=sys.stderr)
+        sys.exit(1)
+    tmp_dir = args.tmp_dir or args.a.resolve().parent
+
+    started = time.monotonic()
+    jobs = [(args.a, args.by, tmp_dir, args.run_lines), (args.b, args.by, tmp_dir, args.run_lines)]
+    if args.parallel:
+        with ProcessPoolExecutor(max_workers=2) as pool:
+            futures = [pool.submit(sort_index, *job) for job in jobs]
+            (runs_a, sort_a), (runs_b, sort_b) = [f.result() for f in futures]
+    else:
+        (runs_a, sort_a), (runs_b, sort_b) = [sort_index(*job) for job in jobs]
+    sorted_at = time.monotonic()
+
+    paths = {"MISSING_IN_B": args.missing_in_b, "MISSING_IN_A": args.missing_in_a, "MISMATCH": args.mismatch}
+    stats = collections.Counter()
+    handles = {}
+    try:
+        for status, path in paths.items():
+            handles[status] = path.open("wb") if path else _StatusWriter(status)
+        compare(runs_a, runs_b, args.by, handles, stats)
+    finally:
+        for status, fh in handles.items():
+            if paths[status]:
+                fh.close()
+        # Runs of an interrupted join are still on disk.
+        for run in runs_a + runs_b:
+            if os.path.exists(run):
+                os.unlink(run)
+    finished = time.monotonic()
+
+    print(
+        f"[INFO] Fases: ordenar A {sort_a:.2f}s | ordenar B {sort_b:.2f}s"
+        f"{' (en paralelo)' if args.parallel else ''} | ordenación total {sorted_at - started:.2f}s"
+        f" | merge-join {finished - sorted_at:.2f}s | total {finished - started:.2f}s",
+        file=sys.stderr,
+    )
+    print(
+        f"[OK] Solo en A: {stats['MISSING_IN_B']} | Solo en B: {stats['MISSING_IN_A']}"
+        f" | Hash distinto: {stats['MISMATCH']}",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Build reports/hash_index.tsv (hash<TAB>rel<TAB>full) in a single process.
+Used by action_9_hash_index instead of one shasum+awk per file.
+- Parallel hashing (hash_root.hash_paths) with optional stat-keyed cache.
+- --flac-md5 identifies .flac files by their STREAMINFO audio MD5 (see
+  audio_payload.flac_md5) instead of reading them.
+- --progress prints "PROGRESS<TAB>percent<TAB>rel" lines that the shell feeds
+  to status_line.
+- The index is written to a temp file and atomically replaces --out at the end.
+"""
+import argparse
+import os
+import sys
+import time
+from functools import partial
+from pathlib import Path
+
+from bulk_reader import add_cache_mode_argument, add_order_argument
+from hash_root import DEFAULT_ALGO, available_algos, hash_file, hash_paths, index_header, walk_files
+
+PROGRESS_INTERVAL = 0.1
+
+
+def build_index(
+    root,
+    out_path,
+    hash_func,
+    algo=DEFAULT_ALGO,
+    workers=1,
+    io_per_device=0,
+    progress=None,
+    flac_md5=False,
+    order="walk",
+):
+    """Write the index for root to out_path atomically; return files indexed."""
+    files = [path for path, _ in walk_files([root])]
+    total = len(files)
+    prefix = str(root).rstrip(os.sep) + os.sep
+    tmp_path = out_path.with_name(f".{out_path.name}.{os.getpid()}.tmp")
+    written = 0
+    last = 0.0
+    try:
+        # surrogateescape writes non-UTF-8 file names back as their original bytes.
+        with tmp_path.open("w", encoding="utf-8", errors="surrogateescape") as out:
+            out.write(index_header(algo, flac_md5))
+            for count, (path, digest) in enumerate(
+                hash_paths(files, workers=workers, io_per_device=io_per_device, hash_func=hash_func, order=order), 1
+            ):
+                rel = path[len(prefix):] if path.startswith(prefix) else path
+                if digest is not None:
+                    out.write(f"{digest}\t{rel}\t{path}\n")
+                    written += 1
+                now = time.monotonic()
+                if progress and (now - last >= PROGRESS_INTERVAL or count == total):
+                    last = now
+                    progress(count * 100 // total, rel)
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp_path, out_path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build hash_index.tsv (hash, rel, full path).")
+    parser.add_argument("--root", required=True, type=Path, help="BASE_PATH to index")
+    parser.add_argument("--out", required=True, type=Path, help="hash_index.tsv to (re)write")
+    parser.add_argument("--algo", choices=available_algos(), default=DEFAULT_ALGO, help="Digest algorithm")
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent hashes (default 4)")
+    parser.add_argument("--io-per-device", type=int, default=0, help="Max concurrent reads per device (0 = no limit)")
+    parser.add_argument("--cache", type=Path, default=None, help="Optional hash_cache.sqlite")
+    parser.add_argument("--flac-md5", action="store_true", help="Use the STREAMINFO MD5 of .flac files")
+    parser.add_argument("--progress", action="store_true", help="Print PROGRESS lines for status_line")
+    add_cache_mode_argument(parser)
+    add_order_argument(parser)
+    args = parser.parse_args()
+
+    root = args.root.expanduser()
+    if not root.is_dir():
+        print(f"[ERROR] root '{root}' is not a directory.", file=sys.stderr)
+        sys.exit(1)
+    args.out.parent.mkdir(parents=True, exist_ok=True)
+
+    cache = None
+    hash_func = partial(hash_file, algo=args.algo, cache_mode=args.cache_mode)
+    if args.cache:
+        from hash_cache import HashCache
+
+        cache = HashCache(args.cache)
+        hash_func = cache.cached(hash_func, args.algo)
+    if args.flac_md5:
+        from audio_payload import with_flac_md5
+
+        hash_func = with_flac_md5(hash_func)
+
+    def report(percent, rel):
+        shown = os.fsencode(rel).decode("utf-8", "replace")
+        print(f"PROGRESS\t{percent}\t{shown}", flush=True)
+
+    try:
+        written = build_index(
+            root,
+            args.out,
+            hash_func,
+            algo=args.algo,
+            workers=args.workers,
+            io_per_device=args.io_per_device,
+            progress=report if args.progress else None,
+            flac_md5=args.flac_md5,
+            order=args.order,
+        )
+    finally:
+        if cache is not None:
+            cache.close()
+    print(f"[INFO] {args.out}: {written} files indexed under '{root}'.", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
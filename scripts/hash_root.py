@@ -1,19 +1,397 @@
 #!/usr/bin/env python3
 import argparse
+import collections
 import hashlib
+import json
+import mmap
 import os
+import stat
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from functools import partial
 from pathlib import Path
 
+from bulk_reader import add_cache_mode_argument, add_order_argument, advised, read_chunks
 
-def sha256_file(path):
-    h = hashlib.sha256()
-    with open(path, "rb") as fh:
-        for chunk in iter(lambda: fh.read(1024 * 1024), b""):
+try:
+    import xxhash  # type: ignore
+except Exception:
+    xxhash = None
+
+DEFAULT_ALGO = "sha256"
+BLOCK_SIZE = 1024 * 1024
+# Versioned first line of hash indexes; no tabs so TSV/awk consumers skip it.
+INDEX_HEADER_PREFIX = "# djpt-hash-index"
+INDEX_VERSION = 1
+# Header of the sorted path sidecar: bytes of the TSV it already covers.
+COVERS_PREFIX = b"# covers="
+# Digest column of .flac files identified by their STREAMINFO MD5 (--flac-md5).
+FLAC_MD5_PREFIX = "flacmd5:"
+# Session journal: fsync the TSV and record progress every SYNC_EVERY files or SYNC_SECONDS.
+SESSION_VERSION = 1
+SYNC_EVERY = 256
+SYNC_SECONDS = 5.0
+
+
+def available_algos():
+    algos = ["sha256", "blake2b"]
+    if xxhash is not None:
+        algos.append("xxh3_128")
+    return algos
+
+
+def new_hasher(algo):
+    if algo == "sha256":
+        return hashlib.sha256()
+    if algo == "blake2b":
+        return hashlib.blake2b(digest_size=32)
+    if algo == "xxh3_128" and xxhash is not None:
+        return xxhash.xxh3_128()
+    raise ValueError(f"unknown or unavailable hash algorithm: {algo}")
+
+
+_buffers = threading.local()
+
+
+def _read_buffer(block_size):
+    """Per-thread reusable buffer, so hashing millions of files allocates nothing per read."""
+    buf = getattr(_buffers, "buf", None)
+    if buf is None or len(buf) != block_size:
+        buf = _buffers.buf = bytearray(block_size)
+        _buffers.view = memoryview(buf)
+    return buf, _buffers.view
+
+
+def hash_file(path, algo=DEFAULT_ALGO, block_size=BLOCK_SIZE, mmap_min_size=0, cache_mode="keep"):
+    """Hex digest of a file.
+
+    Reads with readinto() into a reused buffer; files of at least mmap_min_size
+    bytes (when > 0) are mapped and hashed without any copy. Other files read
+    through bulk_reader unless cache_mode is "keep". Under "drop" a mapped file
+    is dropped from the page cache afterwards unless it was hot; "direct"
+    cannot map (mapped pages always go through the cache) and ignores
+    mmap_min_size.
+    """
+    h = new_hasher(algo)
+    mapped = cache_mode == "drop" and mmap_min_size > 0 and os.stat(path).st_size >= mmap_min_size
+    if cache_mode != "keep" and not mapped:
+        for chunk in read_chunks(path, cache_mode, block_size):
             h.update(chunk)
+        return h.hexdigest()
+    with advised(path, cache_mode), open(path, "rb", buffering=0) as fh:
+        if mmap_min_size > 0 and os.fstat(fh.fileno()).st_size >= mmap_min_size:
+            with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                h.update(mm)
+            return h.hexdigest()
+        buf, view = _read_buffer(block_size)
+        while True:
+            n = fh.readinto(buf)
+            if not n:
+                break
+            h.update(view[:n])
     return h.hexdigest()
 
 
+def sha256_file(path):
+    return hash_file(path, "sha256")
+
+
+def index_header(algo, flac_md5=False):
+    flac = " flac=md5" if flac_md5 else ""
+    return f"{INDEX_HEADER_PREFIX} v{INDEX_VERSION} algo={algo}{flac}\n"
+
+
+def read_index_options(path):
+    """key=value options of an index header; unversioned legacy indexes are plain sha256."""
+    options = {"algo": DEFAULT_ALGO, "flac": ""}
+    with open(path, "r", encoding="utf-8", errors="ignore") as fh:
+        first = fh.readline()
+    if first.startswith(INDEX_HEADER_PREFIX):
+        for token in first.split():
+            key, sep, value = token.partition("=")
+            if sep:
+                options[key] = value
+    return options
+
+
+def read_index_algo(path):
+    """Algorithm recorded in an index header; unversioned legacy indexes are sha256."""
+    return read_index_options(path)["algo"]
+
+
+class DeviceLimiter:
+    """Caps concurrent reads per device (st_dev) so one slow disk is not hit by every worker."""
+
+    def __init__(self, per_device):
+        self.per_device = per_device
+        self._lock = threading.Lock()
+        self._slots = {}
+
+    def slot(self, path):
+        if self.per_device <= 0:
+            return nullcontext()
+        dev = os.stat(path).st_dev
+        with self._lock:
+            sem = self._slots.get(dev)
+            if sem is None:
+                sem = self._slots[dev] = threading.BoundedSemaphore(self.per_device)
+        return sem
+
+
+def hash_paths(paths, workers=1, io_per_device=0, hash_func=sha256_file, order="walk"):
+    """Yield (path, digest) in input order; digest is None for unreadable files.
+
+    With workers > 1 files are hashed on a thread pool (hashlib releases the GIL
+    on large buffers) while results are still handed back in order, so the
+    caller stays the single writer of the output file. With order "inode" or
+    "extent" each batch of ORDER_BATCH files is read in on-disk order (see
+    bulk_reader.physical_order) and then handed back in input order.
+    """
+    if order != "walk":
+        from bulk_reader import batches, physical_order
+
+        for batch in batches(paths):
+            scheduled = physical_order(batch, order)
+            digests = dict(hash_paths(scheduled, workers, io_per_device, hash_func))
+            for path in batch:
+                yield path, digests[path]
+        return
+
+    limiter = DeviceLimiter(io_per_device)
+
+    def task(path):
+        try:
+            with limiter.slot(path):
+                return hash_func(path)
+        except OSError:  # unreadable, or deleted/unmounted since the walk
+            return None
+
+    if workers <= 1:
+        for path in paths:
+            yield path, task(path)
+        return
+
+    window = workers * 4
+    pending = collections.deque()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        try:
+            for path in paths:
+                pending.append((path, pool.submit(task, path)))
+                if len(pending) >= window:
+                    done_path, fut = pending.popleft()
+                    yield done_path, fut.result()
+            while pending:
+                done_path, fut = pending.popleft()
+                yield done_path, fut.result()
+        finally:
+            for _, fut in pending:
+                fut.cancel()
+
+
+def walk_files(roots):
+    """Yield (path, size) for regular files under roots, in walk order."""
+    for root in roots:
+        for dirpath, _, filenames in os.walk(root):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.lstat(path)
+                except OSError:
+                    continue
+                if stat.S_ISREG(st.st_mode):
+                    yield path, st.st_size
+
+
+def covers_header(offset):
+    return COVERS_PREFIX + b"%d\n" % offset
+
+
+def path_index_file(external_file):
+    return external_file.with_name(external_file.name + ".paths")
+
+
+def _tsv_paths(fh, consumed):
+    for line in fh:
+        if not line.endswith(b"\n"):
+            break  # torn last line: left for the next refresh
+        consumed[0] += len(line)
+        parts = line.split(b"\t", 1)
+        if len(parts) == 2:
+            yield parts[1]
+
+
+def covered_offset(external_file):
+    """Bytes of external_file covered by its path sidecar, or -1 without a usable sidecar."""
+    sidecar = path_index_file(external_file)
+    if not sidecar.exists():
+        return -1
+    with sidecar.open("rb") as fh:
+        header = fh.readline()
+    if header.startswith(COVERS_PREFIX):
+        return int(header[len(COVERS_PREFIX):])
+    return -1
+
+
+def refresh_path_index(external_file):
+    """Return an O(log n) lookup of every path already in external_file.
+
+    Paths live in a sorted sidecar (<external>.paths) searched through mmap.
+    Its header records how many bytes of the TSV it covers, so only lines
+    appended since then are sorted and merged in; memory stays flat however
+    large the index grows.
+    """
+    from sorted_index import SortedLines, merge_into, sorted_runs, write_sorted
+
+    sidecar = path_index_file(external_file)
+    size = external_file.stat().st_size if external_file.exists() else 0
+    covered = covered_offset(external_file)
+    if covered < 0 or covered > size:
+        covered = 0
+        write_sorted([], sidecar, header=covers_header(0))
+    if covered < size:
+        consumed = [covered]
+        with open(external_file, "rb") as fh:
+            fh.seek(covered)
+            runs = sorted_runs(_tsv_paths(fh, consumed), sidecar.parent)
+        merge_into(sidecar, len(covers_header(covered)), runs, header=covers_header(consumed[0]))
+        covered = consumed[0]
+    return SortedLines(sidecar, len(covers_header(covered)))
+
+
+def _valid_line(line):
+    if line.startswith(b"#"):
+        return True
+    digest, sep, path = line.partition(b"\t")
+    if digest.startswith(FLAC_MD5_PREFIX.encode()):
+        digest = digest[len(FLAC_MD5_PREFIX):]
+    return bool(sep and digest and path.strip()) and not digest.strip(b"0123456789abcdef") and b"\0" not in line
+
+
+def recover_index(external_file, committed=-1):
+    """Cut the torn tail of external_file; return bytes dropped.
+
+    The tail is an unterminated last line and, when `committed` (an offset
+    known to be fsynced and line aligned, from the journal or sidecar) is
+    given, any malformed lines after the last good one past it. Only that part
+    is checked, so recovery stays cheap on large indexes. Malformed lines
+    followed by good ones are left alone (readers skip them): cutting there
+    would lose every good line after them.
+    """
+    if not external_file.exists():
+        return 0
+    with open(external_file, "r+b") as fh:
+        size = os.fstat(fh.fileno()).st_size
+        journaled = 0 <= committed <= size
+        complete = last_good = committed if journaled else 0
+        fh.seek(complete)
+        for line in fh:
+            if not line.endswith(b"\n"):
+                break
+            complete += len(line)
+            if _valid_line(line):
+                last_good = complete
+        good = last_good if journaled else complete
+        if good == size:
+            return 0
+        fh.truncate(good)
+        fh.flush()
+        os.fsync(fh.fileno())
+    return size - good
+
+
+def session_file(external_file):
+    return external_file.with_name(external_file.name + ".session")
+
+
+def load_session(path):
+    """Journal of an unfinished run, or None when there is none (or it is unreadable)."""
+    try:
+        with open(path, "r", encoding="utf-8") as fh:
+            data = json.load(fh)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(data, dict) or data.get("version") != SESSION_VERSION:
+        return None
+    return data
+
+
+class HashSession:
+    """Journal of a hash_root run: fsynced TSV offset, directory cursor and file count.
+
+    Saved atomically after each fsync of the TSV, so after a crash or Ctrl-C
+    the journal never points past data that is on disk.
+    """
+
+    def __init__(self, path, root, algo, hashed=0):
+        self.path = path
+        self.root = str(root)
+        self.algo = algo
+        self.hashed = hashed
+
+    def save(self, offset, cursor):
+        data = {
+            "version": SESSION_VERSION,
+            "root": self.root,
+            "algo": self.algo,
+            "offset": offset,
+            "cursor": list(cursor),
+            "hashed": self.hashed,
+            "updated": int(time.time()),
+        }
+        tmp = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(data, fh)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp, self.path)
+
+    def finish(self):
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def dir_parts(root, path):
+    """Directory of path relative to root, as a tuple of components."""
+    rel = os.path.dirname(path)[len(str(root)):].strip(os.sep)
+    return tuple(rel.split(os.sep)) if rel else ()
+
+
+def iter_new_files(root, existing, cursor=()):
+    """Yield files under root not in existing, walking directories in sorted order.
+
+    Sorted top-down order makes the walk repeatable: every directory whose
+    components sort before cursor was finished by an earlier session and is
+    neither listed nor descended into; ancestors of cursor only contribute the
+    subdirectories still ahead of it.
+    """
+    stack = [(str(root), ())]
+    while stack:
+        top, parts = stack.pop()
+        try:
+            with os.scandir(top) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except OSError:
+            continue
+        subdirs = []
+        for entry in entries:
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            if is_dir:
+                child = parts + (entry.name,)
+                if not entry.is_symlink() and child >= cursor[: len(child)]:
+                    subdirs.append((entry.path, child))
+            elif parts >= cursor and entry.path not in existing:
+                yield entry.path
+        stack.extend(reversed(subdirs))
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="Hash a root path and append results to an external hashes index."
@@ -31,6 +409,63 @@ def main():
         default=0,
         help="Limit the number of files hashed this run (0 = no limit).",
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of files hashed concurrently (default 1 = sequential).",
+    )
+    parser.add_argument(
+        "--io-per-device",
+        type=int,
+        default=0,
+        help="Max concurrent reads per device; use 1-2 for HDDs (0 = no per-device limit).",
+    )
+    parser.add_argument(
+        "--algo",
+        choices=available_algos(),
+        default=DEFAULT_ALGO,
+        help="Digest algorithm (blake2b = 256-bit BLAKE2b; xxh3_128 needs the xxhash module).",
+    )
+    parser.add_argument(
+        "--block-size",
+        type=int,
+        default=BLOCK_SIZE,
+        help="Read block size in bytes (default 1 MiB).",
+    )
+    parser.add_argument(
+        "--mmap-min-mb",
+        type=int,
+        default=0,
+        help="mmap files of at least this many MB instead of reading them (0 = never; ignored with --cache-mode direct).",
+    )
+    add_cache_mode_argument(parser)
+    add_order_argument(parser)
+    parser.add_argument(
+        "--cache",
+        type=Path,
+        default=None,
+        help="Stat-keyed hash cache (default: hash_cache.sqlite next to --external-file).",
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true", help="Always read and hash every file."
+    )
+    parser.add_argument(
+        "--flac-md5",
+        action="store_true",
+        help="Identify .flac files by the audio MD5 in STREAMINFO (42 bytes) instead of hashing them.",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue the unfinished session journaled next to --external-file.",
+    )
+    parser.add_argument(
+        "--sync-every",
+        type=int,
+        default=SYNC_EVERY,
+        help=f"fsync the TSV and update the session journal every N files (default {SYNC_EVERY}).",
+    )
     parser.add_argument(
         "--verbose", action="store_true", help="Print progress for each hashed file."
     )
@@ -40,33 +475,136 @@ def main():
     if not root.is_dir():
         print(f"[ERROR] root '{root}' is not a directory.", file=sys.stderr)
         sys.exit(1)
-    existing = set()
-    if args.external_file.exists():
-        with args.external_file.open("r", encoding="utf-8", errors="ignore") as fh:
-            for line in fh:
-                parts = line.rstrip("\n").split("\t", 1)
-                if len(parts) == 2:
-                    existing.add(parts[1])
+    session_path = session_file(args.external_file)
+    journal = load_session(session_path)
+    cursor = ()
+    hashed_before = 0
+    if args.resume:
+        if journal is None:
+            print(f"[INFO] No session to resume for '{args.external_file}'; starting a new one.")
+        elif journal.get("root") != str(root) or journal.get("algo") != args.algo:
+            print(
+                f"[ERROR] The saved session hashes '{journal.get('root')}' with {journal.get('algo')}; "
+                "resume it with the same --root/--algo or run without --resume.",
+                file=sys.stderr,
+            )
+            sys.exit(1)
+        else:
+            cursor = tuple(journal.get("cursor") or ())
+            hashed_before = int(journal.get("hashed", 0))
+            print(f"[INFO] Resuming session ({hashed_before} files hashed) from '{os.sep.join(cursor) or '.'}'.")
+    elif journal is not None:
+        print("[INFO] Found an unfinished session; starting over (use --resume to continue it).")
 
+    committed = journal.get("offset", -1) if journal is not None else covered_offset(args.external_file)
+    dropped = recover_index(args.external_file, committed)
+    if dropped:
+        print(f"[WARN] Dropped {dropped} bytes of torn or partial lines at the end of '{args.external_file}'.")
+
+    has_index = args.external_file.exists() and args.external_file.stat().st_size > 0
+    if has_index:
+        options = read_index_options(args.external_file)
+        if options["algo"] != args.algo:
+            print(
+                f"[ERROR] '{args.external_file}' uses {options['algo']}; pass --algo {options['algo']} "
+                "or choose another --external-file.",
+                file=sys.stderr,
+            )
+            sys.exit(1)
+        if (options["flac"] == "md5") != args.flac_md5:
+            flag = "with" if options["flac"] == "md5" else "without"
+            print(
+                f"[ERROR] '{args.external_file}' was built {flag} --flac-md5; use the same setting "
+                "or choose another --external-file.",
+                file=sys.stderr,
+            )
+            sys.exit(1)
+    if args.mmap_min_mb and args.cache_mode == "direct":
+        print("[WARN] --mmap-min-mb is ignored with --cache-mode direct (mapped reads use the page cache).", file=sys.stderr)
+    existing = refresh_path_index(args.external_file)
+
+    cache = None
+    hash_func = partial(
+        hash_file,
+        algo=args.algo,
+        block_size=args.block_size,
+        mmap_min_size=args.mmap_min_mb * 1024 * 1024,
+        cache_mode=args.cache_mode,
+    )
+    if not args.no_cache:
+        from hash_cache import HashCache
+
+        cache = HashCache(args.cache or args.external_file.parent / "hash_cache.sqlite")
+        hash_func = cache.cached(hash_func, args.algo)
+    if args.flac_md5:
+        from audio_payload import with_flac_md5
+
+        hash_func = with_flac_md5(hash_func)
+
+    session = HashSession(session_path, root, args.algo, hashed_before)
     hashed = 0
     encoded_limit = args.limit
-    with args.external_file.open("a", encoding="utf-8") as out:
-        for dirpath, _, filenames in os.walk(root):
-            for name in filenames:
-                path = os.path.join(dirpath, name)
-                if path in existing:
-                    continue
-                try:
-                    digest = sha256_file(path)
-                except PermissionError:
+    limit_reached = False
+    finished = False
+    interrupted = False
+    with args.external_file.open("ab") as out:
+        if not has_index:
+            out.write(index_header(args.algo, args.flac_md5).encode("utf-8"))
+
+        unsynced = 0
+        last_sync = time.monotonic()
+
+        def sync():
+            out.flush()
+            os.fsync(out.fileno())
+            session.save(out.tell(), cursor)
+
+        results = hash_paths(
+            iter_new_files(root, existing, cursor),
+            workers=args.workers,
+            io_per_device=args.io_per_device,
+            hash_func=hash_func,
+            order=args.order,
+        )
+        try:
+            for path, digest in results:
+                if digest is None:
                     continue
-                out.write(f"{digest}\t{path}\n")
+                out.write(f"{digest}\t{path}\n".encode("utf-8", "surrogateescape"))
                 hashed += 1
+                session.hashed += 1
+                cursor = dir_parts(root, path)
+                unsynced += 1
                 if args.verbose:
                     print(f"[HASHED] {path}")
                 if encoded_limit > 0 and hashed >= encoded_limit:
-                    print(f"[INFO] Limit reached ({encoded_limit}). Files hashed: {hashed}")
-                    sys.exit(2)
+                    limit_reached = True
+                    break
+                if unsynced >= args.sync_every or time.monotonic() - last_sync >= SYNC_SECONDS:
+                    sync()
+                    unsynced = 0
+                    last_sync = time.monotonic()
+            else:
+                finished = True
+        except KeyboardInterrupt:
+            interrupted = True
+        finally:
+            results.close()
+            sync()
+    if finished:
+        session.finish()
+    existing.close()
+    refresh_path_index(args.external_file).close()
+    if cache is not None:
+        cache.close()
+        if args.verbose:
+            print(f"[INFO] Cache hits: {cache.hits}, files read: {cache.misses}")
+    if interrupted:
+        print(f"[INFO] Interrupted after {hashed} files; progress saved. Continue with --resume.")
+        sys.exit(130)
+    if limit_reached:
+        print(f"[INFO] Limit reached ({encoded_limit}). Files hashed: {hashed}. Continue with --resume.")
+        sys.exit(2)
     if hashed == 0:
         print(f"[INFO] No new files hashed under '{root}'.")
         sys.exit(0)
@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+"""
+SQLite content-hash store for DJProducerTools.
+One indexed database behind hash_index.tsv, external_hashes.tsv and the
+dupes plans, so lookups are queries instead of full-file scans:
+- files: (root, path) -> digest, indexed on digest, path and root. Every
+  import of a root is a new generation; rows remember when they were added,
+  last changed and when they disappeared, so "what changed on drive B" is
+  the rows of its latest generation.
+- plan_entries: imported dupes plans (digest, action, path), indexed by plan.
+- plans: size and mtime of the TSV each plan was imported from, so readers
+  can tell whether the store still matches the file (else they read the TSV).
+The TSV files stay the exchange format: import-* / export-* convert both ways.
+
+CLI (all take --db, default _DJProducerTools/hash_store.sqlite):
+  import-index FILE [--root R]     hash_index.tsv (hash, rel, full)
+  import-external FILE [--root R]  external_hashes.tsv (hash, full); --root keeps only that drive
+  import-plan FILE [--name N]      dupes plan (hash, action, path)
+  export-index --root R            hash_index.tsv of a root
+  export-external                  external_hashes.tsv of every root (all roots must share one algo)
+  dupes [--out PLAN]               KEEP/QUARANTINE plan of current duplicates + counts
+  dupes-of PATH|DIGEST             every current copy of a file
+  changes --root R                 added / modified / removed in the latest import of R
+  stats
+"""
+import argparse
+import itertools
+import os
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+from hash_root import DEFAULT_ALGO, INDEX_HEADER_PREFIX, index_header, read_index_options
+
+BATCH = 5000
+# Stored algo of roots whose .flac digests are STREAMINFO MD5s (--flac-md5 indexes).
+FLAC_MD5_SUFFIX = "+flacmd5"
+
+
+def index_algo(path):
+    """Store algo key of an index: its header algo, plus FLAC_MD5_SUFFIX for flac=md5."""
+    options = read_index_options(path)
+    return options["algo"] + (FLAC_MD5_SUFFIX if options["flac"] == "md5" else "")
+
+
+def algo_header(algo):
+    name, sep, _ = algo.partition("+")
+    return index_header(name, bool(sep))
+
+
+class HashStore:
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.path))
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(
+            "CREATE TABLE IF NOT EXISTS roots ("
+            " id INTEGER PRIMARY KEY, path TEXT UNIQUE, algo TEXT, generation INTEGER, imported_at INTEGER);"
+            "CREATE TABLE IF NOT EXISTS files ("
+            " root_id INTEGER, path TEXT, rel TEXT, digest TEXT,"
+            " added INTEGER, changed INTEGER, seen INTEGER, gone INTEGER,"
+            " PRIMARY KEY (root_id, path));"
+            "CREATE INDEX IF NOT EXISTS files_digest ON files (digest);"
+            "CREATE INDEX IF NOT EXISTS files_path ON files (path);"
+            "CREATE TABLE IF NOT EXISTS plan_entries ("
+            " plan TEXT, seq INTEGER, digest TEXT, action TEXT, path TEXT, PRIMARY KEY (plan, seq));"
+            "CREATE INDEX IF NOT EXISTS plan_action ON plan_entries (plan, action);"
+            "CREATE TABLE IF NOT EXISTS plans (name TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER);"
+        )
+
+    def _root(self, path, algo):
+        row = self.conn.execute("SELECT id, algo, generation FROM roots WHERE path=?", (path,)).fetchone()
+        if row is None:
+            cur = self.conn.execute(
+                "INSERT INTO roots (path, algo, generation) VALUES (?, ?, 0)", (path, algo)
+            )
+            return cur.lastrowid, 0
+        if row[1] != algo:
+            raise ValueError(f"root '{path}' is stored with {row[1]}, not {algo}")
+        return row[0], row[2]
+
+    def import_rows(self, root, rows, algo=DEFAULT_ALGO):
+        """Replace the contents of root with rows of (digest, rel, path); return change counts."""
+        with self.conn:
+            root_id, gen = self._root(root, algo)
+            gen += 1
+            batch = []
+            for digest, rel, path in rows:
+                batch.append((root_id, path, rel, digest, gen, gen, gen))
+                if len(batch) >= BATCH:
+                    self._upsert(batch)
+                    batch = []
+            self._upsert(batch)
+            self.conn.execute(
+                "UPDATE files SET gone=? WHERE root_id=? AND seen<? AND gone IS NULL", (gen, root_id, gen)
+            )
+            self.conn.execute(
+                "UPDATE roots SET generation=?, imported_at=? WHERE id=?", (gen, int(time.time()), root_id)
+            )
+        return self.changes(root)
+
+    def _upsert(self, batch):
+        self.conn.executemany(
+            "INSERT INTO files (root_id, path, rel, digest, added, changed, seen, gone)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, NULL)"
+            " ON CONFLICT (root_id, path) DO UPDATE SET"
+            "  changed = CASE WHEN files.digest != excluded.digest OR files.gone IS NOT NULL"
+            "                 THEN excluded.changed ELSE files.changed END,"
+            "  added = CASE WHEN files.gone IS NOT NULL THEN excluded.added ELSE files.added END,"
+            "  rel = excluded.rel, digest = excluded.digest, seen = excluded.seen, gone = NULL",
+            batch,
+        )
+
+    def changes(self, root):
+        """{added, modified, removed: [(path, digest)]} of the latest import of root."""
+        row = self.conn.execute("SELECT id, generation FROM roots WHERE path=?", (root,)).fetchone()
+        out = {"added": [], "modified": [], "removed": []}
+        if row is None:
+            return out
+        root_id, gen = row
+        queries = {
+            "added": "added=? AND gone IS NULL",
+            "modified": "changed=? AND added<? AND gone IS NULL",
+            "removed": "gone=?",
+        }
+        for kind, where in queries.items():
+            params = (root_id, gen, gen) if kind == "modified" else (root_id, gen)
+            out[kind] = self.conn.execute(
+                f"SELECT path, digest FROM files WHERE root_id=? AND {where} ORDER BY path", params
+            ).fetchall()
+        return out
+
+    def copies(self, value):
+        """Current (root, path, digest) rows sharing the digest of a path, or of a digest itself."""
+        row = self.conn.execute("SELECT digest FROM files WHERE path=? AND gone IS NULL", (value,)).fetchone()
+        digest = row[0] if row else value
+        return self.conn.execute(
+            "SELECT roots.path, files.path, files.digest FROM files JOIN roots ON roots.id = files.root_id"
+            " WHERE files.digest=? AND files.gone IS NULL ORDER BY roots.id, files.path",
+            (digest,),
+        ).fetchall()
+
+    def duplicate_groups(self):
+        """Yield (digest, [paths]) for digests held by more than one current file."""
+        cur = self.conn.execute(
+            "SELECT digest, path FROM files WHERE gone IS NULL AND digest IN"
+            " (SELECT digest FROM files WHERE gone IS NULL GROUP BY digest HAVING COUNT(*) > 1)"
+            " ORDER BY digest, root_id, path"
+        )
+        digest, paths = None, []
+        for d, p in cur:
+            if d != digest:
+                if paths:
+                    yield digest, paths
+                digest, paths = d, []
+            paths.append(p)
+        if paths:
+            yield digest, paths
+
+    def dupe_counts(self):
+        """(digests with duplicates, files involved) among current files."""
+        row = self.conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(n), 0) FROM"
+            " (SELECT COUNT(*) AS n FROM files WHERE gone IS NULL GROUP BY digest HAVING n > 1)"
+        ).fetchone()
+        return row[0], row[1]
+
+    def import_plan(self, name, rows, source=None):
+        """Replace plan name with rows of (digest, action, path).
+
+        source is the plan TSV the rows come from; its size and mtime are recorded
+        (stat taken before reading) so readers can detect a TSV changed since.
+        """
+        st = os.stat(source) if source is not None else None
+        with self.conn:
+            self.conn.execute("DELETE FROM plan_entries WHERE plan=?", (name,))
+            self.conn.executemany(
+                "INSERT INTO plan_entries VALUES (?, ?, ?, ?, ?)",
+                ((name, seq, d, a, p) for seq, (d, a, p) in enumerate(rows)),
+            )
+            self.conn.execute(
+                "INSERT OR REPLACE INTO plans VALUES (?, ?, ?)",
+                (name, st.st_size if st else None, st.st_mtime_ns if st else None),
+            )
+
+    def plan_is_current(self, name, source):
+        """True when plan name was imported from source and source has not changed since."""
+        try:
+            st = os.stat(source)
+        except OSError:
+            return False
+        row = self.conn.execute(
+            "SELECT 1 FROM plans WHERE name=? AND size=? AND mtime_ns=?", (name, st.st_size, st.st_mtime_ns)
+        ).fetchone()
+        return row is not None
+
+    def plan_summary(self, name):
+        rows = self.conn.execute(
+            "SELECT action, COUNT(*), COUNT(DISTINCT digest) FROM plan_entries WHERE plan=? GROUP BY action",
+            (name,),
+        ).fetchall()
+        return {action: {"entries": n, "hashes": h} for action, n, h in rows}
+
+    def plan_rows(self, name):
+        return self.conn.execute(
+            "SELECT digest, action, path FROM plan_entries WHERE plan=? ORDER BY seq", (name,)
+        )
+
+    def root_rows(self, root=None):
+        """Yield (algo, digest, rel, path) of current files, for one root or all."""
+        sql = (
+            "SELECT roots.algo, files.digest, files.rel, files.path FROM files"
+            " JOIN roots ON roots.id = files.root_id WHERE files.gone IS NULL"
+        )
+        params = ()
+        if root is not None:
+            sql += " AND roots.path=?"
+            params = (root,)
+        return self.conn.execute(sql + " ORDER BY roots.id, files.rowid", params)
+
+    def root_algos(self, root=None):
+        """Distinct algos of the roots (or the one root) that have current files."""
+        sql = (
+            "SELECT DISTINCT roots.algo FROM roots WHERE EXISTS"
+            " (SELECT 1 FROM files WHERE files.root_id = roots.id AND files.gone IS NULL)"
+        )
+        params = ()
+        if root is not None:
+            sql += " AND roots.path=?"
+            params = (root,)
+        return sorted(algo for (algo,) in self.conn.execute(sql, params))
+
+    def stats(self):
+        files = self.conn.execute("SELECT COUNT(*) FROM files WHERE gone IS NULL").fetchone()[0]
+        roots = self.conn.execute("SELECT COUNT(*) FROM roots").fetchone()[0]
+        plans = self.conn.execute("SELECT COUNT(DISTINCT plan) FROM plan_entries").fetchone()[0]
+        return {"roots": roots, "files": files, "plans": plans}
+
+    def close(self):
+        self.conn.close()
+
+
+def read_tsv(path, columns):
+    """Yield the split data lines of an index/plan TSV, skipping headers and short lines."""
+    with open(path, "r", encoding="utf-8", errors="surrogateescape") as fh:
+        for line in fh:
+            if line.startswith(INDEX_HEADER_PREFIX):
+                continue
+            parts = line.rstrip("\n").split("\t", columns - 1)
+            if len(parts) == columns:
+                yield parts
+
+
+def index_rows(path):
+    for digest, rel, full in read_tsv(path, 3):
+        yield digest, rel, full.split("\t", 1)[0]
+
+
+def index_root(path):
+    """Root of a hash_index.tsv, from its first line: full path minus rel."""
+    for _, rel, full in index_rows(path):
+        if full.endswith(rel):
+            return full[: len(full) - len(rel)].rstrip(os.sep) or os.sep
+        break
+    return str(path)
+
+
+def external_rows(path, root=None):
+    prefix = root.rstrip(os.sep) + os.sep if root else ""
+    for digest, full in read_tsv(path, 2):
+        if full.startswith(prefix):
+            yield digest, full[len(prefix):] if prefix else full, full
+
+
+def write_rows(lines, out):
+    fh = open(out, "w", encoding="utf-8", errors="surrogateescape") if out else sys.stdout
+    try:
+        for line in lines:
+            fh.write(line)
+    finally:
+        if out:
+            fh.close()
+
+
+def export_lines(rows, fmt):
+    """Index header (algo of the first row) followed by fmt-formatted (algo, digest, rel, path) rows.
+
+    One header covers the whole file, so a row with another algo raises ValueError.
+    """
+    first = next(rows, None)
+    yield algo_header(first[0] if first else DEFAULT_ALGO)
+    if first:
+        for row in itertools.chain([first], rows):
+            if row[0] != first[0]:
+                raise ValueError(f"mixed algos in export: {first[0]} and {row[0]}")
+            yield fmt.format(*row)
+
+
+def print_changes(changes):
+    for kind in ("added", "modified", "removed"):
+        for path, digest in changes[kind]:
+            print(f"{kind.upper()}\t{digest}\t{path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SQLite hash store behind the hash/plan TSV files.")
+    parser.add_argument(
+        "--db",
+        type=Path,
+        default=Path(__file__).resolve().parents[1] / "_DJProducerTools" / "hash_store.sqlite",
+        help="Store database",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    p = subparsers.add_parser("import-index", help="Import a hash_index.tsv")
+    p.add_argument("file", type=Path)
+    p.add_argument("--root", default=None, help="Root name (default: derived from the first line)")
+    p = subparsers.add_parser("import-external", help="Import an external_hashes.tsv")
+    p.add_argument("file", type=Path)
+    p.add_argument("--root", default=None, help="Only import paths under this drive/folder")
+    p = subparsers.add_parser("import-plan", help="Import a dupes plan")
+    p.add_argument("file", type=Path)
+    p.add_argument("--name", default=None, help="Plan name (default: file stem)")
+    p = subparsers.add_parser("export-index", help="Write hash_index.tsv of a root")
+    p.add_argument("--root", required=True)
+    p.add_argument("--out", type=Path, default=None)
+    p = subparsers.add_parser("export-external", help="Write external_hashes.tsv of every root")
+    p.add_argument("--out", type=Path, default=None)
+    p = subparsers.add_parser("dupes", help="Duplicates plan + counts from the store")
+    p.add_argument("--out", type=Path, default=None, help="Write KEEP/QUARANTINE plan here")
+    p = subparsers.add_parser("dupes-of", help="Every current copy of a path or digest")
+    p.add_argument("value")
+    p = subparsers.add_parser("changes", help="Changes in the latest import of a root")
+    p.add_argument("--root", required=True)
+    subparsers.add_parser("stats", help="Roots, files and plans in the store")
+    args = parser.parse_args()
+
+    store = HashStore(args.db)
+    try:
+        if args.command in ("import-index", "import-external"):
+            algo = index_algo(args.file)
+            if args.command == "import-index":
+                root = args.root or index_root(args.file)
+                rows = index_rows(args.file)
+            else:
+                root = args.root or f"external:{args.file}"
+                rows = external_rows(args.file, args.root)
+            try:
+                changes = store.import_rows(root, rows, algo)
+            except ValueError as exc:
+                print(f"[ERROR] {exc}", file=sys.stderr)
+                sys.exit(1)
+            counts = ", ".join(f"{k}: {len(v)}" for k, v in changes.items())
+            print(f"[OK] {args.file} -> {root} ({counts})")
+        elif args.command == "import-plan":
+            name = args.name or args.file.stem
+            store.import_plan(name, read_tsv(args.file, 3), args.file)
+            print(f"[OK] Plan '{name}': {store.plan_summary(name)}")
+        elif args.command == "export-index":
+            write_rows(export_lines(store.root_rows(args.root), "{1}\t{2}\t{3}\n"), args.out)
+        elif args.command == "export-external":
+            algos = store.root_algos()
+            if len(algos) > 1:
+                print(
+                    f"[ERROR] Roots con algoritmos distintos ({', '.join(algos)}): "
+                    "un external_hashes.tsv solo lleva un algo=; exporta cada root con export-index --root",
+                    file=sys.stderr,
+                )
+                sys.exit(1)
+            write_rows(export_lines(store.root_rows(), "{1}\t{3}\n"), args.out)
+        elif args.command == "dupes":
+            if args.out:
+                write_rows(
+                    (
+                        f"{d}\t{'KEEP' if i == 0 else 'QUARANTINE'}\t{p}\n"
+                        for d, paths in store.duplicate_groups()
+                        for i, p in enumerate(paths)
+                    ),
+                    args.out,
+                )
+            groups, files = store.dupe_counts()
+            print(f"[INFO] Hashes con duplicados: {groups} | Archivos: {files}")
+        elif args.command == "dupes-of":
+            for root, path, digest in store.copies(args.value):
+                print(f"{digest}\t{root}\t{path}")
+        elif args.command == "changes":
+            print_changes(store.changes(args.root))
+        elif args.command == "stats":
+            print(store.stats())
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
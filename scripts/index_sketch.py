@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Compact sketches of a hash index, for comparing drives without shipping TSVs.
+- export: writes a sketch of every digest in an index (hash_index.tsv or
+  external "hash, path"):
+    bloom   Bloom filter sized for --fp-rate (~1.8 MB per million files at 0.1%)
+    prefix  sorted 64-bit digest prefixes (8 MB per million files, false
+            positives ~n/2^64, i.e. practically exact)
+- check: tests another index against a sketch and writes the entries whose
+  digest is definitely absent from the sketched index ("hash<TAB>path").
+  A sketch has no false negatives, so every candidate is really missing;
+  a false positive can only hide a missing file (rate: see the sketch).
+- verify: run where the full index lives; confirms candidates exactly
+  against it (only the candidates are held in memory).
+Sketch file: MAGIC, one JSON header line, then the raw payload.
+"""
+import argparse
+import array
+import bisect
+import hashlib
+import json
+import math
+import sys
+from pathlib import Path
+
+from hash_root import INDEX_HEADER_PREFIX, read_index_options
+
+MAGIC = b"DJPTSKETCH1\n"
+
+
+def index_entries(path):
+    """(digest bytes, path bytes) of each entry of a hash index or external TSV."""
+    header = INDEX_HEADER_PREFIX.encode()
+    with open(path, "rb") as fh:
+        for line in fh:
+            if line.startswith(header):
+                continue
+            parts = line.rstrip(b"\n").split(b"\t")
+            if len(parts) >= 2 and parts[0]:
+                yield parts[0], parts[-1]
+
+
+def _key(digest):
+    """Two independent 64-bit hashes of a digest (also spreads non-hex digests such as flacmd5:...)."""
+    k = hashlib.blake2b(digest, digest_size=16).digest()
+    return int.from_bytes(k[:8], "little"), int.from_bytes(k[8:], "little") | 1
+
+
+class BloomSketch:
+    kind = "bloom"
+
+    def __init__(self, bits, hashes, data=None):
+        self.bits = bits
+        self.hashes = hashes
+        self.data = data if data is not None else bytearray((bits + 7) // 8)
+
+    @classmethod
+    def sized(cls, n, fp_rate):
+        n = max(1, n)
+        bits = max(64, int(math.ceil(-n * math.log(fp_rate) / math.log(2) ** 2)))
+        return cls(bits, max(1, round(bits / n * math.log(2))))
+
+    def add(self, digest):
+        h1, h2 = _key(digest)
+        data, bits = self.data, self.bits
+        for i in range(self.hashes):
+            bit = (h1 + i * h2) % bits
+            data[bit >> 3] |= 1 << (bit & 7)
+
+    def __contains__(self, digest):
+        h1, h2 = _key(digest)
+        data, bits = self.data, self.bits
+        for i in range(self.hashes):
+            bit = (h1 + i * h2) % bits
+            if not data[bit >> 3] & (1 << (bit & 7)):
+                return False
+        return True
+
+    def params(self):
+        return {"bits": self.bits, "hashes": self.hashes}
+
+    def payload(self):
+        return bytes(self.data)
+
+
+class PrefixSketch:
+    kind = "prefix"
+
+    def __init__(self, prefixes=None):
+        self.prefixes = prefixes if prefixes is not None else array.array("Q")
+
+    def add(self, digest):
+        self.prefixes.append(_key(digest)[0])
+
+    def freeze(self):
+        self.prefixes = array.array("Q", sorted(set(self.prefixes)))
+
+    def __contains__(self, digest):
+        p = _key(digest)[0]
+        i = bisect.bisect_left(self.prefixes, p)
+        return i < len(self.prefixes) and self.prefixes[i] == p
+
+    def params(self):
+        return {"count": len(self.prefixes)}
+
+    def payload(self):
+        return self.prefixes.tobytes()
+
+
+def write_sketch(sketch, out, meta):
+    header = dict(meta, kind=sketch.kind, **sketch.params())
+    with open(out, "wb") as fh:
+        fh.write(MAGIC)
+        fh.write(json.dumps(header).encode() + b"\n")
+        fh.write(sketch.payload())
+
+
+def read_sketch(path):
+    """(sketch, header) of a sketch file."""
+    with open(path, "rb") as fh:
+        if fh.readline() != MAGIC:
+            raise ValueError(f"not a DJProducerTools sketch: {path}")
+        header = json.loads(fh.readline())
+        payload = fh.read()
+    if header["kind"] == "bloom":
+        return BloomSketch(header["bits"], header["hashes"], bytearray(payload)), header
+    prefixes = array.array("Q")
+    prefixes.frombytes(payload)
+    return PrefixSketch(prefixes), header
+
+
+def export(index, out, kind="bloom", fp_rate=0.001):
+    """Write the sketch of an index; returns its header."""
+    options = read_index_options(index)
+    if kind == "bloom":
+        n = sum(1 for _ in index_entries(index))
+        sketch = BloomSketch.sized(n, fp_rate)
+    else:
+        sketch = PrefixSketch()
+    count = 0
+    for digest, _ in index_entries(index):
+        sketch.add(digest)
+        count += 1
+    if kind == "prefix":
+        sketch.freeze()
+    meta = {"algo": options["algo"], "flac": options["flac"], "entries": count, "source": str(index)}
+    if kind == "bloom":
+        meta["fp_rate"] = fp_rate
+    write_sketch(sketch, out, meta)
+    return read_sketch(out)[1]
+
+
+def check(sketch, index, out):
+    """Write entries of index whose digest is not in sketch; returns (checked, candidates)."""
+    checked = candidates = 0
+    for digest, path in index_entries(index):
+        checked += 1
+        if digest not in sketch:
+            out.write(b"%s\t%s\n" % (digest, path))
+            candidates += 1
+    return checked, candidates
+
+
+def verify(candidates_path, index, out):
+    """Write the candidates whose digest is really absent from the full index; returns (candidates, confirmed)."""
+    pending = {}
+    with open(candidates_path, "rb") as fh:
+        for line in fh:
+            digest, _, path = line.rstrip(b"\n").partition(b"\t")
+            pending.setdefault(digest, []).append(path)
+    total = sum(len(v) for v in pending.values())
+    for digest, _ in index_entries(index):
+        pending.pop(digest, None)
+    confirmed = 0
+    for digest, paths in pending.items():
+        for path in paths:
+            out.write(b"%s\t%s\n" % (digest, path))
+            confirmed += 1
+    return total, confirmed
+
+
+def _human(n):
+    return f"{n / (1024 * 1024):.2f} MB" if n >= 1024 * 1024 else f"{n / 1024:.1f} KB"
+
+
+def _open_out(path):
+    return open(path, "wb") if path else sys.stdout.buffer
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bloom/prefix sketches of hash indexes for drive comparison.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    p = subparsers.add_parser("export", help="Write a sketch of an index")
+    p.add_argument("--index", type=Path, required=True, help="hash_index.tsv or external hashes TSV")
+    p.add_argument("--out", type=Path, required=True, help="Sketch file (.djsk)")
+    p.add_argument("--kind", choices=("bloom", "prefix"), default="bloom", help="Sketch type (default bloom)")
+    p.add_argument("--fp-rate", type=float, default=0.001, help="Bloom false-positive rate (default 0.001)")
+
+    p = subparsers.add_parser("check", help="Entries of an index that the sketched index lacks")
+    p.add_argument("--sketch", type=Path, required=True, help="Sketch of the other drive")
+    p.add_argument("--index", type=Path, required=True, help="Local index to test")
+    p.add_argument("--out", type=Path, default=None, help="Candidates TSV (default stdout)")
+
+    p = subparsers.add_parser("verify", help="Confirm candidates against the full index")
+    p.add_argument("--candidates", type=Path, required=True, help="Output of check")
+    p.add_argument("--index", type=Path, required=True, help="Full index the sketch was built from")
+    p.add_argument("--out", type=Path, default=None, help="Confirmed missing TSV (default stdout)")
+    args = parser.parse_args()
+
+    for path in (getattr(args, "index", None), getattr(args, "sketch", None), getattr(args, "candidates", None)):
+        if path is not None and not path.is_file():
+            print(f"[ERROR] No existe: {path}", file=sys.stderr)
+            sys.exit(1)
+
+    if args.command == "export":
+        if not 0 < args.fp_rate < 1:
+            print("[ERROR] --fp-rate must be between 0 and 1.", file=sys.stderr)
+            sys.exit(1)
+        header = export(args.index, args.out, args.kind, args.fp_rate)
+        size = args.out.stat().st_size
+        print(
+            f"[OK] Sketch {header['kind']} de {header['entries']} entradas: {args.out} ({_human(size)}, "
+            f"índice {_human(args.index.stat().st_size)})",
+            file=sys.stderr,
+        )
+        return
+
+    if args.command == "check":
+        try:
+            sketch, header = read_sketch(args.sketch)
+        except ValueError as exc:
+            print(f"[ERROR] {exc}", file=sys.stderr)
+            sys.exit(1)
+        options = read_index_options(args.index)
+        if (options["algo"], options["flac"]) != (header["algo"], header["flac"]):
+            print(f"[ERROR] {args.index} and the sketch were hashed with different options.", file=sys.stderr)
+            sys.exit(1)
+        out = _open_out(args.out)
+        try:
+            checked, candidates = check(sketch, args.index, out)
+        finally:
+            if args.out:
+                out.close()
+        note = f" (falsos positivos ~{header['fp_rate']:.2%} pueden ocultar alguno)" if header["kind"] == "bloom" else ""
+        print(f"[OK] Revisadas {checked} | faltan en el otro disco: {candidates}{note}", file=sys.stderr)
+        return
+
+    out = _open_out(args.out)
+    try:
+        total, confirmed = verify(args.candidates, args.index, out)
+    finally:
+        if args.out:
+            out.close()
+    print(f"[OK] Candidatos {total} | confirmados {confirmed}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
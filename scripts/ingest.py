@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+Ingest gate for DJProducerTools: "which of these downloads are already in the library?"
+Only the incoming files are hashed. They are looked up in a sorted binary
+digest index derived from hash_index.tsv (<index>.djdx, rebuilt when the TSV
+changes):
+  MAGIC, one JSON header line, count fixed-size records (digest bytes + u64
+  offset of the library path), then the newline-separated paths.
+The records are mmapped and bisected, so a lookup costs O(log n) page reads
+whatever the library size. A sorted "name key<TAB>path" file (<index>.djdx.names)
+catches the same track under another encode or tags.
+Each incoming file is reported as:
+  NEW                     digest and name unknown to the library
+  DUPLICATE               same digest as a library file (or an earlier incoming file)
+  SUSPECT_NEAR_DUPLICATE  other digest, same normalised title as a library file
+Output lines: "STATUS<TAB>incoming<TAB>library path".
+"""
+import argparse
+import bisect
+import collections
+import hashlib
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+import time
+from functools import partial
+from pathlib import Path
+
+from hash_root import (
+    DEFAULT_ALGO,
+    INDEX_HEADER_PREFIX,
+    hash_file,
+    hash_paths,
+    read_index_options,
+    walk_files,
+)
+from sorted_index import SortedLines, external_sort, merge_runs, sorted_runs
+
+MAGIC = b"DJPTDIGEST1\n"
+OFFSET = struct.Struct("<Q")
+_HEX = re.compile(rb"^[0-9a-f]+$")
+_BRACKETS = re.compile(r"[\(\[][^\)\]]*[\)\]]")
+_TRACKNO = re.compile(r"^\d{1,3}[\s._-]+")
+_NOISE = re.compile(r"[^0-9a-z]+")
+
+
+def digest_key(digest, length):
+    """Fixed-size binary key of a digest: raw bytes of hex digests, a sha256 prefix of anything else."""
+    if len(digest) == 2 * length and _HEX.match(digest):
+        return bytes.fromhex(digest.decode())
+    return hashlib.sha256(digest).digest()[:length]
+
+
+def name_key(path):
+    """Normalised title: no extension, track number, bracketed remarks or punctuation."""
+    stem = os.path.splitext(os.path.basename(path))[0].lower()
+    stem = _BRACKETS.sub(" ", _TRACKNO.sub("", stem))
+    key = _NOISE.sub(" ", stem).strip()
+    return key if len(key) >= 4 else ""
+
+
+def _index_lines(index):
+    header = INDEX_HEADER_PREFIX.encode()
+    with open(index, "rb") as fh:
+        for line in fh:
+            if line.startswith(header):
+                continue
+            parts = line.rstrip(b"\n").split(b"\t")
+            if len(parts) >= 2 and parts[0]:
+                yield parts[0], parts[-1]
+
+
+def _digest_len(index):
+    for digest, _ in _index_lines(index):
+        return len(digest) // 2 if _HEX.match(digest) and len(digest) % 2 == 0 else 32
+    return 32
+
+
+def build(index, out, run_lines=500_000):
+    """Write <out> (binary digest records) and <out>.names from a hash index; returns entries."""
+    out = Path(out)
+    length = _digest_len(index)
+    st = os.stat(index)
+    options = read_index_options(index)
+    # Sort "hexkey<TAB>path" lines on disk, then lay them out as fixed records + path blob.
+    runs = sorted_runs(
+        (b"%s\t%s\n" % (digest_key(d, length).hex().encode(), p) for d, p in _index_lines(index)),
+        out.parent,
+        run_lines,
+    )
+    tmp = out.with_name(f".{out.name}.{os.getpid()}.tmp")
+    blob = out.with_name(f".{out.name}.{os.getpid()}.paths")
+    count = 0
+    try:
+        with open(tmp, "wb") as records, open(blob, "wb") as paths:
+            offset = 0
+            for line in merge_runs(runs):
+                key, _, path = line.rstrip(b"\n").partition(b"\t")
+                records.write(bytes.fromhex(key.decode()) + OFFSET.pack(offset))
+                paths.write(path + b"\n")
+                offset += len(path) + 1
+                count += 1
+        header = {
+            "algo": options["algo"],
+            "flac": options["flac"],
+            "digest_len": length,
+            "count": count,
+            "source": str(index),
+            "source_size": st.st_size,
+            "source_mtime_ns": st.st_mtime_ns,
+        }
+        final = out.with_name(f".{out.name}.{os.getpid()}.new")
+        with open(final, "wb") as fo:
+            fo.write(MAGIC + json.dumps(header).encode() + b"\n")
+            for part in (tmp, blob):
+                with open(part, "rb") as fi:
+                    while True:
+                        chunk = fi.read(1 << 20)
+                        if not chunk:
+                            break
+                        fo.write(chunk)
+        os.replace(final, out)
+    finally:
+        for part in (tmp, blob):
+            if part.exists():
+                part.unlink()
+    external_sort(_name_lines(index), str(out) + ".names", run_lines=run_lines)
+    return count
+
+
+def _name_lines(index):
+    for _, path in _index_lines(index):
+        key = name_key(os.fsdecode(path))
+        if key:
+            yield b"%s\t%s\n" % (key.encode(), path)
+
+
+class _Keys:
+    """Sequence view of the record keys, for bisect."""
+
+    def __init__(self, mm, base, length, count):
+        self.mm, self.base, self.length, self.count = mm, base, length, count
+        self.size = length + OFFSET.size
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        start = self.base + i * self.size
+        return self.mm[start : start + self.length]
+
+
+class DigestIndex:
+    def __init__(self, path):
+        self._fh = open(path, "rb")
+        if self._fh.readline() != MAGIC:
+            self._fh.close()
+            raise ValueError(f"not a DJProducerTools digest index: {path}")
+        self.header = json.loads(self._fh.readline())
+        base = self._fh.tell()
+        self._mm = mmap.mmap(self._fh.fileno(), 0, access=mmap.ACCESS_READ)
+        self.length = self.header["digest_len"]
+        self.keys = _Keys(self._mm, base, self.length, self.header["count"])
+        self._blob = base + self.header["count"] * self.keys.size
+
+    def lookup(self, digest):
+        """Library path of a digest (str or bytes), or None."""
+        if isinstance(digest, str):
+            digest = digest.encode()
+        key = digest_key(digest, self.length)
+        i = bisect.bisect_left(self.keys, key)
+        if i == len(self.keys) or self.keys[i] != key:
+            return None
+        start = self.keys.base + i * self.keys.size + self.length
+        offset = self._blob + OFFSET.unpack_from(self._mm, start)[0]
+        return os.fsdecode(self._mm[offset : self._mm.find(b"\n", offset)])
+
+    def stale(self, index):
+        st = os.stat(index)
+        return (st.st_size, st.st_mtime_ns) != (self.header["source_size"], self.header["source_mtime_ns"])
+
+    def close(self):
+        self._mm.close()
+        self._fh.close()
+
+
+def djdx_path(index):
+    return Path(index).with_suffix(".djdx")
+
+
+def open_index(index, rebuild=True):
+    """DigestIndex for a hash index, (re)building <index>.djdx when missing or stale."""
+    path = djdx_path(index)
+    if path.exists():
+        idx = DigestIndex(path)
+        if not idx.stale(index):
+            return idx, False
+        idx.close()
+    if not rebuild:
+        raise FileNotFoundError(path)
+    build(index, path)
+    return DigestIndex(path), True
+
+
+def classify(idx, names, hashed):
+    """Yield (status, incoming, library path) for (path, digest) pairs."""
+    seen = {}
+    for path, digest in hashed:
+        if digest is None:
+            yield "UNREADABLE", path, ""
+            continue
+        found = idx.lookup(digest) or seen.get(digest)
+        if found:
+            yield "DUPLICATE", path, found
+            continue
+        seen[digest] = path
+        key = name_key(path)
+        near = next(names.prefixed(key.encode() + b"\t"), None) if key else None
+        if near is not None:
+            yield "SUSPECT_NEAR_DUPLICATE", path, os.fsdecode(near.split(b"\t", 1)[1])
+        else:
+            yield "NEW", path, ""
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check incoming files against the library's hash index.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    p = subparsers.add_parser("build", help="Build <index>.djdx (+ .names) from hash_index.tsv")
+    p.add_argument("--index", type=Path, required=True, help="Library hash_index.tsv")
+    p = subparsers.add_parser("check", help="Classify incoming files as NEW / DUPLICATE / SUSPECT_NEAR_DUPLICATE")
+    p.add_argument("--index", type=Path, required=True, help="Library hash_index.tsv (.djdx built next to it)")
+    p.add_argument("--incoming", type=Path, action="append", required=True, help="Folder or file to check")
+    p.add_argument("--out", type=Path, default=None, help="Report TSV (default stdout)")
+    p.add_argument("--workers", type=int, default=4, help="Hash worker threads (default 4)")
+    p.add_argument("--all-files", action="store_true", help="Also check non-audio files")
+    args = parser.parse_args()
+
+    if not args.index.is_file():
+        print(f"[ERROR] No existe: {args.index}", file=sys.stderr)
+        sys.exit(1)
+    started = time.monotonic()
+    if args.command == "build":
+        count = build(args.index, djdx_path(args.index))
+        print(f"[OK] {count} digests -> {djdx_path(args.index)} ({time.monotonic() - started:.2f}s)")
+        return
+
+    idx, rebuilt = open_index(args.index)
+    if rebuilt:
+        print(f"[INFO] Índice binario (re)construido en {time.monotonic() - started:.2f}s", file=sys.stderr)
+    built = time.monotonic()
+    options = idx.header
+    hash_func = partial(hash_file, algo=options.get("algo") or DEFAULT_ALGO)
+    if options.get("flac") == "md5":
+        from audio_payload import with_flac_md5
+
+        hash_func = with_flac_md5(hash_func)
+    from audio_payload import is_audio
+
+    paths = []
+    for target in args.incoming:
+        if target.is_file():
+            paths.append(str(target))
+        else:
+            paths.extend(p for p, _ in walk_files([target]) if args.all_files or is_audio(p))
+    stats = collections.Counter()
+    out = args.out.open("w", encoding="utf-8", errors="surrogateescape") if args.out else sys.stdout
+    try:
+        with SortedLines(str(djdx_path(args.index)) + ".names") as names:
+            hashed = hash_paths(paths, workers=args.workers, hash_func=hash_func)
+            for status, path, found in classify(idx, names, hashed):
+                stats[status] += 1
+                out.write(f"{status}\t{path}\t{found}\n")
+    finally:
+        idx.close()
+        if args.out:
+            out.close()
+    print(
+        f"[OK] {len(paths)} archivos en {time.monotonic() - built:.2f}s | NEW {stats['NEW']} | "
+        f"DUPLICATE {stats['DUPLICATE']} | SUSPECT_NEAR_DUPLICATE {stats['SUSPECT_NEAR_DUPLICATE']}"
+        f"{' | ilegibles ' + str(stats['UNREADABLE']) if stats['UNREADABLE'] else ''}",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,483 @@
+#!/usr/bin/env python3
+"""
+Merkle directory index for DJProducerTools.
+File digests are rolled up into one digest per directory (names + kinds +
+child digests), so two folders with the same digest hold identical trees.
+- build: index a --root (parallel hashing + hash_cache) or an existing
+  hash_index.tsv (no file is read).
+- dupes: identical folder trees across one or more indexes in a single pass
+  (matrioshka report + KEEP/REMOVE plan). Folders whose parents are already
+  duplicates are not repeated.
+- diff: compare two indexes descending only into subtrees whose digests
+  differ, so a mirror check costs in proportion to what changed. Files of
+  a folder missing on one side are listed one by one (--collapse-folders
+  reports the folder once, as "rel/"). hash_index.tsv inputs get a .merkle
+  sidecar next to them, or under --sidecar-dir for read-only drives.
+Index layout: three "# " header lines (format/algo, root, root digest) then
+lines "parent<TAB>name<TAB>kind<TAB>digest<TAB>bytes<TAB>files" sorted
+bytewise, so the children of a folder are one contiguous block found by
+binary search (sorted_index.SortedLines). kind is F (file) or D (folder);
+top-level entries have parent ".". bytes is 0 when built from a hash index,
+and the first header line then also records the source index's size and
+mtime_ns (source_size=, source_mtime_ns=): a sidecar is rebuilt whenever they
+differ, even for a same-mtime or older copy restored over the index.
+"""
+import argparse
+import collections
+import os
+import sys
+import zlib
+from functools import partial
+from pathlib import Path
+
+from hash_root import (
+    DEFAULT_ALGO,
+    INDEX_HEADER_PREFIX,
+    available_algos,
+    hash_file,
+    hash_paths,
+    new_hasher,
+    read_index_options,
+    walk_files,
+)
+from sorted_index import SortedLines, external_sort
+
+MERKLE_HEADER_PREFIX = "# djpt-merkle"
+MERKLE_VERSION = 1
+ROOT_REL = "."
+
+
+def dir_digest(entries, algo):
+    """Digest of a folder from its (name, kind, digest, bytes, files) children."""
+    h = new_hasher(algo)
+    for name, kind, digest, _, _ in sorted(entries):
+        h.update(f"{kind}\t{name}\t{digest}\n".encode("utf-8", "surrogateescape"))
+    return h.hexdigest()
+
+
+def fold_tree(files, algo):
+    """Roll (rel, digest, bytes) file records up into folder digests.
+
+    Yields index lines (bytes) for every entry, then returns the root
+    (digest, bytes, files) through StopIteration.value.
+    """
+    records = sorted((tuple(rel.split("/")), digest, size) for rel, digest, size in files)
+    stack = [((), [])]
+
+    def close_top():
+        parts, entries = stack.pop()
+        digest = dir_digest(entries, algo)
+        size = sum(e[3] for e in entries)
+        count = sum(e[4] for e in entries)
+        parent = "/".join(parts) or ROOT_REL
+        lines = [
+            f"{parent}\t{name}\t{kind}\t{d}\t{b}\t{n}\n".encode("utf-8", "surrogateescape")
+            for name, kind, d, b, n in entries
+        ]
+        if stack:
+            stack[-1][1].append((parts[-1], "D", digest, size, count))
+        return lines, (digest, size, count)
+
+    for parts, digest, size in records:
+        dirs, name = parts[:-1], parts[-1]
+        while stack[-1][0] != dirs[: len(stack[-1][0])]:
+            yield from close_top()[0]
+        while len(stack[-1][0]) < len(dirs):
+            stack.append((dirs[: len(stack[-1][0]) + 1], []))
+        stack[-1][1].append((name, "F", digest, size, 1))
+    while len(stack) > 1:
+        yield from close_top()[0]
+    lines, root = close_top()
+    yield from lines
+    return root
+
+
+def write_index(files, out_path, root, algo, source=None):
+    """Write the Merkle index of (rel, digest, bytes) records; return the root tuple.
+
+    source is the (size, mtime_ns) of the hash index the records come from.
+    """
+    result = {}
+
+    def lines():
+        result["root"] = yield from fold_tree(files, algo)
+
+    # The header needs the root digest, which is only known once every line
+    # was produced; sort into a temp file, then prepend the header.
+    body = out_path.with_name(f".{out_path.name}.{os.getpid()}.body")
+    try:
+        external_sort(lines(), body, unique=False)
+        digest, size, count = result["root"]
+        origin = f" source_size={source[0]} source_mtime_ns={source[1]}" if source else ""
+        header = (
+            f"{MERKLE_HEADER_PREFIX} v{MERKLE_VERSION} algo={algo}{origin}\n"
+            f"# root={root}\n"
+            f"# digest={digest} bytes={size} files={count}\n"
+        ).encode("utf-8", "surrogateescape")
+        tmp = out_path.with_name(f".{out_path.name}.{os.getpid()}.tmp")
+        with open(body, "rb") as src, open(tmp, "wb") as dst:
+            dst.write(header)
+            while True:
+                chunk = src.read(1024 * 1024)
+                if not chunk:
+                    break
+                dst.write(chunk)
+        os.replace(tmp, out_path)
+    finally:
+        if body.exists():
+            body.unlink()
+    return result["root"]
+
+
+def records_from_root(root, hash_func, workers=1, io_per_device=0):
+    prefix = str(root).rstrip(os.sep) + os.sep
+    files = list(walk_files([root]))
+    sizes = dict(files)
+    results = hash_paths([p for p, _ in files], workers=workers, io_per_device=io_per_device, hash_func=hash_func)
+    for path, digest in results:
+        if digest is not None:
+            yield path[len(prefix):].replace(os.sep, "/"), digest, sizes[path]
+
+
+def records_from_hash_index(path):
+    with open(path, "r", encoding="utf-8", errors="surrogateescape") as fh:
+        for line in fh:
+            if line.startswith(INDEX_HEADER_PREFIX):
+                continue
+            parts = line.rstrip("\n").split("\t")
+            if len(parts) >= 3 and parts[1]:
+                yield parts[1].replace(os.sep, "/"), parts[0], 0
+
+
+class MerkleIndex:
+    """Read side of a Merkle index: header info plus O(log n) access to a folder's children."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        header = {}
+        start = 0
+        with open(self.path, "rb") as fh:
+            for _ in range(3):
+                line = fh.readline()
+                if not line.startswith(b"# "):
+                    raise ValueError(f"{self.path} is not a Merkle index")
+                start += len(line)
+                text = line.decode("utf-8", "surrogateescape").rstrip("\n")
+                if text.startswith("# root="):
+                    header["root"] = text[len("# root="):]
+                    continue
+                for token in text.split():
+                    key, sep, value = token.partition("=")
+                    if sep:
+                        header[key] = value
+        self.algo = header.get("algo", DEFAULT_ALGO)
+        self.root = header.get("root", "")
+        self.digest = header.get("digest", "")
+        self.source = None
+        if "source_size" in header and "source_mtime_ns" in header:
+            self.source = (int(header["source_size"]), int(header["source_mtime_ns"]))
+        self.lines = SortedLines(self.path, start)
+
+    def children(self, rel=ROOT_REL):
+        """{name: (kind, digest, bytes, files)} of the folder rel."""
+        out = {}
+        for line in self.lines.prefixed(rel.encode("utf-8", "surrogateescape") + b"\t"):
+            _, name, kind, digest, size, count = line.decode("utf-8", "surrogateescape").split("\t")
+            out[name] = (kind, digest, int(size), int(count))
+        return out
+
+    def folders(self):
+        """Yield (rel, digest, bytes, files) for every folder below the root."""
+        for line in self.lines:
+            text = line.decode("utf-8", "surrogateescape").rstrip("\n")
+            parent, name, kind, digest, size, count = text.split("\t")
+            if kind == "D":
+                rel = name if parent == ROOT_REL else f"{parent}/{name}"
+                yield rel, digest, int(size), int(count)
+
+    def close(self):
+        self.lines.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def is_merkle_index(path):
+    with open(path, "r", encoding="utf-8", errors="ignore") as fh:
+        return fh.readline().startswith(MERKLE_HEADER_PREFIX)
+
+
+def source_stat(path):
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+
+def sidecar_path(path, sidecar_dir=None):
+    """<name>.merkle next to a hash index, or <name>.<crc of the full path>.merkle in sidecar_dir."""
+    if sidecar_dir is None:
+        return path.with_name(path.name + ".merkle")
+    key = zlib.crc32(os.fsencode(str(path.resolve())))
+    return Path(sidecar_dir) / f"{path.name}.{key:08x}.merkle"
+
+
+def merkle_for(path, sidecar_dir=None):
+    """Open path as a Merkle index; a hash_index.tsv gets a sidecar, rebuilt unless built from it as it is now."""
+    path = Path(path)
+    if is_merkle_index(path):
+        return MerkleIndex(path)
+    sidecar = sidecar_path(path, sidecar_dir)
+    source = source_stat(path)
+    if sidecar.exists():
+        try:
+            idx = MerkleIndex(sidecar)
+        except ValueError:
+            idx = None
+        if idx is not None:
+            if idx.source == source:
+                return idx
+            idx.close()
+    sidecar.parent.mkdir(parents=True, exist_ok=True)
+    algo = read_index_options(path)["algo"]
+    write_index(records_from_hash_index(path), sidecar, path, algo, source)
+    return MerkleIndex(sidecar)
+
+
+def join_rel(rel, name):
+    return name if rel == ROOT_REL else f"{rel}/{name}"
+
+
+def subtree_files(idx, rel):
+    """Yield (rel, digest) for every file below the folder rel."""
+    for name, (kind, digest, _, _) in sorted(idx.children(rel).items()):
+        path = join_rel(rel, name)
+        if kind == "D":
+            yield from subtree_files(idx, path)
+        else:
+            yield path, digest
+
+
+def diff(a, b, rel=ROOT_REL, stats=None, collapse=False):
+    """Yield (status, rel, kind, digest_a, digest_b), descending only into differing folders.
+
+    status: MISSING_IN_B, MISSING_IN_A, MISMATCH (file content or file/folder clash).
+    A folder missing on one side yields its files, or itself (kind D) with collapse.
+    """
+    if stats is not None:
+        stats["folders_visited"] += 1
+    left = a.children(rel)
+    right = b.children(rel)
+    for name in sorted(left.keys() | right.keys()):
+        path = join_rel(rel, name)
+        ea = left.get(name)
+        eb = right.get(name)
+        if eb is None:
+            if ea[0] == "D" and not collapse:
+                for sub, digest in subtree_files(a, path):
+                    yield "MISSING_IN_B", sub, "F", digest, ""
+            else:
+                yield "MISSING_IN_B", path, ea[0], ea[1], ""
+        elif ea is None:
+            if eb[0] == "D" and not collapse:
+                for sub, digest in subtree_files(b, path):
+                    yield "MISSING_IN_A", sub, "F", "", digest
+            else:
+                yield "MISSING_IN_A", path, eb[0], "", eb[1]
+        elif ea[1] == eb[1]:
+            continue
+        elif ea[0] == eb[0] == "D":
+            yield from diff(a, b, path, stats, collapse)
+        else:
+            yield "MISMATCH", path, ea[0] if ea[0] == eb[0] else "F/D", ea[1], eb[1]
+
+
+def duplicate_folders(indexes):
+    """Groups [(index, rel, bytes, files)] of identical non-empty folder trees, largest first.
+
+    A group is dropped when, for every member, the duplicates of its parent
+    folder contain all the other members (same name below each partner), since
+    the parents' group already reports those pairs.
+    """
+    by_digest = collections.defaultdict(list)
+    digest_of = {}
+    for idx in indexes:
+        for rel, digest, size, count in idx.folders():
+            digest_of[(id(idx), rel)] = digest
+            if count > 0:
+                by_digest[digest].append((idx, rel, size, count))
+    dup_digests = {d for d, members in by_digest.items() if len(members) > 1}
+
+    def implied(idx, rel):
+        """Members implied by the parent's group: the same child below each parent duplicate."""
+        if "/" not in rel:
+            return set()
+        parent, name = rel.rsplit("/", 1)
+        parent_digest = digest_of.get((id(idx), parent))
+        if parent_digest not in dup_digests:
+            return set()
+        return {(id(pidx), f"{prel}/{name}") for pidx, prel, _, _ in by_digest[parent_digest]}
+
+    groups = []
+    for digest in dup_digests:
+        members = by_digest[digest]
+        keys = {(id(idx), rel) for idx, rel, _, _ in members}
+        covered = all(keys <= implied(idx, rel) for idx, rel, _, _ in members)
+        if not covered:
+            groups.append((digest, members))
+    groups.sort(key=lambda g: (-g[1][0][3], g[0]))
+    return groups
+
+
+def abs_path(idx, rel):
+    return os.path.join(idx.root, *rel.split("/"))
+
+
+def cmd_build(args):
+    if args.root:
+        root = args.root.expanduser()
+        if not root.is_dir():
+            print(f"[ERROR] root '{root}' is not a directory.", file=sys.stderr)
+            sys.exit(1)
+        hash_func = partial(hash_file, algo=args.algo)
+        cache = None
+        if args.cache:
+            from hash_cache import HashCache
+
+            cache = HashCache(args.cache)
+            hash_func = cache.cached(hash_func, args.algo)
+        try:
+            records = records_from_root(root, hash_func, args.workers, args.io_per_device)
+            digest, size, count = write_index(records, args.out, root, args.algo)
+        finally:
+            if cache is not None:
+                cache.close()
+    else:
+        algo = read_index_options(args.hash_index)["algo"]
+        digest, size, count = write_index(
+            records_from_hash_index(args.hash_index), args.out, args.hash_index, algo, source_stat(args.hash_index)
+        )
+    print(f"[OK] Merkle index: {args.out} ({count} files, root {digest[:16]})")
+
+
+def cmd_dupes(args):
+    indexes = [MerkleIndex(p) for p in args.index]
+    try:
+        groups = duplicate_folders(indexes)
+        with args.report.open("w", encoding="utf-8", errors="surrogateescape") as report:
+            for digest, members in groups:
+                for idx, rel, size, count in members:
+                    report.write(f"{digest}\t{count} files\t{len(members)}\t{abs_path(idx, rel)}\n")
+        if args.plan:
+            with args.plan.open("w", encoding="utf-8", errors="surrogateescape") as plan:
+                for _, members in groups:
+                    paths = [abs_path(idx, rel) for idx, rel, _, _ in members]
+
+                    def mtime(p):
+                        try:
+                            return os.stat(p).st_mtime
+                        except OSError:
+                            return 0
+
+                    keep = max(paths, key=mtime)
+                    plan.write(f"KEEP\t{keep}\n")
+                    for p in paths:
+                        if p != keep:
+                            plan.write(f"REMOVE\t{p}\n")
+    finally:
+        for idx in indexes:
+            idx.close()
+    print(f"[OK] Carpetas duplicadas: {len(groups)} grupos -> {args.report}")
+
+
+def cmd_diff(args):
+    a = merkle_for(args.a, args.sidecar_dir)
+    b = merkle_for(args.b, args.sidecar_dir)
+    try:
+        if a.algo != b.algo:
+            print(f"[ERROR] {args.a} uses {a.algo} but {args.b} uses {b.algo}.", file=sys.stderr)
+            sys.exit(1)
+        outputs = {
+            "MISSING_IN_B": args.missing_in_b,
+            "MISSING_IN_A": args.missing_in_a,
+            "MISMATCH": args.mismatch,
+        }
+        handles = {
+            k: p.open("w", encoding="utf-8", errors="surrogateescape") if p else sys.stdout
+            for k, p in outputs.items()
+        }
+        stats = collections.Counter()
+        try:
+            # Equal root digests: the trees are identical, nothing to descend into.
+            changes = diff(a, b, stats=stats, collapse=args.collapse_folders) if a.digest != b.digest else ()
+            for status, rel, kind, da, db in changes:
+                stats[status] += 1
+                shown = rel + "/" if kind == "D" else rel
+                if status == "MISMATCH":
+                    line = f"{shown}\tA:{da}\tB:{db}"
+                else:
+                    line = f"{shown}\t{da or db}"
+                handles[status].write(line + "\n" if outputs[status] else f"{status}\t{line}\n")
+        finally:
+            for k, fh in handles.items():
+                if outputs[k]:
+                    fh.close()
+    finally:
+        a.close()
+        b.close()
+    same = "identical" if a.digest == b.digest else "different"
+    print(
+        f"[INFO] Trees {same}; folders visited: {stats['folders_visited']}, "
+        f"missing in B: {stats['MISSING_IN_B']}, missing in A: {stats['MISSING_IN_A']}, "
+        f"mismatches: {stats['MISMATCH']}",
+        file=sys.stderr,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merkle directory index: folder dupes and mirror diffs.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    b = subparsers.add_parser("build", help="Build a Merkle index")
+    src = b.add_mutually_exclusive_group(required=True)
+    src.add_argument("--root", type=Path, help="Folder to hash and index")
+    src.add_argument("--hash-index", type=Path, help="Existing hash_index.tsv (hash, rel, full); nothing is read")
+    b.add_argument("--out", type=Path, required=True, help="Merkle index to (re)write")
+    b.add_argument("--algo", choices=available_algos(), default=DEFAULT_ALGO, help="Digest algorithm with --root")
+    b.add_argument("--workers", type=int, default=4, help="Concurrent hashes with --root (default 4)")
+    b.add_argument("--io-per-device", type=int, default=0, help="Max concurrent reads per device (0 = no limit)")
+    b.add_argument("--cache", type=Path, default=None, help="Optional hash_cache.sqlite")
+
+    d = subparsers.add_parser("dupes", help="Identical folder trees (matrioshkas)")
+    d.add_argument("--index", type=Path, action="append", required=True, help="Merkle index (repeatable)")
+    d.add_argument("--report", type=Path, required=True, help="digest, files, group size, folder")
+    d.add_argument("--plan", type=Path, default=None, help="KEEP (newest) / REMOVE plan")
+
+    c = subparsers.add_parser("diff", help="Compare two trees (Merkle or hash_index.tsv files)")
+    c.add_argument("--a", type=Path, required=True, help="Index A")
+    c.add_argument("--b", type=Path, required=True, help="Index B (mirror)")
+    c.add_argument("--missing-in-b", type=Path, default=None, help="Write entries only in A here")
+    c.add_argument("--missing-in-a", type=Path, default=None, help="Write entries only in B here")
+    c.add_argument("--mismatch", type=Path, default=None, help="Write entries whose content differs here")
+    c.add_argument(
+        "--sidecar-dir",
+        type=Path,
+        default=None,
+        help="Keep the .merkle sidecars of hash_index.tsv inputs here (default: next to each index)",
+    )
+    c.add_argument(
+        "--collapse-folders", action="store_true", help='Report a missing folder once as "rel/" instead of per file'
+    )
+
+    args = parser.parse_args()
+    if args.command == "build":
+        cmd_build(args)
+    elif args.command == "dupes":
+        cmd_dupes(args)
+    elif args.command == "diff":
+        cmd_diff(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+Mirror/sync engine for DJProducerTools driven by two hash indexes.
+A (source) and B (target) are hash_index.tsv files ("hash, rel, full"); the
+delta is found by the same external sort + merge-join as hash_compare.py
+--by path, so no file is re-hashed to plan the sync. Each entry missing in B
+or with another digest there is copied to <dst-root>/<rel> by a bounded pool
+of workers:
+- the copy is hashed while it is written and checked against A's known
+  digest (FLAC STREAMINFO identities are checked on the copy's header), then
+  renamed into place, so the source is read once;
+- each finished copy is appended to B at once, so an interrupted sync
+  resumes with only what is still missing (a torn last line is cut first);
+- B lines replaced by a new digest are dropped at the end (and on the next
+  run if it was interrupted; see <B>.mirror_pending).
+Files only in B are reported, never deleted.
+"""
+import argparse
+import collections
+import itertools
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+from hash_compare import grouped, keyed_lines, merge_join
+from hash_root import (
+    BLOCK_SIZE,
+    FLAC_MD5_PREFIX,
+    INDEX_HEADER_PREFIX,
+    SYNC_EVERY,
+    DeviceLimiter,
+    index_header,
+    new_hasher,
+    read_index_options,
+    recover_index,
+)
+from sorted_index import RUN_LINES, sorted_runs
+
+PART_SUFFIX = ".djpt_part"
+PENDING_SUFFIX = ".mirror_pending"
+
+
+def source_lines(path):
+    """Lines "rel<TAB>hash<TAB>full" of the source index."""
+    header = INDEX_HEADER_PREFIX.encode()
+    with open(path, "rb") as fh:
+        for line in fh:
+            if line.startswith(header):
+                continue
+            parts = line.rstrip(b"\n").split(b"\t", 2)
+            if len(parts) == 3:
+                yield b"%s\t%s\t%s\n" % (parts[1], parts[0], parts[2])
+
+
+def index_root(path):
+    """Root of a hash index, from its first entry (full path minus rel); None when empty."""
+    header = INDEX_HEADER_PREFIX.encode()
+    with open(path, "rb") as fh:
+        for line in fh:
+            if line.startswith(header):
+                continue
+            parts = line.rstrip(b"\n").split(b"\t", 2)
+            if len(parts) == 3 and parts[2].endswith(parts[1]):
+                return os.fsdecode(parts[2][: len(parts[2]) - len(parts[1])].rstrip(b"/")) or "/"
+    return None
+
+
+def delta(index_a, index_b, tmp_dir, run_lines=RUN_LINES):
+    """Yield (rel, digest, src, status): MISSING / MISMATCH entries of A, plus ONLY_IN_B rels (digest and src None)."""
+    runs_a = sorted_runs(source_lines(index_a), tmp_dir, run_lines)
+    runs_b = sorted_runs(keyed_lines(index_b, "path"), tmp_dir, run_lines)
+    try:
+        for rel, va, vb in merge_join(grouped(runs_a), grouped(runs_b)):
+            if not va:
+                yield os.fsdecode(rel), None, None, "ONLY_IN_B"
+                continue
+            digest, src = va[0].split(b"\t", 1)
+            if digest in vb:
+                continue
+            yield os.fsdecode(rel), digest.decode(), os.fsdecode(src), "MISMATCH" if vb else "MISSING"
+    finally:
+        for run in runs_a + runs_b:
+            if os.path.exists(run):
+                os.unlink(run)
+
+
+def copy_checked(src, dest, digest, algo, block_size=BLOCK_SIZE):
+    """Copy src to dest through a .djpt_part file, checked against the digest A recorded."""
+    part = dest + PART_SUFFIX
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    flac = digest.startswith(FLAC_MD5_PREFIX)
+    h = None if flac else new_hasher(algo)
+    copied = 0
+    with open(src, "rb") as fi, open(part, "wb") as fo:
+        while True:
+            chunk = fi.read(block_size)
+            if not chunk:
+                break
+            if h is not None:
+                h.update(chunk)
+            fo.write(chunk)
+            copied += len(chunk)
+        fo.flush()
+        os.fsync(fo.fileno())
+    if flac:
+        from audio_payload import flac_identity
+
+        got = flac_identity(part)
+    else:
+        got = h.hexdigest()
+    if got != digest:
+        os.unlink(part)
+        raise OSError(f"digest distinto (¿origen modificado desde el índice?): {src}")
+    shutil.copystat(src, part)
+    os.rename(part, dest)
+    return copied
+
+
+def compact(index_b, rels):
+    """Keep only the last line of each rel in rels (older digests of replaced files)."""
+    if not rels:
+        return 0
+    header = INDEX_HEADER_PREFIX.encode()
+    counts = collections.Counter()
+
+    def rel_of(line):
+        parts = line.split(b"\t", 2)
+        return parts[1] if len(parts) == 3 and not line.startswith(header) else None
+
+    with open(index_b, "rb") as fh:
+        for line in fh:
+            rel = rel_of(line)
+            if rel in rels:
+                counts[rel] += 1
+    dropped = 0
+    tmp = str(index_b) + ".tmp"
+    with open(index_b, "rb") as fi, open(tmp, "wb") as fo:
+        for line in fi:
+            rel = rel_of(line)
+            if rel in rels and counts[rel] > 1:
+                counts[rel] -= 1
+                dropped += 1
+                continue
+            fo.write(line)
+        fo.flush()
+        os.fsync(fo.fileno())
+    os.replace(tmp, index_b)
+    return dropped
+
+
+def _load_pending(path):
+    if not os.path.exists(path):
+        return set()
+    with open(path, "rb") as fh:
+        return {line.rstrip(b"\n") for line in fh if line.endswith(b"\n")}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Copy to B only what its hash index lacks compared to A.")
+    parser.add_argument("--a", type=Path, required=True, help="Source hash_index.tsv")
+    parser.add_argument("--b", type=Path, required=True, help="Target hash_index.tsv (created if missing)")
+    parser.add_argument("--dst-root", type=Path, default=None, help="Target root (default: from B's entries)")
+    parser.add_argument("--workers", type=int, default=4, help="Parallel copy workers (default 4)")
+    parser.add_argument("--io-per-device", type=int, default=2, help="Concurrent reads per source device (0 = no limit)")
+    parser.add_argument("--limit", type=int, default=0, help="Copy at most N files this run (0 = all)")
+    parser.add_argument("--dry-run", action="store_true", help="Only print what would be copied")
+    parser.add_argument(
+        "--run-lines", type=int, default=RUN_LINES, help=f"Lines per sorted run (default {RUN_LINES})"
+    )
+    parser.add_argument("--tmp-dir", type=Path, default=None, help="Directory for sorted runs (default: B's)")
+    args = parser.parse_args()
+
+    if not args.a.is_file():
+        print(f"[ERROR] No existe: {args.a}", file=sys.stderr)
+        sys.exit(1)
+    opts_a = read_index_options(args.a)
+    if args.b.is_file():
+        opts_b = read_index_options(args.b)
+        if (opts_a["algo"], opts_a["flac"]) != (opts_b["algo"], opts_b["flac"]):
+            print(f"[ERROR] {args.a} and {args.b} were hashed with different options.", file=sys.stderr)
+            sys.exit(1)
+    dst_root = str(args.dst_root) if args.dst_root else (index_root(args.b) if args.b.is_file() else None)
+    if not dst_root:
+        print("[ERROR] B está vacío: indica --dst-root.", file=sys.stderr)
+        sys.exit(1)
+    if not args.b.is_file() and not args.dry_run:
+        args.b.parent.mkdir(parents=True, exist_ok=True)
+        args.b.write_text(index_header(opts_a["algo"], opts_a["flac"] == "md5"), encoding="utf-8")
+    tmp_dir = args.tmp_dir or args.b.resolve().parent
+    pending_path = str(args.b) + PENDING_SUFFIX
+
+    started = time.monotonic()
+    # A run killed mid-write leaves an unterminated last line; appending to it would glue two entries.
+    if args.b.is_file() and not args.dry_run:
+        dropped = recover_index(args.b)
+        if dropped:
+            print(f"[WARN] Descartados {dropped} bytes de una línea incompleta al final de {args.b}", file=sys.stderr)
+    # Replacements of an interrupted run may have left two lines for one rel.
+    stale = _load_pending(pending_path)
+    if stale and not args.dry_run:
+        compact(args.b, stale)
+        os.unlink(pending_path)
+
+    stats = collections.Counter()
+    todo = []
+    if args.b.is_file():
+        for rel, digest, src, status in delta(args.a, args.b, tmp_dir, args.run_lines):
+            stats[status] += 1
+            if status == "ONLY_IN_B":
+                continue
+            if args.limit and len(todo) >= args.limit:
+                stats["pending"] += 1
+                continue
+            todo.append((rel, digest, src, status))
+    else:  # dry run against a target with no index yet
+        for line in source_lines(args.a):
+            rel, digest, src = line.rstrip(b"\n").split(b"\t", 2)
+            stats["MISSING"] += 1
+            todo.append((os.fsdecode(rel), digest.decode(), os.fsdecode(src), "MISSING"))
+    planned = time.monotonic()
+
+    if args.dry_run:
+        for rel, _, src, status in todo:
+            print(f"[DRY] {status} {src} -> {os.path.join(dst_root, rel)}")
+        print(
+            f"[INFO] Faltan en B: {stats['MISSING']} | Hash distinto: {stats['MISMATCH']}"
+            f" | Solo en B: {stats['ONLY_IN_B']}",
+            file=sys.stderr,
+        )
+        return
+
+    replaced = {os.fsencode(rel) for rel, _, _, status in todo if status == "MISMATCH"}
+    if replaced:
+        with open(pending_path, "ab") as fh:
+            fh.writelines(rel + b"\n" for rel in replaced)
+            fh.flush()
+            os.fsync(fh.fileno())
+
+    limiter = DeviceLimiter(args.io_per_device)
+
+    def task(rel, digest, src):
+        dest = os.path.join(dst_root, rel)
+        with limiter.slot(src):
+            return copy_checked(src, dest, digest, opts_a["algo"]), dest
+
+    with open(args.b, "ab") as out, ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        # Submit lazily: at most a few tasks per worker are queued at any time.
+        items = iter(todo)
+        futures = {}
+
+        def submit(n):
+            for rel, digest, src, _ in itertools.islice(items, n):
+                futures[pool.submit(task, rel, digest, src)] = (rel, digest)
+
+        submit(args.workers * 4)
+        while futures:
+            done = next(as_completed(futures))
+            rel, digest = futures.pop(done)
+            try:
+                size, dest = done.result()
+            except OSError as exc:
+                print(f"[WARN] {exc}", file=sys.stderr)
+                stats["failed"] += 1
+            else:
+                out.write(b"%s\t%s\t%s\n" % (digest.encode(), os.fsencode(rel), os.fsencode(dest)))
+                stats["copied"] += 1
+                stats["bytes"] += size
+                if stats["copied"] % SYNC_EVERY == 0:
+                    out.flush()
+                    os.fsync(out.fileno())
+            submit(1)
+        out.flush()
+        os.fsync(out.fileno())
+
+    if replaced:
+        compact(args.b, replaced)
+        os.unlink(pending_path)
+    finished = time.monotonic()
+    mb = stats["bytes"] / (1024 * 1024)
+    copy_s = finished - planned
+    print(
+        f"[INFO] Fases: delta {planned - started:.2f}s | copia {copy_s:.2f}s"
+        f" ({mb / copy_s if copy_s else 0:.1f} MB/s) | total {finished - started:.2f}s",
+        file=sys.stderr,
+    )
+    print(
+        f"[OK] Copiados {stats['copied']} ({mb:.1f} MB) de {stats['MISSING']} faltantes + "
+        f"{stats['MISMATCH']} con hash distinto | errores {stats['failed']} | pendientes {stats['pending']}"
+        f" | solo en B (no se borran) {stats['ONLY_IN_B']}",
+        file=sys.stderr,
+    )
+    sys.exit(1 if stats["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()
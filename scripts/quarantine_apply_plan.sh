@@ -63,6 +63,16 @@ save_offset() {
 quar_dir="$STATE_DIR/quarantine"
 mkdir -p "$quar_dir"
 
+# Con python3 se usa el ejecutor con journal: cada lote son batch_size movimientos
+# y relanzar continúa por donde quedó (--offset/--resume no hacen falta).
+if command -v python3 >/dev/null 2>&1 && [ -f "$script_dir/quarantine_executor.py" ]; then
+    log "Ejecutor con journal (batch_size=$batch_size, plan=$PLAN_FILE)"
+    rc=0
+    python3 "$script_dir/quarantine_executor.py" --quarantine-dir "$quar_dir" \
+        apply --plan "$PLAN_FILE" --limit "$batch_size" 2>&1 | tee -a "$LOG_FILE" || rc=$?
+    exit "$rc"
+fi
+
 processed=0
 errors=0
 start_line=$((offset + 1))
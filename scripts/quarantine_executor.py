@@ -0,0 +1,656 @@
+#!/usr/bin/env python3
+"""
+Journaled quarantine executor for DJProducerTools dupes plans.
+Moves the QUARANTINE entries of a plan ("hash<TAB>action<TAB>path") to
+<quarantine>/<hash>/<name>, as quarantine_apply_plan.sh does, but:
+- entries are grouped by source device: sources on the quarantine's
+  filesystem are moved with os.rename (metadata only), the rest go through a
+  bounded pool of copy -> verify digest -> rename -> unlink workers, capped
+  per source device;
+- every move is written to an fsync'd journal (MOVE before, DONE/FAIL after),
+  so re-running apply resumes exactly where it stopped, in-flight moves are
+  reconciled, and restore can put files back where they came from (a whole
+  run, or everything).
+Journal lines: "MOVE|DONE|FAIL|UNDO|RESTORED<TAB>run<TAB>src[<TAB>dest|error]".
+
+link is the in-place alternative: each QUARANTINE copy on the same filesystem
+as its KEEP is replaced by a reflink (copy-on-write clone, where the
+filesystem supports it) or a hardlink of the KEEP, after both digests match.
+Space comes back at once and playlists keep their paths. It has its own
+journal ("LINK<TAB>run<TAB>path<TAB>keep<TAB>meta"), and unlink turns linked
+entries back into standalone copies.
+"""
+import argparse
+import collections
+import ctypes
+import ctypes.util
+import errno
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+from hash_root import BLOCK_SIZE, DEFAULT_ALGO, SYNC_EVERY, DeviceLimiter, available_algos, hash_file, new_hasher
+
+PART_SUFFIX = ".djpt_part"
+JOURNAL_NAME = "quarantine_journal.tsv"
+LINK_JOURNAL_NAME = "link_journal.tsv"
+FICLONE = 0x40049409  # linux/fs.h
+# errnos meaning "this filesystem cannot clone", as opposed to a real failure
+NO_REFLINK = {errno.EOPNOTSUPP, errno.ENOTTY, errno.EINVAL, errno.EXDEV, errno.ENOSYS}
+
+
+def _b(path):
+    return os.fsencode(path)
+
+
+class Journal:
+    """Append-only move journal; state maps src -> [run, dest, status].
+
+    MOVE and LINK records open an entry (dest is the quarantine path or the
+    KEEP); a LINK's meta column is kept in self.meta.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.state = {}
+        self.meta = {}
+        self.runs = []
+        if self.path.exists():
+            self._load()
+        self.fh = open(self.path, "ab")
+
+    def _load(self):
+        with open(self.path, "rb") as fh:
+            for line in fh:
+                if not line.endswith(b"\n"):
+                    break  # torn last record of a crashed run
+                parts = line.rstrip(b"\n").split(b"\t")
+                if len(parts) < 3:
+                    continue
+                kind, run, src = parts[0].decode(), parts[1].decode(), os.fsdecode(parts[2])
+                if run not in self.runs:
+                    self.runs.append(run)
+                extra = os.fsdecode(parts[3]) if len(parts) > 3 else ""
+                self._apply(kind, run, src, extra, parts[4].decode() if len(parts) > 4 else "")
+
+    def _apply(self, kind, run, src, extra, meta):
+        entry = self.state.setdefault(src, [run, "", kind])
+        if kind in ("MOVE", "LINK"):
+            entry[:] = [run, extra, kind]
+            if meta:
+                self.meta[src] = meta
+        else:
+            entry[2] = kind
+
+    def record(self, kind, run, src, extra="", meta=""):
+        fields = [kind.encode(), run.encode(), _b(src), _b(extra)]
+        if meta:
+            fields.append(meta.encode())
+        self.fh.write(b"\t".join(fields) + b"\n")
+        self._apply(kind, run, src, extra, meta)
+
+    def sync(self):
+        self.fh.flush()
+        os.fsync(self.fh.fileno())
+
+    def close(self):
+        self.sync()
+        self.fh.close()
+
+
+def read_state(path):
+    """state of an existing journal, {} when there is none."""
+    if not os.path.exists(path):
+        return {}
+    journal = Journal(path)
+    journal.close()
+    return journal.state
+
+
+def _fsync_dir(path):
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def copy_verify_unlink(src, dest, algo=DEFAULT_ALGO, block_size=BLOCK_SIZE):
+    """Copy src next to dest, check the copy's digest, rename it into place, then unlink src."""
+    part = dest + PART_SUFFIX
+    h = new_hasher(algo)
+    with open(src, "rb") as fi, open(part, "wb") as fo:
+        while True:
+            chunk = fi.read(block_size)
+            if not chunk:
+                break
+            h.update(chunk)
+            fo.write(chunk)
+        fo.flush()
+        os.fsync(fo.fileno())
+    shutil.copystat(src, part)
+    if hash_file(part, algo, block_size) != h.hexdigest():
+        os.unlink(part)
+        raise OSError(f"verify failed: {dest}")
+    os.rename(part, dest)
+    _fsync_dir(os.path.dirname(dest))
+    os.unlink(src)
+
+
+def reconcile(src, dest, algo):
+    """Outcome of a move that was in flight when a run stopped: "done", "redo" or "missing"."""
+    part = dest + PART_SUFFIX
+    if os.path.exists(part):
+        os.unlink(part)
+    src_there, dest_there = os.path.lexists(src), os.path.lexists(dest)
+    if dest_there and not src_there:
+        return "done"
+    if dest_there and src_there:
+        # dest only appears after its digest was verified; the unlink was all that was left.
+        if hash_file(dest, algo) == hash_file(src, algo):
+            os.unlink(src)
+            return "done"
+        return "redo"
+    return "redo" if src_there else "missing"
+
+
+def quarantine_dest(quar_dir, digest, src, taken):
+    """<quar>/<hash>/<name>, suffixed __N when that name is already used."""
+    folder = os.path.join(quar_dir, digest)
+    stem, ext = os.path.splitext(os.path.basename(src))
+    dest = os.path.join(folder, stem + ext)
+    n = 1
+    while dest in taken or os.path.lexists(dest):
+        dest = os.path.join(folder, f"{stem}__{n}{ext}")
+        n += 1
+    taken.add(dest)
+    return dest
+
+
+def plan_entries(plan):
+    with open(plan, "rb") as fh:
+        for line in fh:
+            parts = line.rstrip(b"\n").split(b"\t", 2)
+            if len(parts) == 3 and parts[1] == b"QUARANTINE":
+                yield parts[0].decode("utf-8", "replace"), os.fsdecode(parts[2])
+
+
+def plan_links(plan):
+    """Yield (digest, path, keep) for each QUARANTINE entry, keep being its group's KEEP."""
+    keep = {}
+    with open(plan, "rb") as fh:
+        for line in fh:
+            parts = line.rstrip(b"\n").split(b"\t", 2)
+            if len(parts) != 3:
+                continue
+            if parts[1] == b"KEEP":
+                keep = {parts[0]: os.fsdecode(parts[2])}  # groups are contiguous
+            elif parts[1] == b"QUARANTINE" and parts[0] in keep:
+                yield parts[0].decode("utf-8", "replace"), os.fsdecode(parts[2]), keep[parts[0]]
+
+
+def new_run(journal):
+    """Run id for this invocation: a timestamp, suffixed when the journal already has it."""
+    run = stamp = time.strftime("%Y%m%dT%H%M%S")
+    n = 1
+    while run in journal.runs:
+        run = f"{stamp}-{n}"
+        n += 1
+    return run
+
+
+def _dir_device(path, cache):
+    """st_dev of the nearest existing folder of path (cached per folder)."""
+    folder = os.path.dirname(path)
+    dev = cache.get(folder)
+    if dev is None:
+        probe = folder
+        while not os.path.isdir(probe) and os.path.dirname(probe) != probe:
+            probe = os.path.dirname(probe)
+        dev = cache[folder] = os.stat(probe).st_dev
+    return dev
+
+
+def run_moves(moves, journal, run, args, kinds=("MOVE", "DONE", "FAIL")):
+    """Execute (src, dest) moves and journal them; returns a Counter.
+
+    Moves within one filesystem are os.rename calls journaled in fsync'd
+    batches; the rest go to a pool of copy-verify-unlink workers, interleaved
+    across source devices and capped per device. kinds are the records
+    written before/after/on failure of each move; entries are keyed by their
+    original path (src when quarantining, dest when restoring).
+    """
+    start_kind, done_kind, fail_kind = kinds
+
+    def key(src, dest):
+        return src if start_kind == "MOVE" else dest
+
+    def begin(src, dest):
+        journal.record(start_kind, run, key(src, dest), dest if start_kind == "MOVE" else "")
+
+    stats = collections.Counter()
+    dev_cache = {}
+    renames = []
+    copies = collections.defaultdict(list)
+    for src, dest in moves:
+        try:
+            src_dev = os.stat(src).st_dev
+            same = src_dev == _dir_device(dest, dev_cache)
+        except OSError as exc:
+            journal.record(fail_kind, run, key(src, dest), str(exc))
+            stats["failed"] += 1
+            continue
+        (renames if same else copies[src_dev]).append((src, dest))
+
+    for i in range(0, len(renames), SYNC_EVERY):
+        batch = renames[i : i + SYNC_EVERY]
+        for src, dest in batch:
+            begin(src, dest)
+        journal.sync()
+        for src, dest in batch:
+            try:
+                os.makedirs(os.path.dirname(dest), exist_ok=True)
+                os.rename(src, dest)
+            except OSError as exc:
+                if exc.errno == errno.EXDEV:
+                    copies[None].append((src, dest))
+                    continue
+                journal.record(fail_kind, run, key(src, dest), str(exc))
+                stats["failed"] += 1
+                continue
+            journal.record(done_kind, run, key(src, dest))
+            stats["renamed"] += 1
+        journal.sync()
+
+    # Round-robin over source devices so the pool keeps every disk busy.
+    queues = [collections.deque(items) for items in copies.values()]
+    order = []
+    while queues:
+        for q in list(queues):
+            order.append(q.popleft())
+            if not q:
+                queues.remove(q)
+    limiter = DeviceLimiter(args.io_per_device)
+
+    def task(src, dest):
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        with limiter.slot(src):
+            copy_verify_unlink(src, dest, args.algo)
+
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        futures = {}
+        for src, dest in order:
+            begin(src, dest)
+            journal.sync()
+            futures[pool.submit(task, src, dest)] = key(src, dest)
+        for fut in as_completed(futures):
+            try:
+                fut.result()
+            except OSError as exc:
+                journal.record(fail_kind, run, futures[fut], str(exc))
+                stats["failed"] += 1
+            else:
+                journal.record(done_kind, run, futures[fut])
+                stats["copied"] += 1
+            journal.sync()
+    return stats
+
+
+def cmd_apply(args):
+    quar_dir = os.path.abspath(args.quarantine_dir)
+    os.makedirs(quar_dir, exist_ok=True)
+    journal = Journal(args.journal or os.path.join(quar_dir, JOURNAL_NAME))
+    run = new_run(journal)
+    linked = read_state(os.path.join(quar_dir, LINK_JOURNAL_NAME))
+    stats = collections.Counter()
+    taken = set()
+    moves = []
+    try:
+        for digest, src in plan_entries(args.plan):
+            entry = journal.state.get(src)
+            if entry and entry[2] == "DONE":
+                stats["already"] += 1
+                continue
+            if linked.get(src, ("", "", ""))[2] == "DONE":
+                stats["linked"] += 1  # replaced in place by link; moving it would undo the saving
+                continue
+            if entry and entry[2] == "MOVE":
+                outcome = reconcile(src, entry[1], args.algo)
+                if outcome == "done":
+                    journal.record("DONE", entry[0], src)
+                    stats["recovered"] += 1
+                    continue
+                if outcome == "missing":
+                    journal.record("FAIL", entry[0], src, "missing")
+                    stats["failed"] += 1
+                    continue
+            if not os.path.lexists(src):
+                stats["missing"] += 1
+                continue
+            if args.limit and len(moves) >= args.limit:
+                stats["pending"] += 1
+                continue
+            dest = quarantine_dest(quar_dir, digest, src, taken)
+            if args.dry_run:
+                print(f"[DRY] mover \"{src}\" -> \"{dest}\"")
+                continue
+            moves.append((src, dest))
+        journal.sync()
+        stats.update(run_moves(moves, journal, run, args))
+    finally:
+        journal.close()
+    print(
+        f"[OK] Run {run}: renombrados {stats['renamed']}, copiados {stats['copied']}, "
+        f"recuperados {stats['recovered']}, ya en quarantine {stats['already']}, "
+        f"no encontrados {stats['missing']}, enlazados {stats['linked']}, errores {stats['failed']}, "
+        f"pendientes {stats['pending']}"
+    )
+    return 1 if stats["failed"] else 0
+
+
+def cmd_restore(args):
+    quar_dir = os.path.abspath(args.quarantine_dir)
+    journal = Journal(args.journal or os.path.join(quar_dir, JOURNAL_NAME))
+    run = args.run or (journal.runs[-1] if args.last and journal.runs else None)
+    stats = collections.Counter()
+    by_run = collections.defaultdict(list)
+    try:
+        # One latest entry per original path, so order does not matter (run_moves runs them in
+        # parallel anyway); the list is a snapshot because record() updates entries as we go.
+        for src, (entry_run, dest, status) in list(journal.state.items()):
+            if (run and entry_run != run) or status not in ("DONE", "UNDO"):
+                continue
+            if status == "UNDO":
+                outcome = reconcile(dest, src, args.algo)
+                if outcome == "done":
+                    journal.record("RESTORED", entry_run, src)
+                    stats["recovered"] += 1
+                    continue
+            if not os.path.lexists(dest):
+                stats["missing"] += 1
+                continue
+            if os.path.lexists(src):
+                print(f"[WARN] Ya existe, no se sobrescribe: {src}", file=sys.stderr)
+                stats["skipped"] += 1
+                continue
+            if args.dry_run:
+                print(f"[DRY] restaurar \"{dest}\" -> \"{src}\"")
+                continue
+            by_run[entry_run].append((dest, src))
+        for entry_run, moves in by_run.items():
+            # A failed restore leaves the file quarantined: its entry goes back to DONE.
+            stats.update(run_moves(moves, journal, entry_run, args, ("UNDO", "RESTORED", "DONE")))
+    finally:
+        journal.close()
+    restored = stats["renamed"] + stats["copied"] + stats["recovered"]
+    print(
+        f"[OK] Restaurados: {restored}, no encontrados {stats['missing']}, "
+        f"omitidos {stats['skipped']}, errores {stats['failed']}"
+    )
+    return 1 if stats["failed"] else 0
+
+
+def cmd_status(args):
+    name = LINK_JOURNAL_NAME if args.links else JOURNAL_NAME
+    journal = Journal(args.journal or os.path.join(os.path.abspath(args.quarantine_dir), name))
+    journal.close()
+    counts = collections.defaultdict(collections.Counter)
+    for run, _, status in journal.state.values():
+        counts[run][status] += 1
+    for run in journal.runs:
+        print(f"{run}\t" + "\t".join(f"{k}={v}" for k, v in sorted(counts[run].items())))
+    return 0
+
+
+def reflink(src, dest):
+    """Create dest as a copy-on-write clone of src; OSError where the filesystem cannot clone."""
+    if sys.platform == "darwin":
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        if libc.clonefile(os.fsencode(src), os.fsencode(dest), 0) != 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), dest)
+        return
+    import fcntl
+
+    with open(src, "rb") as fi, open(dest, "wb") as fo:
+        try:
+            fcntl.ioctl(fo.fileno(), FICLONE, fi.fileno())
+        except OSError:
+            os.unlink(dest)
+            raise
+
+
+def _link_one(path, keep, mode, no_reflink):
+    """Replace path by a link to keep; returns the mode used.
+
+    The link is built next to path and renamed over it, so path is never
+    missing. no_reflink collects devices that refused a clone (auto mode).
+    """
+    tmp = path + PART_SUFFIX
+    if os.path.lexists(tmp):
+        os.unlink(tmp)
+    st = os.stat(path)
+    used = "hardlink"
+    if mode != "hardlink" and st.st_dev not in no_reflink:
+        try:
+            reflink(keep, tmp)
+            shutil.copystat(path, tmp)
+            used = "reflink"
+        except OSError as exc:
+            if mode == "reflink" or exc.errno not in NO_REFLINK:
+                raise
+            no_reflink.add(st.st_dev)
+    if used == "hardlink":
+        os.link(keep, tmp)
+    os.rename(tmp, path)
+    return used
+
+
+def cmd_link(args):
+    quar_dir = os.path.abspath(args.quarantine_dir)
+    os.makedirs(quar_dir, exist_ok=True)
+    journal = Journal(args.journal or os.path.join(quar_dir, LINK_JOURNAL_NAME))
+    moved = read_state(os.path.join(quar_dir, JOURNAL_NAME))
+    run = new_run(journal)
+    stats = collections.Counter()
+    keep_digest = {}
+    no_reflink = set()
+    batch = []
+
+    def flush():
+        journal.sync()
+        for path, keep in batch:
+            try:
+                used = _link_one(path, keep, args.mode, no_reflink)
+            except OSError as exc:
+                journal.record("FAIL", run, path, str(exc))
+                stats["failed"] += 1
+                continue
+            journal.record("DONE", run, path)
+            stats[used] += 1
+        journal.sync()
+        batch.clear()
+
+    try:
+        for _, path, keep in plan_links(args.plan):
+            entry = journal.state.get(path)
+            if (entry and entry[2] == "DONE") or moved.get(path, ("", "", ""))[2] == "DONE":
+                stats["already"] += 1
+                continue
+            try:
+                st, kst = os.stat(path), os.stat(keep)
+            except OSError:
+                stats["missing"] += 1
+                continue
+            if st.st_dev != kst.st_dev:
+                stats["other_fs"] += 1  # left for apply (quarantine move)
+                continue
+            if (st.st_dev, st.st_ino) == (kst.st_dev, kst.st_ino):
+                stats["already"] += 1
+                continue
+            if args.limit and stats["verified"] >= args.limit:
+                stats["pending"] += 1
+                continue
+            # Full-file digests on both sides: a plan built from FLAC audio MD5s
+            # or another algo never gets two different files linked.
+            if st.st_size != kst.st_size:
+                stats["differ"] += 1
+                continue
+            try:
+                if keep not in keep_digest:
+                    keep_digest = {keep: hash_file(keep, args.algo)}
+                same = hash_file(path, args.algo) == keep_digest[keep]
+            except OSError as exc:
+                journal.record("FAIL", run, path, str(exc))
+                stats["failed"] += 1
+                continue
+            if not same:
+                stats["differ"] += 1
+                continue
+            stats["verified"] += 1
+            if args.dry_run:
+                print(f"[DRY] enlazar \"{path}\" -> \"{keep}\"")
+                continue
+            meta = f"{st.st_mode & 0o7777:o}:{st.st_atime_ns}:{st.st_mtime_ns}"
+            journal.record("LINK", run, path, keep, meta)
+            batch.append((path, keep))
+            if len(batch) >= SYNC_EVERY:
+                flush()
+        flush()
+    finally:
+        journal.close()
+    print(
+        f"[OK] Run {run}: reflinks {stats['reflink']}, hardlinks {stats['hardlink']}, "
+        f"ya enlazados {stats['already']}, otro filesystem {stats['other_fs']}, "
+        f"contenido distinto {stats['differ']}, no encontrados {stats['missing']}, "
+        f"errores {stats['failed']}, pendientes {stats['pending']}"
+    )
+    return 1 if stats["failed"] else 0
+
+
+def unlink_copy(path, keep, meta, algo=DEFAULT_ALGO, block_size=BLOCK_SIZE):
+    """Turn a linked path back into a standalone copy of keep with its original mode and times."""
+    part = path + PART_SUFFIX
+    h = new_hasher(algo)
+    with open(keep, "rb") as fi, open(part, "wb") as fo:
+        while True:
+            chunk = fi.read(block_size)
+            if not chunk:
+                break
+            h.update(chunk)
+            fo.write(chunk)
+        fo.flush()
+        os.fsync(fo.fileno())
+    if hash_file(part, algo, block_size) != h.hexdigest():
+        os.unlink(part)
+        raise OSError(f"verify failed: {path}")
+    if meta:
+        perm, atime, mtime = meta.split(":")
+        os.chmod(part, int(perm, 8))
+        os.utime(part, ns=(int(atime), int(mtime)))
+    os.rename(part, path)
+    _fsync_dir(os.path.dirname(path))
+
+
+def cmd_unlink(args):
+    quar_dir = os.path.abspath(args.quarantine_dir)
+    journal = Journal(args.journal or os.path.join(quar_dir, LINK_JOURNAL_NAME))
+    run = args.run or (journal.runs[-1] if args.last and journal.runs else None)
+    stats = collections.Counter()
+    try:
+        for path, (entry_run, keep, status) in reversed(list(journal.state.items())):
+            # An interrupted LINK may or may not have replaced path: undo it as well.
+            if (run and entry_run != run) or status not in ("DONE", "LINK"):
+                continue
+            if not os.path.exists(path) or not os.path.exists(keep):
+                stats["missing"] += 1
+                continue
+            if args.dry_run:
+                print(f"[DRY] separar \"{path}\" de \"{keep}\"")
+                continue
+            try:
+                unlink_copy(path, keep, journal.meta.get(path, ""), args.algo)
+            except OSError as exc:
+                print(f"[WARN] {exc}", file=sys.stderr)
+                stats["failed"] += 1
+                continue
+            journal.record("UNLINKED", entry_run, path)
+            stats["restored"] += 1
+            if stats["restored"] % SYNC_EVERY == 0:
+                journal.sync()
+    finally:
+        journal.close()
+    print(
+        f"[OK] Copias independientes restauradas: {stats['restored']}, "
+        f"no encontrados {stats['missing']}, errores {stats['failed']}"
+    )
+    return 1 if stats["failed"] else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Journaled quarantine executor for dupes plans.")
+    parser.add_argument(
+        "--quarantine-dir",
+        type=Path,
+        default=Path(__file__).resolve().parents[1] / "_DJProducerTools" / "quarantine",
+        help="Quarantine folder",
+    )
+    parser.add_argument("--journal", type=Path, default=None, help=f"Journal (default <quarantine>/{JOURNAL_NAME})")
+    parser.add_argument("--workers", type=int, default=4, help="Cross-device copy workers (default 4)")
+    parser.add_argument("--io-per-device", type=int, default=1, help="Concurrent copies per source device (0 = no limit)")
+    parser.add_argument("--algo", choices=available_algos(), default=DEFAULT_ALGO, help="Digest used to verify copies")
+    parser.add_argument("--dry-run", action="store_true", help="Only print what would be moved")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    p = subparsers.add_parser("apply", help="Move QUARANTINE entries (re-run to resume)")
+    p.add_argument("--plan", type=Path, required=True, help="dupes plan TSV")
+    p.add_argument("--limit", type=int, default=0, help="Move at most N entries this run (0 = all)")
+    p = subparsers.add_parser("restore", help="Move journaled files back to their original paths")
+    p.add_argument("--run", default=None, help="Only this run id (see status)")
+    p.add_argument("--last", action="store_true", help="Only the last run (rollback)")
+    p = subparsers.add_parser(
+        "link", help="Replace same-filesystem QUARANTINE copies by reflinks/hardlinks of their KEEP"
+    )
+    p.add_argument("--plan", type=Path, required=True, help="dupes plan TSV")
+    p.add_argument(
+        "--mode",
+        choices=("auto", "reflink", "hardlink"),
+        default="auto",
+        help="auto: reflink where the filesystem supports it, else hardlink (hardlinks share tags/metadata)",
+    )
+    p.add_argument("--limit", type=int, default=0, help="Link at most N entries this run (0 = all)")
+    p = subparsers.add_parser("unlink", help="Turn linked entries back into standalone copies")
+    p.add_argument("--run", default=None, help="Only this run id (see status --links)")
+    p.add_argument("--last", action="store_true", help="Only the last link run")
+    p = subparsers.add_parser("status", help="Journal summary per run")
+    p.add_argument("--links", action="store_true", help=f"Summarise {LINK_JOURNAL_NAME} instead")
+    args = parser.parse_args()
+
+    if args.command == "apply":
+        if not args.plan.is_file():
+            print(f"[ERROR] No existe el plan: {args.plan}", file=sys.stderr)
+            sys.exit(1)
+        sys.exit(cmd_apply(args))
+    elif args.command == "restore":
+        sys.exit(cmd_restore(args))
+    elif args.command == "link":
+        if not args.plan.is_file():
+            print(f"[ERROR] No existe el plan: {args.plan}", file=sys.stderr)
+            sys.exit(1)
+        sys.exit(cmd_link(args))
+    elif args.command == "unlink":
+        sys.exit(cmd_unlink(args))
+    else:
+        sys.exit(cmd_status(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+"""
+Rate-limited integrity scrub for DJProducerTools.
+Re-reads files listed in hash indexes (hash_index.tsv "hash, rel, full" and
+external_hashes.tsv "hash, path") and compares them with the recorded digest,
+a little at a time, so a whole archive is covered over days or weeks:
+- reads are paced to a --mb-per-s and --iops budget (and the process is
+  niced), so a scrub never saturates the disk;
+- the files verified longest ago (never-verified first) go first, and every
+  verify timestamp is kept in scrub_state.sqlite, so each run picks up where
+  the last one stopped;
+- a digest mismatch on a file whose size and mtime did not change since the
+  last verify is corruption and goes to the report in the
+  mirror_hash_mismatch format "rel<TAB>A:expected<TAB>B:actual"; files
+  modified since are counted as MODIFIED instead. Indexes record no per-file
+  size/mtime, so on the first verify a file is unchanged when hash_cache.sqlite
+  (--cache) holds its current (dev, ino, size, mtime) with another digest, or
+  when its mtime is not newer than the index that listed the digest.
+FLAC STREAMINFO identities (--flac-md5 indexes) carry no file digest and are
+skipped.
+
+CLI:
+  run     verify the next files within a time/size budget
+  status  counts per status and the oldest verify timestamp
+  report  write every file currently marked CORRUPT
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+from bulk_reader import add_cache_mode_argument, add_order_argument, physical_key, read_chunks
+from hash_cache import HashCache
+from hash_root import BLOCK_SIZE, FLAC_MD5_PREFIX, INDEX_HEADER_PREFIX, new_hasher, read_index_options
+
+COMMIT_EVERY = 64
+
+
+class Budget:
+    """Sleeps so that bytes and read calls stay under mb_per_s and iops since start (0 = unlimited)."""
+
+    def __init__(self, mb_per_s, iops):
+        self.rate = mb_per_s * 1024 * 1024
+        self.iops = iops
+        self.start = time.monotonic()
+        self.bytes = 0
+        self.ops = 0
+
+    def spend(self, nbytes, ops=1):
+        self.bytes += nbytes
+        self.ops += ops
+        due = max(self.bytes / self.rate if self.rate else 0, self.ops / self.iops if self.iops else 0)
+        ahead = due - (time.monotonic() - self.start)
+        if ahead > 0:
+            time.sleep(ahead)
+
+
+class ScrubState:
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.path))
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            " path TEXT PRIMARY KEY, rel TEXT, digest TEXT, algo TEXT, index_path TEXT,"
+            " size INTEGER, mtime_ns INTEGER, verified_at REAL DEFAULT 0, status TEXT DEFAULT '',"
+            " actual TEXT DEFAULT '', gen INTEGER, indexed_ns INTEGER)"
+        )
+        # indexed_ns: mtime of the index file when it first listed the current digest.
+        if "indexed_ns" not in {row[1] for row in self.conn.execute("PRAGMA table_info(files)")}:
+            self.conn.execute("ALTER TABLE files ADD COLUMN indexed_ns INTEGER")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS files_verified ON files (verified_at)")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS indexes (path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, gen INTEGER)"
+        )
+
+    def sync_index(self, index):
+        """Load an index's rows unless it is unchanged since the last sync; returns rows loaded."""
+        st = os.stat(index)
+        key = str(Path(index).resolve())
+        row = self.conn.execute("SELECT size, mtime_ns, gen FROM indexes WHERE path=?", (key,)).fetchone()
+        if row and row[:2] == (st.st_size, st.st_mtime_ns):
+            return 0
+        gen = (row[2] + 1) if row else 1
+        algo = read_index_options(index)["algo"]
+        rows = 0
+        cur = self.conn.cursor()
+        # A new digest for a path resets its verify state; an unchanged one keeps it.
+        for digest, rel, full in index_rows(index):
+            cur.execute(
+                "INSERT INTO files (path, rel, digest, algo, index_path, gen, indexed_ns) VALUES (?, ?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT(path) DO UPDATE SET rel=excluded.rel, gen=excluded.gen, index_path=excluded.index_path,"
+                " verified_at=CASE WHEN digest=excluded.digest THEN verified_at ELSE 0 END,"
+                " status=CASE WHEN digest=excluded.digest THEN status ELSE '' END,"
+                " size=CASE WHEN digest=excluded.digest THEN size ELSE NULL END,"
+                " mtime_ns=CASE WHEN digest=excluded.digest THEN mtime_ns ELSE NULL END,"
+                " indexed_ns=CASE WHEN digest=excluded.digest THEN COALESCE(indexed_ns, excluded.indexed_ns)"
+                "  ELSE excluded.indexed_ns END,"
+                " digest=excluded.digest, algo=excluded.algo",
+                (full, rel, digest, algo, key, gen, st.st_mtime_ns),
+            )
+            rows += 1
+        cur.execute("DELETE FROM files WHERE index_path=? AND gen<>?", (key, gen))
+        cur.execute("INSERT OR REPLACE INTO indexes VALUES (?, ?, ?, ?)", (key, st.st_size, st.st_mtime_ns, gen))
+        self.conn.commit()
+        return rows
+
+    def next_batch(self, before, limit):
+        """Files last verified before `before`, oldest first."""
+        return self.conn.execute(
+            "SELECT path, rel, digest, algo, size, mtime_ns, status, actual, indexed_ns FROM files WHERE verified_at < ?"
+            " ORDER BY verified_at LIMIT ?",
+            (before, limit),
+        ).fetchall()
+
+    def mark(self, path, status, actual="", size=None, mtime_ns=None):
+        self.conn.execute(
+            "UPDATE files SET verified_at=?, status=?, actual=?, size=COALESCE(?, size), mtime_ns=COALESCE(?, mtime_ns)"
+            " WHERE path=?",
+            (time.time(), status, actual, size, mtime_ns, path),
+        )
+
+    def counts(self):
+        return dict(self.conn.execute("SELECT status, COUNT(*) FROM files GROUP BY status").fetchall())
+
+    def oldest(self):
+        return self.conn.execute("SELECT MIN(verified_at) FROM files").fetchone()[0]
+
+    def corrupt(self):
+        return self.conn.execute("SELECT rel, digest, actual FROM files WHERE status='CORRUPT' ORDER BY rel").fetchall()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+
+def index_rows(path):
+    """(digest, rel, full) of a hash index; external "hash, path" rows use the path as rel."""
+    header = INDEX_HEADER_PREFIX
+    with open(path, "r", encoding="utf-8", errors="surrogateescape") as fh:
+        for line in fh:
+            if line.startswith(header):
+                continue
+            parts = line.rstrip("\n").split("\t")
+            if len(parts) >= 3:
+                yield parts[0], parts[1], parts[2]
+            elif len(parts) == 2 and parts[0]:
+                yield parts[0], parts[1], parts[1]
+
+
+def verify_file(path, algo, budget, block_size=BLOCK_SIZE, cache_mode="keep"):
+    """Paced digest of a file."""
+    h = new_hasher(algo)
+    budget.spend(0)  # the open
+    for chunk in read_chunks(path, cache_mode, block_size):
+        h.update(chunk)
+        budget.spend(len(chunk))
+    return h.hexdigest()
+
+
+def unchanged_since_index(st, actual, algo, indexed_ns, cache=None):
+    """First verify: True when a mismatching file was not rewritten after it was indexed.
+
+    A hash_cache entry for the file's current stat settles it (another digest for the
+    same stat means the content changed underneath); otherwise an mtime not newer
+    than the index that listed the digest does.
+    """
+    cached = cache.lookup(st, algo) if cache is not None else None
+    if cached is not None:
+        return cached != actual
+    return indexed_ns is not None and st.st_mtime_ns <= indexed_ns
+
+
+def scrub(
+    state,
+    budget,
+    max_seconds=0,
+    max_bytes=0,
+    max_files=0,
+    report=None,
+    progress=None,
+    cache_mode="keep",
+    order="walk",
+    cache=None,
+):
+    """Verify files oldest-first until a limit is hit or every file was verified once; returns counts.
+
+    With order "inode"/"extent" each batch of the oldest files is read in on-disk order.
+    cache is an optional HashCache consulted on first verifies.
+    """
+    started = time.time()
+    stats = {"OK": 0, "CORRUPT": 0, "MODIFIED": 0, "MISSING": 0, "SKIPPED": 0, "bytes": 0}
+    done = 0
+    while True:
+        batch = state.next_batch(started, COMMIT_EVERY)
+        if not batch:
+            break
+        if order != "walk":
+            batch.sort(key=lambda row: physical_key(row[0], order))
+        for path, rel, digest, algo, size, mtime_ns, last_status, last_actual, indexed_ns in batch:
+            if (max_seconds and time.time() - started >= max_seconds) or (max_bytes and stats["bytes"] >= max_bytes) or (
+                max_files and done >= max_files
+            ):
+                state.conn.commit()
+                return stats
+            done += 1
+            if digest.startswith(FLAC_MD5_PREFIX):
+                state.mark(path, "SKIPPED")
+                stats["SKIPPED"] += 1
+                continue
+            try:
+                st = os.stat(path)
+                actual = verify_file(path, algo, budget, cache_mode=cache_mode)
+            except OSError:
+                state.mark(path, "MISSING")
+                stats["MISSING"] += 1
+                continue
+            stats["bytes"] += st.st_size
+            if actual == digest:
+                status = "OK"
+            elif size is None:
+                # First verify: the index has no per-file size/mtime to compare against.
+                status = "CORRUPT" if unchanged_since_index(st, actual, algo, indexed_ns, cache) else "MODIFIED"
+            elif last_status == "MODIFIED" and actual == last_actual:
+                status = "MODIFIED"  # still the rewritten content seen last time
+            elif (st.st_size, st.st_mtime_ns) != (size, mtime_ns):
+                status = "MODIFIED"  # rewritten since the last verify
+            else:
+                status = "CORRUPT"
+            if status == "CORRUPT" and report is not None:
+                report.write(f"{rel}\tA:{digest}\tB:{actual}\n")
+                report.flush()
+            # A good read pins the size/mtime later verifies compare against.
+            state.mark(path, status, actual if status != "OK" else "", st.st_size, st.st_mtime_ns)
+            stats[status] += 1
+            if progress:
+                progress(done, rel)
+        state.conn.commit()
+    return stats
+
+
+def print_progress(n, rel):
+    print(f"SCRUB\t{n}\t{rel}", flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rate-limited re-verification of files against hash indexes.")
+    parser.add_argument(
+        "--db",
+        type=Path,
+        default=Path(__file__).resolve().parents[1] / "_DJProducerTools" / "scrub_state.sqlite",
+        help="Scrub state database",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    p = subparsers.add_parser("run", help="Verify the files verified longest ago")
+    p.add_argument("--index", type=Path, action="append", required=True, help="hash_index.tsv / external_hashes.tsv")
+    p.add_argument("--mb-per-s", type=float, default=20.0, help="Read budget in MB/s (0 = unlimited, default 20)")
+    p.add_argument("--iops", type=float, default=100.0, help="Read calls per second (0 = unlimited, default 100)")
+    p.add_argument("--max-minutes", type=float, default=0, help="Stop after this long (0 = no limit)")
+    p.add_argument("--max-gb", type=float, default=0, help="Stop after reading this much (0 = no limit)")
+    p.add_argument("--max-files", type=int, default=0, help="Stop after this many files (0 = no limit)")
+    p.add_argument("--report", type=Path, default=None, help="Corruption report (mirror_hash_mismatch format)")
+    p.add_argument("--nice", type=int, default=10, help="Process niceness increment (default 10)")
+    p.add_argument("--progress", action="store_true", help="Print 'SCRUB<TAB>count<TAB>rel' lines")
+    p.add_argument(
+        "--cache", type=Path, default=None, help="hash_cache.sqlite: tells rot from rewrites on first verifies"
+    )
+    add_cache_mode_argument(p)
+    add_order_argument(p)
+    subparsers.add_parser("status", help="Counts per status and oldest verify")
+    p = subparsers.add_parser("report", help="Write all files currently marked CORRUPT")
+    p.add_argument("--out", type=Path, required=True, help="Report path")
+    args = parser.parse_args()
+
+    state = ScrubState(args.db)
+    try:
+        if args.command == "status":
+            for status, count in sorted(state.counts().items()):
+                print(f"{status or 'PENDING'}\t{count}")
+            oldest = state.oldest()
+            when = time.strftime("%Y-%m-%d %H:%M", time.localtime(oldest)) if oldest else "nunca"
+            print(f"oldest_verify\t{when}")
+            return
+        if args.command == "report":
+            with args.out.open("w", encoding="utf-8", errors="surrogateescape") as fh:
+                for rel, digest, actual in state.corrupt():
+                    fh.write(f"{rel}\tA:{digest}\tB:{actual}\n")
+            print(f"[OK] Reporte: {args.out}")
+            return
+
+        for index in args.index:
+            if not index.is_file():
+                print(f"[ERROR] No existe: {index}", file=sys.stderr)
+                sys.exit(1)
+        if args.nice:
+            try:
+                os.nice(args.nice)
+            except OSError:
+                pass
+        for index in args.index:
+            loaded = state.sync_index(index)
+            if loaded:
+                print(f"[INFO] {index}: {loaded} entradas cargadas", file=sys.stderr)
+        budget = Budget(args.mb_per_s, args.iops)
+        cache = HashCache(args.cache) if args.cache and args.cache.is_file() else None
+        report = None
+        if args.report:
+            args.report.parent.mkdir(parents=True, exist_ok=True)
+            report = args.report.open("a", encoding="utf-8", errors="surrogateescape")
+        started = time.monotonic()
+        try:
+            stats = scrub(
+                state,
+                budget,
+                max_seconds=args.max_minutes * 60,
+                max_bytes=int(args.max_gb * 1024**3),
+                max_files=args.max_files,
+                report=report,
+                progress=print_progress if args.progress else None,
+                cache_mode=args.cache_mode,
+                order=args.order,
+                cache=cache,
+            )
+        except KeyboardInterrupt:
+            state.conn.commit()
+            print("[WARN] Interrumpido; se retoma en la próxima ejecución.", file=sys.stderr)
+            sys.exit(130)
+        finally:
+            if report:
+                report.close()
+            if cache is not None:
+                cache.close()
+        elapsed = time.monotonic() - started
+        mb = stats["bytes"] / (1024 * 1024)
+        print(
+            f"[OK] Verificados {stats['OK']} OK | corruptos {stats['CORRUPT']} | modificados {stats['MODIFIED']}"
+            f" | no encontrados {stats['MISSING']} | omitidos (flac md5) {stats['SKIPPED']}"
+            f" | {mb:.1f} MB en {elapsed:.1f}s ({mb / elapsed if elapsed else 0:.1f} MB/s)",
+            file=sys.stderr,
+        )
+        sys.exit(2 if stats["CORRUPT"] else 0)
+    finally:
+        state.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Sorted on-disk files for DJProducerTools indexes.
+- external_sort: sort byte lines into a file with bounded memory (sorted runs + heap merge).
+- SortedLines: O(log n) membership test and prefix range scan on a sorted
+  newline-delimited file through mmap, so lookups never load the file into memory.
+"""
+import heapq
+import mmap
+import os
+import tempfile
+from pathlib import Path
+
+RUN_LINES = 500_000
+
+
+def _write_run(lines, directory):
+    fd, name = tempfile.mkstemp(prefix=".djpt_run_", dir=directory)
+    with os.fdopen(fd, "wb") as fh:
+        fh.writelines(lines)
+    return name
+
+
+def _unique(lines):
+    prev = None
+    for line in lines:
+        if line != prev:
+            yield line
+            prev = line
+
+
+def sorted_runs(lines, directory, run_lines=RUN_LINES, key=None):
+    """Split lines into sorted temp files of at most run_lines each; return their paths."""
+    runs = []
+    buf = []
+    for line in lines:
+        buf.append(line)
+        if len(buf) >= run_lines:
+            buf.sort(key=key)
+            runs.append(_write_run(buf, directory))
+            buf = []
+    if buf or not runs:
+        buf.sort(key=key)
+        runs.append(_write_run(buf, directory))
+    return runs
+
+
+def merge_runs(runs, key=None):
+    """Yield lines of several sorted run files in order; removes the runs when exhausted."""
+    handles = [open(run, "rb") for run in runs]
+    try:
+        yield from heapq.merge(*handles, key=key)
+    finally:
+        for fh in handles:
+            fh.close()
+        for run in runs:
+            try:
+                os.unlink(run)
+            except FileNotFoundError:
+                pass
+
+
+def external_sort(lines, out_path, header=b"", run_lines=RUN_LINES, unique=True):
+    """Write lines (bytes ending in b"\\n") sorted to out_path, atomically."""
+    out_path = Path(out_path)
+    runs = sorted_runs(lines, out_path.parent, run_lines)
+    merged = merge_runs(runs)
+    write_sorted(_unique(merged) if unique else merged, out_path, header)
+
+
+def merge_into(path, start, runs, header=b""):
+    """Rewrite the sorted file at path (data from byte start) merged with sorted runs."""
+    with open(path, "rb") as old:
+        old.seek(start)
+        write_sorted(_unique(heapq.merge(old, merge_runs(runs))), path, header)
+
+
+def write_sorted(lines, out_path, header=b""):
+    out_path = Path(out_path)
+    tmp = out_path.with_name(f".{out_path.name}.{os.getpid()}.tmp")
+    try:
+        with tmp.open("wb") as fh:
+            fh.write(header)
+            fh.writelines(lines)
+        os.replace(tmp, out_path)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+
+
+class SortedLines:
+    """Binary search over a sorted newline-delimited file, starting after an optional header."""
+
+    def __init__(self, path, start=0):
+        self._fh = open(path, "rb")
+        size = os.fstat(self._fh.fileno()).st_size
+        self._mm = mmap.mmap(self._fh.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self._start = start
+        self._end = size
+
+    def _line_around(self, lo, mid, hi):
+        start = max(self._mm.rfind(b"\n", lo, mid) + 1, lo)
+        end = self._mm.find(b"\n", mid, hi)
+        return start, hi if end == -1 else end
+
+    def __contains__(self, key):
+        if isinstance(key, str):
+            key = key.encode("utf-8", "surrogateescape")
+        lo, hi = self._start, self._end
+        while lo < hi:
+            start, end = self._line_around(lo, (lo + hi) // 2, hi)
+            line = self._mm[start:end]
+            if line == key:
+                return True
+            if line < key:
+                lo = end + 1
+            else:
+                hi = start
+        return False
+
+    def _lower_bound(self, key):
+        """Offset of the first line >= key."""
+        lo, hi = self._start, self._end
+        while lo < hi:
+            start, end = self._line_around(lo, (lo + hi) // 2, hi)
+            if self._mm[start:end] < key:
+                lo = end + 1
+            else:
+                hi = start
+        return lo
+
+    def prefixed(self, prefix):
+        """Yield the lines (without newline) starting with prefix; O(log n) to find the first."""
+        if isinstance(prefix, str):
+            prefix = prefix.encode("utf-8", "surrogateescape")
+        pos = self._lower_bound(prefix)
+        while pos < self._end:
+            end = self._mm.find(b"\n", pos, self._end)
+            if end == -1:
+                end = self._end
+            line = self._mm[pos:end]
+            if not line.startswith(prefix):
+                break
+            yield line
+            pos = end + 1
+
+    def __iter__(self):
+        self._fh.seek(self._start)
+        return iter(self._fh)
+
+    def close(self):
+        if isinstance(self._mm, mmap.mmap):
+            self._mm.close()
+        self._fh.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+import collections
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+# Add scripts to path
+SCRIPTS_PATH = Path(__file__).parent.parent / "scripts"
+sys.path.append(str(SCRIPTS_PATH))
+
+import audio_payload
+import build_dupe_plan
+from hash_root import sha256_file
+
+AUDIO = os.urandom(50_000)
+
+
+def id3v2(text):
+    body = b"TIT2" + len(text).to_bytes(4, "big") + b"\0\0" + text
+    size = len(body)
+    synchsafe = bytes([(size >> 21) & 0x7F, (size >> 14) & 0x7F, (size >> 7) & 0x7F, size & 0x7F])
+    return b"ID3\x03\x00\x00" + synchsafe + body
+
+
+def ape_tag(text):
+    footer = b"APETAGEX" + (2000).to_bytes(4, "little") + (len(text) + 32).to_bytes(4, "little")
+    return text + footer + b"\0" * 16
+
+
+def flac(comment, md5=bytes(16)):
+    streaminfo = b"\0" * 18 + md5
+    vorbis = b"\x04\0\0\0" + comment
+    return (
+        b"fLaC"
+        + b"\x00" + len(streaminfo).to_bytes(3, "big") + streaminfo
+        + b"\x84" + len(vorbis).to_bytes(3, "big") + vorbis
+        + AUDIO
+    )
+
+
+def atom(kind, body):
+    return (len(body) + 8).to_bytes(4, "big") + kind + body
+
+
+def m4a(title):
+    ilst = atom(b"ilst", atom(b"\xa9nam", title))
+    moov = atom(b"moov", atom(b"mvhd", b"\0" * 100) + atom(b"udta", atom(b"meta", b"\0" * 4 + ilst)))
+    return atom(b"ftyp", b"M4A \0\0\0\0") + moov + atom(b"mdat", AUDIO)
+
+
+def ogg_page(packets, granule, seq, continued=False, open_end=False):
+    """One Ogg page; with open_end the last packet goes on in the next page (no lacing value < 255)."""
+    lacing = b""
+    for i, packet in enumerate(packets):
+        lacing += bytes([255] * (len(packet) // 255))
+        if not (open_end and i == len(packets) - 1):
+            lacing += bytes([len(packet) % 255])
+    return (
+        b"OggS\0" + bytes([1 if continued else 0]) + granule.to_bytes(8, "little") + b"\1\0\0\0"
+        + seq.to_bytes(4, "little") + b"\0" * 4 + bytes([len(lacing)]) + lacing + b"".join(packets)
+    )
+
+
+def ogg_vorbis(comment_pages):
+    """Vorbis stream whose comment packet spans comment_pages pages (granule -1 but the last)."""
+    chunk = 255 * 40
+    comment = b"\x03vorbis" + os.urandom(chunk * comment_pages - 100 - 7)
+    pages = [ogg_page([b"\x01vorbis" + b"\0" * 23], 0, 0)]
+    for i in range(comment_pages - 1):
+        pages.append(ogg_page([comment[i * chunk:(i + 1) * chunk]], 2**64 - 1, len(pages), i > 0, open_end=True))
+    tail = comment[(comment_pages - 1) * chunk:]
+    pages.append(ogg_page([tail, b"\x05vorbis" + b"\0" * 20], 0, len(pages), comment_pages > 1))
+    for i in range(0, len(AUDIO), 200):
+        pages.append(ogg_page([AUDIO[i:i + 200]], 1024 * (i + 1), len(pages)))
+    return b"".join(pages)
+
+
+class TestAudioPayload(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.root = Path(self.test_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def write(self, rel, data):
+        path = self.root / rel
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+        return str(path)
+
+    def assert_same_payload(self, a, b):
+        self.assertNotEqual(sha256_file(a), sha256_file(b))
+        self.assertEqual(audio_payload.hash_payload(a), audio_payload.hash_payload(b))
+
+    def test_mp3_tags_ignored(self):
+        plain = self.write("plain.mp3", AUDIO)
+        tagged = self.write(
+            "tagged.mp3", id3v2(b"Serato title") + AUDIO + ape_tag(b"x" * 40) + b"TAG" + b"\0" * 125
+        )
+        self.assert_same_payload(plain, tagged)
+        self.assertEqual(audio_payload.payload_ranges(tagged)[0][1], len(AUDIO))
+
+    def test_flac_and_m4a_tags_ignored(self):
+        self.assert_same_payload(
+            self.write("a.flac", flac(b"TITLE=Original")), self.write("b.flac", flac(b"TITLE=Re-tagged by Rekordbox"))
+        )
+        self.assert_same_payload(self.write("a.m4a", m4a(b"One")), self.write("b.m4a", m4a(b"Another title")))
+
+    def test_ogg_multi_page_comment_ignored(self):
+        one = self.write("a.ogg", ogg_vorbis(1))
+        three = self.write("b.ogg", ogg_vorbis(3))
+        self.assert_same_payload(one, three)
+        self.assertEqual(sum(n for _, n in audio_payload.payload_ranges(three)), len(AUDIO))
+        # Unknown codec: every page up to the first real granule position is skipped.
+        other = self.write("c.ogg", ogg_vorbis(3).replace(b"\x01vorbis", b"\x01codecX", 1))
+        self.assertEqual(audio_payload.hash_payload(other), audio_payload.hash_payload(one))
+
+    def test_flac_streaminfo_md5_identity(self):
+        md5 = bytes(range(1, 17))
+        a = self.write("a.flac", flac(b"TITLE=A", md5))
+        b = self.write("b/a.flac", id3v2(b"Prepended") + flac(b"TITLE=B", md5) + os.urandom(10))
+        unset = self.write("c.flac", flac(b"TITLE=C"))
+        self.assertEqual(audio_payload.flac_identity(a), "flacmd5:" + md5.hex())
+        self.assertIsNone(audio_payload.flac_identity(unset))
+        stats = collections.Counter()
+        groups = build_dupe_plan.cascade_groups(
+            build_dupe_plan.walk_files([self.root]), stats, identity=audio_payload.flac_identity
+        )
+        self.assertEqual([sorted(p) for p in groups.values()], [sorted([a, b])])
+        self.assertEqual((stats["identified"], stats["full_hashed"]), (2, 0))
+
+    def test_payload_plan_pairs_retagged_copies(self):
+        original = self.write("lib/track.mp3", id3v2(b"A") + AUDIO)
+        retagged = self.write("usb/track.mp3", id3v2(b"A much longer title") + AUDIO)
+        self.write("lib/other.mp3", os.urandom(len(AUDIO)))
+        self.write("lib/notes.txt", AUDIO)
+        stats = collections.Counter()
+        groups = build_dupe_plan.payload_groups(build_dupe_plan.walk_files([self.root]), stats)
+        self.assertEqual([sorted(p) for p in groups.values()], [sorted([original, retagged])])
+        self.assertEqual(stats["files"], 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+# Add lib to path
+LIB_PATH = Path(__file__).parent.parent / "lib"
+sys.path.append(str(LIB_PATH))
+
+import bpm_analyzer
+
+
+def fake_analysis(path):
+    name = Path(path).name
+    if name.startswith("stuck"):
+        time.sleep(60)
+    if name.startswith("crash"):
+        os._exit(1)
+    time.sleep(0.01 * (hash(name) % 5))
+    return [str(path), "120.00", "0.40", "fake", "", "0.00", "0.0000", "", ""]
+
+
+class TestBpmAnalyzer(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        for i in range(12):
+            (self.test_dir / f"t{i:02d}.mp3").write_bytes(os.urandom(256))
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_jobs_match_sequential_rows(self):
+        seq, par = self.test_dir / "seq.tsv", self.test_dir / "par.tsv"
+        bpm_analyzer.analyze(self.test_dir, seq, 0, 5.0, 60.0, 200.0)
+        bpm_analyzer.analyze(self.test_dir, par, 0, 5.0, 60.0, 200.0, order="inode", jobs=3, timeout=30)
+        self.assertEqual(seq.read_text(), par.read_text())
+        self.assertEqual(len(par.read_text().splitlines()), 13)
+
+    def test_pool_streams_in_order_and_survives_stuck_and_crashing_files(self):
+        paths = sorted(self.test_dir.iterdir())
+        paths[3] = self.test_dir / "stuck.mp3"
+        paths[7] = self.test_dir / "crash.mp3"
+        started = time.monotonic()
+        with bpm_analyzer.AnalysisPool(3, fake_analysis, timeout=1.0) as pool:
+            rows = list(bpm_analyzer.in_order(paths, pool.run(list(reversed(paths)))))
+        self.assertLess(time.monotonic() - started, 20)
+        self.assertEqual([r[0] for r in rows], [str(p) for p in paths])
+        self.assertEqual(rows[3][3], "timeout")
+        self.assertEqual(rows[7][3], "worker_error")
+        self.assertEqual({r[3] for i, r in enumerate(rows) if i not in (3, 7)}, {"fake"})
+
+
+if __name__ == "__main__":
+    unittest.main()
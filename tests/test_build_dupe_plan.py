@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+import collections
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+import unittest.mock
+from pathlib import Path
+
+# Add scripts to path
+SCRIPTS_PATH = Path(__file__).parent.parent / "scripts"
+sys.path.append(str(SCRIPTS_PATH))
+
+import build_dupe_plan
+
+
+class TestCascade(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.root = Path(self.test_dir) / "lib"
+        self.root.mkdir()
+        big = os.urandom(400 * 1024)
+        # Same size and same head/tail, different middle: must not be paired.
+        twin = bytearray(big)
+        twin[200 * 1024] ^= 0xFF
+        files = {
+            "a.wav": big,
+            "copy/a.wav": big,
+            "twin.wav": bytes(twin),
+            "small.mp3": b"x" * 1000,
+            "copy/small.mp3": b"x" * 1000,
+            "unique.flac": os.urandom(300 * 1024),
+        }
+        for i in range(10):
+            files[f"albums/{i}.mp3"] = os.urandom(256 * 1024 + i)
+        for rel, data in files.items():
+            p = self.root / rel
+            p.parent.mkdir(parents=True, exist_ok=True)
+            p.write_bytes(data)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def full_index_groups(self):
+        groups = collections.defaultdict(list)
+        for path, _ in build_dupe_plan.walk_files([self.root]):
+            groups[hashlib.sha256(Path(path).read_bytes()).hexdigest()].append(path)
+        return {h: sorted(p) for h, p in groups.items() if len(p) > 1}
+
+    def test_cascade_matches_full_hash(self):
+        stats = collections.Counter()
+        groups = build_dupe_plan.cascade_groups(build_dupe_plan.walk_files([self.root]), stats)
+        self.assertEqual({h: sorted(p) for h, p in groups.items()}, self.full_index_groups())
+        self.assertLess(stats["bytes_read"], stats["bytes_total"])
+        # a.wav + copy + twin (same head/tail) + the two small files
+        self.assertEqual(stats["full_hashed"], 5)
+
+
+class TestDigestTable(unittest.TestCase):
+    def test_matches_dict_of_lists(self):
+        entries = [
+            ("ab" * 32, "/Volumes/A/Música/x.mp3"),
+            ("flacmd5:" + "cd" * 16, "/Volumes/A/y.flac"),
+            ("AB" * 32, "/Volumes/B/Música/x.mp3"),
+            ("ab" * 32, "/Volumes/B/Música/x.mp3"),
+            ("ef" * 16, "relative.wav"),
+            ("flacmd5:" + "cd" * 16, "/y.flac"),
+            ("ab" * 32, "/Volumes/C/x.mp3"),
+        ]
+        expected = collections.defaultdict(list)
+        for digest, path in entries:
+            expected[digest].append(path)
+        table = build_dupe_plan.DigestTable()
+        table.extend(entries)
+        self.assertEqual(list(table.items()), list(expected.items()))
+        self.assertEqual((len(table), table.duplicate_count()), (7, 2))
+        self.assertEqual(len(table.names), 3)
+
+
+class TestStreaming(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        digests = [f"{i:064x}" for i in range(40)]
+        with (self.test_dir / "hash_index.tsv").open("w") as fh:
+            fh.write("# djpt-hash-index v1 algo=sha256\n")
+            for i in range(300):
+                fh.write(f"{digests[i % 40]}\tlib/{i}.mp3\t/base/lib/{i}.mp3\n")
+        with (self.test_dir / "external_hashes.tsv").open("w") as fh:
+            for i in range(0, 600, 7):
+                fh.write(f"{digests[i % 37]}\t/Volumes/usb/{i}.mp3\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def run_mode(self, tag, *extra):
+        args = [
+            "--hash-index", str(self.test_dir / "hash_index.tsv"),
+            "--external", str(self.test_dir / "external_hashes.tsv"),
+            "--tmp", str(self.test_dir / f"{tag}.tmp"),
+            "--plan", str(self.test_dir / f"{tag}.plan"),
+            "--report", str(self.test_dir / f"{tag}.txt"),
+            *extra,
+        ]
+        with unittest.mock.patch.object(sys, "argv", ["build_dupe_plan.py", *args]):
+            build_dupe_plan.main()
+        tmp_lines = (self.test_dir / f"{tag}.tmp").read_text().splitlines()
+        plan_lines = (self.test_dir / f"{tag}.plan").read_text().splitlines()
+        report = (self.test_dir / f"{tag}.txt").read_text().splitlines()
+        return tmp_lines[0], sorted(tmp_lines[1:]), sorted(plan_lines), report[2:5]
+
+    def test_stream_matches_in_memory(self):
+        expected = self.run_mode("memory")
+        self.assertEqual(self.run_mode("stream", "--stream", "--run-lines", "50"), expected)
+        # sorted runs are removed once merged
+        self.assertFalse([n for n in os.listdir(self.test_dir) if n.startswith(".djpt_run_")])
+
+
+if __name__ == "__main__":
+    unittest.main()
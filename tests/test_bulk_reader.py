@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+import hashlib
+import mmap
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+# Add scripts to path
+SCRIPTS_PATH = Path(__file__).parent.parent / "scripts"
+sys.path.append(str(SCRIPTS_PATH))
+
+import bulk_reader
+from hash_root import hash_file, hash_paths, sha256_file
+
+
+def write_synced(path, data):
+    with open(path, "wb") as fh:
+        fh.write(data)
+        fh.flush()
+        os.fsync(fh.fileno())  # DONTNEED leaves dirty pages alone
+
+
+class TestBulkReader(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.files = []
+        for i, size in enumerate((0, 1, 4097, 3 * 1024 * 1024 + 5)):
+            path = self.test_dir / f"t{i}.mp3"
+            write_synced(path, os.urandom(size))
+            self.files.append(path)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def cache_hints_work(self, path):
+        bulk_reader.evict(path)
+        with open(path, "rb") as fh:
+            fh.read()
+        if not hasattr(os, "posix_fadvise") or bulk_reader.resident_fraction(path) < 1.0:
+            self.skipTest("page cache residency not observable here")
+        bulk_reader.evict(path)
+        if bulk_reader.resident_fraction(path) > 0.0:
+            self.skipTest("POSIX_FADV_DONTNEED has no effect on this filesystem")
+
+    def test_digests_match_in_every_mode(self):
+        for path in self.files:
+            expected = hashlib.sha256(path.read_bytes()).hexdigest()
+            for mode in bulk_reader.CACHE_MODES:
+                self.assertEqual(hash_file(path, "sha256", 4096, cache_mode=mode), expected, (path.name, mode))
+
+    def test_drop_leaves_cold_files_uncached_and_hot_files_cached(self):
+        big = self.files[-1]
+        self.cache_hints_work(big)
+        hash_file(big, cache_mode="drop")
+        self.assertEqual(bulk_reader.resident_fraction(big), 0.0)
+        big.read_bytes()  # now in use by someone else
+        hash_file(big, cache_mode="drop")
+        self.assertEqual(bulk_reader.resident_fraction(big), 1.0)
+
+    def test_mmap_still_used_under_drop(self):
+        big = self.files[-1]
+        expected = hashlib.sha256(big.read_bytes()).hexdigest()
+        with mock.patch("hash_root.mmap.mmap", wraps=mmap.mmap) as mapped:
+            self.assertEqual(hash_file(big, "sha256", cache_mode="drop", mmap_min_size=1024 * 1024), expected)
+            small = self.files[2]
+            expected_small = hashlib.sha256(small.read_bytes()).hexdigest()
+            self.assertEqual(hash_file(small, "sha256", cache_mode="drop", mmap_min_size=1024 * 1024), expected_small)
+            hash_file(big, "sha256", cache_mode="direct", mmap_min_size=1024 * 1024)
+        files_mapped = [c for c in mapped.call_args_list if c.args[0] != -1]  # -1: O_DIRECT buffers
+        self.assertEqual(len(files_mapped), 1)
+        self.cache_hints_work(big)
+        hash_file(big, cache_mode="drop", mmap_min_size=1)
+        self.assertEqual(bulk_reader.resident_fraction(big), 0.0)
+
+    def test_invalid_env_cache_mode_warns_at_import(self):
+        env = dict(os.environ, DJPT_CACHE_MODE="keeep")
+        proc = subprocess.run(
+            [sys.executable, "-c", "import bulk_reader; print(bulk_reader.DEFAULT_CACHE_MODE)"],
+            cwd=SCRIPTS_PATH,
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+        self.assertEqual(proc.stdout.strip(), "drop")
+        self.assertIn("DJPT_CACHE_MODE", proc.stderr)
+
+    def test_advised_paths_drops_each_file_once_consumed(self):
+        big = self.files[-1]
+        self.cache_hints_work(big)
+        seen = []
+        for path in bulk_reader.advised_paths([big, self.files[2]], "drop"):
+            path.read_bytes()
+            seen.append(bulk_reader.resident_fraction(big))
+        self.assertEqual(seen, [1.0, 0.0])
+
+    def test_physical_order_reads_sorted_but_yields_in_input_order(self):
+        paths = [str(p) for p in reversed(self.files)]
+        by_inode = bulk_reader.physical_order(paths, "inode")
+        self.assertEqual(by_inode, sorted(paths, key=lambda p: os.stat(p).st_ino))
+        self.assertEqual(sorted(bulk_reader.physical_order(paths, "extent")), sorted(paths))
+        self.assertEqual(bulk_reader.physical_order(paths, "walk"), paths)
+        read = []
+
+        def recording(path):
+            read.append(path)
+            return sha256_file(path)
+
+        for order in bulk_reader.ORDERS:
+            read.clear()
+            got = list(hash_paths(paths, workers=2, hash_func=recording, order=order))
+            self.assertEqual([p for p, _ in got], paths)
+            self.assertEqual(got, [(p, sha256_file(p)) for p in paths])
+            if order == "inode":
+                self.assertEqual(read, by_inode)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+import hashlib
+import shutil
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+# Add scripts to path
+SCRIPTS_PATH = Path(__file__).parent.parent / "scripts"
+sys.path.append(str(SCRIPTS_PATH))
+
+import checkpoint_state
+
+
+class TestCheckpointState(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.chk_root = self.test_dir / "checkpoints"
+        self.index = self.test_dir / "hash_index.tsv"
+        self.lines = [
+            f"{hashlib.sha256(str(i).encode()).hexdigest()}\tcrate/t{i}.mp3\t/lib/crate/t{i}.mp3\n" for i in range(20000)
+        ]
+        self.index.write_text("".join(self.lines))
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_edit_only_adds_nearby_chunks_and_restores(self):
+        first, stats = checkpoint_state.save(self.chk_root, [self.index], "one", [self.test_dir])
+        self.assertGreater(stats["chunks"], 5)
+        self.assertEqual(stats["new_chunks"], stats["chunks"])
+
+        self.lines.insert(10000, "deadbeef\tnew.mp3\t/lib/new.mp3\n")
+        self.index.write_text("".join(self.lines))
+        second, stats = checkpoint_state.save(self.chk_root, [self.index], "two", [self.test_dir])
+        self.assertLessEqual(stats["new_chunks"], 2)
+
+        out = self.test_dir / "restored"
+        checkpoint_state.restore(self.chk_root, first, out)
+        self.assertEqual(out.joinpath("hash_index.tsv").read_text(), "".join(self.lines[:10000] + self.lines[10001:]))
+        checkpoint_state.restore(self.chk_root, second, out)
+        self.assertEqual(out.joinpath("hash_index.tsv").read_bytes(), self.index.read_bytes())
+
+        shutil.rmtree(first)
+        self.assertLessEqual(checkpoint_state.gc(self.chk_root), 2)
+        checkpoint_state.restore(self.chk_root, second, out)
+
+    def test_disk_summary_skips_missing_volumes(self):
+        rows = checkpoint_state.disk_summary([self.test_dir, self.test_dir / "missing"])
+        self.assertEqual(len(rows), 1)
+        self.assertTrue(rows[0].startswith(str(self.test_dir)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+import collections
+import io
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+# Add scripts to path
+SCRIPTS_PATH = Path(__file__).parent.parent / "scripts"
+sys.path.append(str(SCRIPTS_PATH))
+
+import hash_compare
+
+
+class TestHashCompare(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.a = self.test_dir / "a.tsv"
+        self.b = self.test_dir / "b.tsv"
+        self.a.write_text(
+            "# djpt-hash-index v1 algo=sha256\n"
+            "h1\tx/1.mp3\t/A/x/1.mp3\nh2\tx/2.mp3\t/A/x/2.mp3\nh3\t3.mp3\t/A/3.mp3\nh2\tcopy.mp3\t/A/copy.mp3\n"
+        )
+        self.b.write_text("h1\tx/1.mp3\t/B/x/1.mp3\nh9\tx/2.mp3\t/B/x/2.mp3\nh4\t4.mp3\t/B/4.mp3\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def run_compare(self, by):
+        outputs = collections.defaultdict(io.BytesIO)
+        stats = collections.Counter()
+        runs = [hash_compare.sort_index(p, by, self.test_dir, run_lines=2)[0] for p in (self.a, self.b)]
+        hash_compare.compare(runs[0], runs[1], by, outputs, stats)
+        self.assertFalse([n for n in os.listdir(self.test_dir) if n.startswith(".djpt_run_")])
+        return {k: v.getvalue().decode().splitlines() for k, v in outputs.items()}
+
+    def test_by_hash(self):
+        out = self.run_compare("hash")
+        self.assertEqual(out["MISSING_IN_B"], ["h2\t/A/copy.mp3", "h2\t/A/x/2.mp3", "h3\t/A/3.mp3"])
+        self.assertEqual(out["MISSING_IN_A"], ["h4\t/B/4.mp3", "h9\t/B/x/2.mp3"])
+
+    def test_by_path(self):
+        out = self.run_compare("path")
+        self.assertEqual(out["MISSING_IN_B"], ["3.mp3\th3", "copy.mp3\th2"])
+        self.assertEqual(out["MISSING_IN_A"], ["4.mp3\th4"])
+        self.assertEqual(out["MISMATCH"], ["x/2.mp3\tA:h2\tB:h9"])
+
+
+if __name__ == "__main__":
+    unittest.main()
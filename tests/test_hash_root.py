@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+import hashlib
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+# Add scripts to path
+SCRIPTS_PATH = Path(__file__).parent.parent / "scripts"
+sys.path.append(str(SCRIPTS_PATH))
+
+import hash_root
+
+
+class TestHashRoot(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.root = Path(self.test_dir) / "drive"
+        (self.root / "sub").mkdir(parents=True)
+        self.files = []
+        for i in range(12):
+            p = self.root / ("sub" if i % 2 else "") / f"track_{i:02d}.wav"
+            p.write_bytes(os.urandom(1000 + i * 37))
+            self.files.append(str(p))
+        self.external = Path(self.test_dir) / "external_hashes.tsv"
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def run_cli(self, *extra):
+        cmd = [
+            sys.executable,
+            str(SCRIPTS_PATH / "hash_root.py"),
+            "--root",
+            str(self.root),
+            "--external-file",
+            str(self.external),
+            *extra,
+        ]
+        return subprocess.run(cmd, capture_output=True, text=True)
+
+    def test_parallel_preserves_order(self):
+        results = list(hash_root.hash_paths(self.files, workers=4, io_per_device=1))
+        self.assertEqual([p for p, _ in results], self.files)
+        for path, digest in results:
+            self.assertEqual(digest, hashlib.sha256(Path(path).read_bytes()).hexdigest())
+
+    def test_vanished_file_is_unreadable_not_fatal(self):
+        gone = self.files[3]
+        os.unlink(gone)
+        for workers in (1, 3):
+            results = dict(hash_root.hash_paths(self.files, workers=workers, io_per_device=1))
+            self.assertIsNone(results[gone])
+            self.assertEqual(sum(d is not None for d in results.values()), len(self.files) - 1)
+
+    def test_cli_appends_and_skips_existing(self):
+        proc = self.run_cli("--workers", "3", "--limit", "5")
+        self.assertEqual(proc.returncode, 2)
+        proc = self.run_cli("--workers", "3")
+        self.assertEqual(proc.returncode, 0)
+        lines = self.external.read_text().splitlines()
+        self.assertTrue(lines.pop(0).startswith(hash_root.INDEX_HEADER_PREFIX))
+        self.assertEqual(sorted(l.split("\t", 1)[1] for l in lines), sorted(self.files))
+        proc = self.run_cli()
+        self.assertIn("No new files", proc.stdout)
+
+    def test_resume_after_limit_and_torn_line(self):
+        proc = self.run_cli("--limit", "5", "--sync-every", "2")
+        self.assertEqual(proc.returncode, 2)
+        session = hash_root.session_file(self.external)
+        self.assertTrue(session.exists())
+        with self.external.open("a") as fh:
+            fh.write("deadbeef\t/half/written")
+        proc = self.run_cli("--resume", "--workers", "2")
+        self.assertEqual(proc.returncode, 0, proc.stderr)
+        self.assertIn("Dropped", proc.stdout)
+        self.assertFalse(session.exists())
+        lines = self.external.read_text().splitlines()[1:]
+        self.assertEqual(sorted(l.split("\t", 1)[1] for l in lines), sorted(self.files))
+
+    def test_malformed_middle_line_keeps_later_entries(self):
+        good = [f"{hashlib.sha256(p.encode()).hexdigest()}\t{p}\n" for p in self.files[:4]]
+        body = hash_root.index_header("sha256") + good[0] + good[1] + "garbage without tab\n" + good[2] + good[3]
+        self.external.write_text(body + "abc\t/torn")
+        # First run: no journal, no sidecar.
+        self.assertEqual(hash_root.recover_index(self.external, hash_root.covered_offset(self.external)), len("abc\t/torn"))
+        self.assertEqual(self.external.read_text(), body)
+        # A journaled offset also drops malformed lines at the tail, never before a good line.
+        committed = len(body.encode())
+        self.external.write_text(body + "not a line\n" + "zz\t\n")
+        self.assertEqual(hash_root.recover_index(self.external, committed), len("not a line\nzz\t\n"))
+        self.assertEqual(self.external.read_text(), body)
+
+    def test_cursor_skips_finished_directories(self):
+        with hash_root.refresh_path_index(self.external) as existing:
+            resumed = list(hash_root.iter_new_files(self.root, existing, ("sub",)))
+            everything = list(hash_root.iter_new_files(self.root, existing))
+        self.assertEqual(resumed, sorted(f for f in self.files if "/sub/" in f))
+        self.assertEqual(sorted(everything), sorted(self.files))
+
+    def test_path_index_incremental(self):
+        self.external.write_text("h1\t/b/track.wav\nh2\t/a/track.wav\n")
+        with hash_root.refresh_path_index(self.external) as lookup:
+            self.assertIn("/a/track.wav", lookup)
+            self.assertNotIn("/c/track.wav", lookup)
+        with self.external.open("a") as fh:
+            fh.write("h3\t/c/track.wav\nh4\t/torn")
+        with hash_root.refresh_path_index(self.external) as lookup:
+            self.assertIn("/c/track.wav", lookup)
+            self.assertNotIn("/torn", lookup)
+        sidecar = hash_root.path_index_file(self.external).read_text().splitlines()
+        self.assertEqual(sidecar[1:], ["/a/track.wav", "/b/track.wav", "/c/track.wav"])
+
+    def test_index_header_records_algo(self):
+        proc = self.run_cli("--algo", "blake2b")
+        self.assertEqual(proc.returncode, 0)
+        self.assertEqual(hash_root.read_index_algo(self.external), "blake2b")
+        proc = self.run_cli("--algo", "sha256")
+        self.assertEqual(proc.returncode, 1)
+        self.assertIn("uses blake2b", proc.stderr)
+
+    def test_hash_index_format(self):
+        import hash_index
+
+        out = Path(self.test_dir) / "hash_index.tsv"
+        seen = []
+        written = hash_index.build_index(
+            self.root, out, hash_root.sha256_file, workers=2, progress=lambda pct, rel: seen.append(pct)
+        )
+        self.assertEqual(written, len(self.files))
+        self.assertEqual(seen[-1], 100)
+        rows = [l.split("\t") for l in out.read_text().splitlines()[1:]]
+        for digest, rel, full in rows:
+            self.assertEqual(str(self.root / rel), full)
+            self.assertEqual(digest, hash_root.sha256_file(full))
+        self.assertEqual(sorted(os.listdir(self.test_dir)), ["drive", "hash_index.tsv"])
+
+    def test_hash_index_keeps_non_utf8_names(self):
+        import hash_index
+
+        bad = os.path.join(os.fsencode(self.root), b"caf\xe9.wav")
+        with open(bad, "wb") as fh:
+            fh.write(b"latin-1 name")
+        out = Path(self.test_dir) / "hash_index.tsv"
+        self.assertEqual(hash_index.build_index(self.root, out, hash_root.sha256_file), len(self.files) + 1)
+        self.assertIn(b"\tcaf\xe9.wav\t" + bad + b"\n", out.read_bytes())
+
+    def test_cache_reuses_digest_after_rename(self):
+        from hash_cache import HashCache
+
+        cache = HashCache(Path(self.test_dir) / "hash_cache.sqlite")
+        hasher = cache.cached(hash_root.sha256_file)
+        first = hasher(self.files[0])
+        moved = str(self.root / "renamed.wav")
+        os.rename(self.files[0], moved)
+        self.assertEqual(hasher(moved), first)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        cache.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
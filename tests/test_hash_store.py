@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+import shutil
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+# Add scripts to path
+SCRIPTS_PATH = Path(__file__).parent.parent / "scripts"
+sys.path.append(str(SCRIPTS_PATH))
+
+from hash_store import HashStore, export_lines, index_algo, index_root, index_rows, read_tsv
+
+
+class TestHashStore(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.store = HashStore(self.test_dir / "store.sqlite")
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.test_dir)
+
+    def test_generations_track_changes_per_root(self):
+        self.store.import_rows("/A", [("h1", "1.mp3", "/A/1.mp3"), ("h2", "2.mp3", "/A/2.mp3")])
+        self.store.import_rows("/B", [("h1", "1.mp3", "/B/1.mp3")])
+        changes = self.store.import_rows("/A", [("h3", "2.mp3", "/A/2.mp3"), ("h4", "3.mp3", "/A/3.mp3")])
+        self.assertEqual(changes["added"], [("/A/3.mp3", "h4")])
+        self.assertEqual(changes["modified"], [("/A/2.mp3", "h3")])
+        self.assertEqual(changes["removed"], [("/A/1.mp3", "h1")])
+        # /A/1.mp3 is gone, so /B/1.mp3 no longer has a duplicate.
+        self.assertEqual([p for _, p, _ in self.store.copies("/B/1.mp3")], ["/B/1.mp3"])
+        self.assertEqual(self.store.dupe_counts(), (0, 0))
+        self.assertEqual(self.store.changes("/B")["added"], [("/B/1.mp3", "h1")])
+
+    def test_index_import_and_plan(self):
+        index = self.test_dir / "hash_index.tsv"
+        index.write_text(
+            "# djpt-hash-index v1 algo=blake2b flac=md5\nh1\ta.mp3\t/R/a.mp3\nh1\tx/b.mp3\t/R/x/b.mp3\nh2\tc.mp3\t/R/c.mp3\n"
+        )
+        self.assertEqual(index_root(index), "/R")
+        self.assertEqual(index_algo(index), "blake2b+flacmd5")
+        self.store.import_rows(index_root(index), index_rows(index), index_algo(index))
+        with self.assertRaises(ValueError):
+            self.store.import_rows("/R", [], "sha256")
+        self.assertEqual(list(self.store.duplicate_groups()), [("h1", ["/R/a.mp3", "/R/x/b.mp3"])])
+        self.store.import_plan("dupes_plan", [("h1", "KEEP", "/R/a.mp3"), ("h1", "QUARANTINE", "/R/x/b.mp3")])
+        self.assertEqual(self.store.plan_summary("dupes_plan")["QUARANTINE"], {"entries": 1, "hashes": 1})
+
+    def test_plan_is_current_only_while_the_tsv_is_unchanged(self):
+        plan = self.test_dir / "dupes_plan.tsv"
+        plan.write_text("h1\tKEEP\t/R/a.mp3\nh1\tQUARANTINE\t/R/b.mp3\n")
+        self.store.import_plan("dupes_plan", read_tsv(plan, 3), plan)
+        self.assertTrue(self.store.plan_is_current("dupes_plan", plan))
+        with plan.open("a") as fh:
+            fh.write("h1\tQUARANTINE\t/R/c.mp3\n")
+        self.assertFalse(self.store.plan_is_current("dupes_plan", plan))
+        self.store.import_plan("other", [("h2", "KEEP", "/R/d.mp3")])
+        self.assertFalse(self.store.plan_is_current("other", plan))
+
+    def test_export_refuses_mixed_algos(self):
+        self.store.import_rows("/A", [("h1", "1.mp3", "/A/1.mp3")], "sha256")
+        self.assertEqual(self.store.root_algos("/A"), ["sha256"])
+        self.store.import_rows("/B", [("h2", "1.mp3", "/B/1.mp3")], "blake2b")
+        self.assertEqual(self.store.root_algos(), ["blake2b", "sha256"])
+        with self.assertRaises(ValueError):
+            list(export_lines(self.store.root_rows(), "{1}\t{3}\n"))
+        lines = list(export_lines(self.store.root_rows("/B"), "{1}\t{3}\n"))
+        self.assertIn("algo=blake2b", lines[0])
+        self.assertEqual(lines[1:], ["h2\t/B/1.mp3\n"])
+
+
+if __name__ == "__main__":
+    unittest.main()
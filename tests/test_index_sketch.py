@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+import hashlib
+import io
+import shutil
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+# Add scripts to path
+SCRIPTS_PATH = Path(__file__).parent.parent / "scripts"
+sys.path.append(str(SCRIPTS_PATH))
+
+import index_sketch
+
+
+def digest(i):
+    return hashlib.sha256(str(i).encode()).hexdigest()
+
+
+class TestIndexSketch(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.archive = self.test_dir / "archive.tsv"
+        self.laptop = self.test_dir / "laptop.tsv"
+        header = "# djpt-hash-index v1 algo=sha256\n"
+        self.archive.write_text(header + "".join(f"{digest(i)}\tc/{i}.mp3\t/A/c/{i}.mp3\n" for i in range(5000)))
+        self.laptop.write_text(
+            header
+            + "".join(f"{digest(i)}\tl/{i}.mp3\t/L/l/{i}.mp3\n" for i in range(0, 5000, 7))
+            + "".join(f"{digest(i)}\tnew/{i}.mp3\t/L/new/{i}.mp3\n" for i in range(9000, 9040))
+        )
+        self.missing = {f"{digest(i)}\t/L/new/{i}.mp3" for i in range(9000, 9040)}
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def check(self, kind):
+        sketch_path = self.test_dir / f"archive.{kind}.djsk"
+        header = index_sketch.export(self.archive, sketch_path, kind)
+        self.assertEqual(header["entries"], 5000)
+        sketch, _ = index_sketch.read_sketch(sketch_path)
+        out = io.BytesIO()
+        index_sketch.check(sketch, self.laptop, out)
+        return sketch_path, set(out.getvalue().decode().splitlines())
+
+    def test_prefix_sketch_is_exact(self):
+        _, candidates = self.check("prefix")
+        self.assertEqual(candidates, self.missing)
+
+    def test_bloom_candidates_are_missing_and_verified(self):
+        sketch_path, candidates = self.check("bloom")
+        self.assertLess(sketch_path.stat().st_size, self.archive.stat().st_size / 20)
+        # No false negatives: every candidate is really missing; a false positive may hide one.
+        self.assertTrue(candidates <= self.missing)
+        self.assertGreaterEqual(len(candidates), 38)
+        cand_file = self.test_dir / "candidates.tsv"
+        cand_file.write_text("".join(c + "\n" for c in candidates))
+        out = io.BytesIO()
+        self.assertEqual(index_sketch.verify(cand_file, self.archive, out), (len(candidates), len(candidates)))
+
+
+if __name__ == "__main__":
+    unittest.main()
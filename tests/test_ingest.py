@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+# Add scripts to path
+SCRIPTS_PATH = Path(__file__).parent.parent / "scripts"
+sys.path.append(str(SCRIPTS_PATH))
+
+import ingest
+from hash_index import build_index
+from hash_root import hash_paths, sha256_file
+from sorted_index import SortedLines
+
+
+class TestIngest(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.lib = self.test_dir / "lib"
+        self.incoming = self.test_dir / "incoming"
+        (self.lib / "house").mkdir(parents=True)
+        self.incoming.mkdir()
+        for i in range(40):
+            (self.lib / "house" / f"{i:02d} - Artist {i} - Track {i} (Original Mix).mp3").write_bytes(os.urandom(512))
+        shutil.copy2(self.lib / "house" / "07 - Artist 7 - Track 7 (Original Mix).mp3", self.incoming / "dl.mp3")
+        (self.incoming / "Artist 9 - Track 9 [Promo].mp3").write_bytes(os.urandom(700))
+        (self.incoming / "fresh.mp3").write_bytes(os.urandom(300))
+        shutil.copy2(self.incoming / "fresh.mp3", self.incoming / "fresh copy.mp3")
+        self.index = self.test_dir / "hash_index.tsv"
+        build_index(self.lib, self.index, sha256_file)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_index_rebuilt_when_stale_and_lookup(self):
+        idx, rebuilt = ingest.open_index(self.index)
+        self.assertTrue(rebuilt)
+        some = self.lib / "house" / "03 - Artist 3 - Track 3 (Original Mix).mp3"
+        self.assertEqual(idx.lookup(sha256_file(some)), str(some))
+        self.assertIsNone(idx.lookup("0" * 64))
+        idx.close()
+        idx, rebuilt = ingest.open_index(self.index)
+        self.assertFalse(rebuilt)
+        idx.close()
+        os.utime(self.index, ns=(0, 0))
+        idx, rebuilt = ingest.open_index(self.index)
+        self.assertTrue(rebuilt)
+        idx.close()
+
+    def test_classify(self):
+        idx, _ = ingest.open_index(self.index)
+        paths = sorted(str(p) for p in self.incoming.iterdir())
+        with SortedLines(str(ingest.djdx_path(self.index)) + ".names") as names:
+            got = {Path(p).name: (status, Path(found).name) for status, p, found in ingest.classify(idx, names, hash_paths(paths))}
+        idx.close()
+        self.assertEqual(got["dl.mp3"], ("DUPLICATE", "07 - Artist 7 - Track 7 (Original Mix).mp3"))
+        self.assertEqual(got["Artist 9 - Track 9 [Promo].mp3"][0], "SUSPECT_NEAR_DUPLICATE")
+        self.assertEqual(got["fresh copy.mp3"][0], "NEW")
+        self.assertEqual(got["fresh.mp3"], ("DUPLICATE", "fresh copy.mp3"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+import collections
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+# Add scripts to path
+SCRIPTS_PATH = Path(__file__).parent.parent / "scripts"
+sys.path.append(str(SCRIPTS_PATH))
+
+import merkle_index
+from hash_root import sha256_file
+
+
+class TestMerkleIndex(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.a = self.test_dir / "A"
+        for rel in ("crates/house/t1.mp3", "crates/house/t2.mp3", "crates/techno/deep/t3.wav", "intro.wav"):
+            p = self.a / rel
+            p.parent.mkdir(parents=True, exist_ok=True)
+            p.write_bytes(os.urandom(300))
+        shutil.copytree(self.a / "crates", self.a / "backup" / "crates")
+        self.b = self.test_dir / "B"
+        shutil.copytree(self.a, self.b)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def build(self, root):
+        out = self.test_dir / f"{root.name}.merkle"
+        records = merkle_index.records_from_root(root, sha256_file)
+        merkle_index.write_index(records, out, root, "sha256")
+        return merkle_index.MerkleIndex(out)
+
+    def test_duplicate_trees_reported_once(self):
+        with self.build(self.a) as idx:
+            groups = merkle_index.duplicate_folders([idx])
+            self.assertEqual([sorted(rel for _, rel, _, _ in m) for _, m in groups], [["backup/crates", "crates"]])
+            self.assertEqual(groups[0][1][0][3], 3)
+
+    def test_diff_visits_only_changed_subtrees(self):
+        (self.b / "crates/techno/deep/t3.wav").write_bytes(b"corrupted")
+        shutil.rmtree(self.b / "backup")
+        (self.b / "new.mp3").write_bytes(b"new")
+        with self.build(self.a) as a, self.build(self.b) as b:
+            stats = collections.Counter()
+            changes = sorted(merkle_index.diff(a, b, stats=stats))
+        self.assertEqual(
+            [(status, rel, kind) for status, rel, kind, _, _ in changes],
+            [
+                ("MISMATCH", "crates/techno/deep/t3.wav", "F"),
+                ("MISSING_IN_A", "new.mp3", "F"),
+                ("MISSING_IN_B", "backup/crates/house/t1.mp3", "F"),
+                ("MISSING_IN_B", "backup/crates/house/t2.mp3", "F"),
+                ("MISSING_IN_B", "backup/crates/techno/deep/t3.wav", "F"),
+            ],
+        )
+        # root, crates, crates/techno, crates/techno/deep; crates/house is never opened
+        self.assertEqual(stats["folders_visited"], 4)
+        with self.build(self.a) as a, self.build(self.b) as b:
+            collapsed = [(rel, kind) for s, rel, kind, _, _ in merkle_index.diff(a, b, collapse=True) if s == "MISSING_IN_B"]
+        self.assertEqual(collapsed, [("backup", "D")])
+
+    def test_sidecar_rebuilt_for_restored_older_index(self):
+        index = self.test_dir / "hash_index.tsv"
+        index.write_text(f"{'1' * 64}\ta.mp3\t/R/a.mp3\n")
+        old = index.stat().st_mtime_ns
+        index.write_text(f"{'2' * 64}\ta.mp3\t/R/a.mp3\n")
+        os.utime(index, ns=(old + 10**9, old + 10**9))
+        sidecars = self.test_dir / "merkle"
+        with merkle_index.merkle_for(index, sidecars) as idx:
+            newer = idx.digest
+        self.assertFalse(index.with_name("hash_index.tsv.merkle").exists())
+        # checkpoint_state --restore puts the older copy back with its old mtime.
+        index.write_text(f"{'1' * 64}\ta.mp3\t/R/a.mp3\n")
+        os.utime(index, ns=(old, old))
+        with merkle_index.merkle_for(index, sidecars) as idx:
+            self.assertNotEqual(idx.digest, newer)
+            self.assertEqual(idx.source, (index.stat().st_size, old))
+        self.assertEqual(len(list(sidecars.iterdir())), 1)
+
+    def test_child_pair_across_different_parent_groups_is_kept(self):
+        # X == Y and Z == W, but X != Z; X/sub == Z/sub is only reported by its own group.
+        root = self.test_dir / "C"
+        shared = os.urandom(200)
+        for parent, extra in (("X", b"x"), ("Y", b"x"), ("Z", b"z"), ("W", b"z")):
+            (root / parent / "sub").mkdir(parents=True)
+            (root / parent / "sub" / "s.wav").write_bytes(shared)
+            (root / parent / "own.wav").write_bytes(extra)
+        with self.build(root) as idx:
+            groups = [sorted(rel for _, rel, _, _ in m) for _, m in merkle_index.duplicate_folders([idx])]
+        self.assertIn(["W/sub", "X/sub", "Y/sub", "Z/sub"], groups)
+        self.assertIn(["X", "Y"], groups)
+        self.assertIn(["W", "Z"], groups)
+
+
+if __name__ == "__main__":
+    unittest.main()
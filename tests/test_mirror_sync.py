@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+# Add scripts to path
+SCRIPTS_PATH = Path(__file__).parent.parent / "scripts"
+sys.path.append(str(SCRIPTS_PATH))
+
+import mirror_sync
+from hash_index import build_index
+from hash_root import sha256_file
+
+
+class TestMirrorSync(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.a = self.test_dir / "A"
+        self.b = self.test_dir / "B"
+        for rel in ("c1/t1.mp3", "c1/t2.mp3", "c2/t3.wav", "t4.mp3"):
+            p = self.a / rel
+            p.parent.mkdir(parents=True, exist_ok=True)
+            p.write_bytes(os.urandom(2000))
+        (self.b / "c1").mkdir(parents=True)
+        shutil.copy2(self.a / "c1/t1.mp3", self.b / "c1/t1.mp3")
+        (self.b / "c1/t2.mp3").write_bytes(b"corrupt")
+        (self.b / "extra.mp3").write_bytes(b"extra")
+        self.index_a = self.test_dir / "a.tsv"
+        self.index_b = self.test_dir / "b.tsv"
+        build_index(self.a, self.index_a, sha256_file)
+        build_index(self.b, self.index_b, sha256_file)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def sync(self, *extra):
+        cmd = [sys.executable, str(SCRIPTS_PATH / "mirror_sync.py"), "--a", str(self.index_a), "--b", str(self.index_b)]
+        return subprocess.run(cmd + list(extra), capture_output=True, text=True)
+
+    def test_delta(self):
+        got = sorted((rel, status) for rel, _, _, status in mirror_sync.delta(self.index_a, self.index_b, self.test_dir))
+        self.assertEqual(
+            got,
+            [("c1/t2.mp3", "MISMATCH"), ("c2/t3.wav", "MISSING"), ("extra.mp3", "ONLY_IN_B"), ("t4.mp3", "MISSING")],
+        )
+
+    def test_resume_and_index_matches_target(self):
+        self.assertEqual(self.sync("--limit", "1").returncode, 0)
+        self.assertEqual(self.sync().returncode, 0)
+        for rel in ("c1/t2.mp3", "c2/t3.wav", "t4.mp3"):
+            self.assertEqual((self.b / rel).read_bytes(), (self.a / rel).read_bytes())
+        self.assertTrue((self.b / "extra.mp3").exists())
+        fresh = self.test_dir / "fresh.tsv"
+        build_index(self.b, fresh, sha256_file)
+        self.assertEqual(sorted(self.index_b.read_text().splitlines()), sorted(fresh.read_text().splitlines()))
+        self.assertFalse(Path(str(self.index_b) + mirror_sync.PENDING_SUFFIX).exists())
+
+    def test_torn_tail_of_b_is_cut_before_appending(self):
+        with self.index_b.open("ab") as fh:
+            fh.write(b"abc123\tc9/half")  # killed mid-line
+        result = self.sync()
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertIn("[WARN]", result.stderr)
+        fresh = self.test_dir / "fresh.tsv"
+        build_index(self.b, fresh, sha256_file)
+        self.assertEqual(sorted(self.index_b.read_text().splitlines()), sorted(fresh.read_text().splitlines()))
+
+    def test_source_changed_since_index_is_not_copied(self):
+        (self.a / "t4.mp3").write_bytes(b"edited after hashing")
+        result = self.sync()
+        self.assertEqual(result.returncode, 1)
+        self.assertFalse((self.b / "t4.mp3").exists())
+        self.assertFalse((self.b / ("t4.mp3" + mirror_sync.PART_SUFFIX)).exists())
+        self.assertNotIn("\tt4.mp3\t", self.index_b.read_text())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+# Add scripts to path
+SCRIPTS_PATH = Path(__file__).parent.parent / "scripts"
+sys.path.append(str(SCRIPTS_PATH))
+
+import quarantine_executor as qx
+from hash_root import DEFAULT_ALGO
+
+
+class TestQuarantineExecutor(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.lib = self.test_dir / "lib"
+        self.quar = self.test_dir / "quarantine"
+        self.lib.mkdir()
+        lines = []
+        for i, name in enumerate(("a.mp3", "b.mp3", "c.wav")):
+            (self.lib / "keep").mkdir(exist_ok=True)
+            (self.lib / "keep" / name).write_bytes(b"x" * (i + 1))
+            (self.lib / name).write_bytes(b"x" * (i + 1))
+            lines.append(f"h{i}\tKEEP\t{self.lib / 'keep' / name}\n")
+            lines.append(f"h{i}\tQUARANTINE\t{self.lib / name}\n")
+        self.plan = self.test_dir / "dupes_plan.tsv"
+        self.plan.write_text("".join(lines))
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def args(self, **kw):
+        defaults = dict(
+            quarantine_dir=self.quar,
+            journal=None,
+            workers=2,
+            io_per_device=1,
+            algo=DEFAULT_ALGO,
+            dry_run=False,
+            plan=self.plan,
+            limit=0,
+            run=None,
+            last=False,
+            mode="hardlink",
+        )
+        defaults.update(kw)
+        return argparse.Namespace(**defaults)
+
+    def journal(self):
+        return qx.Journal(self.quar / qx.JOURNAL_NAME)
+
+    def test_limit_resume_and_restore_last(self):
+        self.assertEqual(qx.cmd_apply(self.args(limit=2)), 0)
+        self.assertEqual(sorted(p.name for p in self.lib.iterdir()), ["c.wav", "keep"])
+        self.assertEqual(qx.cmd_apply(self.args()), 0)
+        self.assertEqual([p.name for p in self.lib.iterdir()], ["keep"])
+        self.assertEqual((self.quar / "h2" / "c.wav").read_bytes(), b"xxx")
+        journal = self.journal()
+        journal.close()
+        self.assertEqual(len(journal.runs), 2)
+        self.assertTrue(all(status == "DONE" for _, _, status in journal.state.values()))
+
+        # Rollback of the second run only.
+        self.assertEqual(qx.cmd_restore(self.args(last=True)), 0)
+        self.assertEqual(sorted(p.name for p in self.lib.iterdir()), ["c.wav", "keep"])
+        self.assertFalse((self.quar / "h2" / "c.wav").exists())
+
+    def test_in_flight_move_is_reconciled(self):
+        src = str(self.lib / "a.mp3")
+        dest = str(self.quar / "h0" / "a.mp3")
+        os.makedirs(os.path.dirname(dest))
+        journal = self.journal()
+        journal.record("MOVE", "crashed", src, dest)
+        journal.close()
+        os.rename(src, dest)  # the rename landed but DONE was never written
+        self.assertEqual(qx.cmd_apply(self.args()), 0)
+        journal = self.journal()
+        journal.close()
+        self.assertEqual(journal.state[src], ["crashed", dest, "DONE"])
+        self.assertEqual(sorted(os.listdir(self.quar / "h0")), ["a.mp3"])
+
+    def test_link_then_unlink(self):
+        (self.lib / "c.wav").write_bytes(b"zzz")  # same size as its KEEP, other content
+        self.assertEqual(qx.cmd_link(self.args()), 0)
+        a, keep_a = self.lib / "a.mp3", self.lib / "keep" / "a.mp3"
+        self.assertTrue(os.path.samefile(a, keep_a))
+        self.assertFalse(os.path.samefile(self.lib / "c.wav", self.lib / "keep" / "c.wav"))
+
+        # Linked entries are not moved to quarantine afterwards.
+        self.assertEqual(qx.cmd_apply(self.args()), 0)
+        self.assertTrue(a.exists())
+        self.assertFalse((self.lib / "c.wav").exists())
+
+        self.assertEqual(qx.cmd_unlink(self.args(last=True)), 0)
+        self.assertFalse(os.path.samefile(a, keep_a))
+        self.assertEqual(a.read_bytes(), keep_a.read_bytes())
+
+    def test_copy_verify_unlink(self):
+        src = self.lib / "a.mp3"
+        dest = self.test_dir / "copied.mp3"
+        qx.copy_verify_unlink(str(src), str(dest))
+        self.assertFalse(src.exists())
+        self.assertEqual(dest.read_bytes(), b"x")
+        self.assertFalse(Path(str(dest) + qx.PART_SUFFIX).exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
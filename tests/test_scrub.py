@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+# Add scripts to path
+SCRIPTS_PATH = Path(__file__).parent.parent / "scripts"
+sys.path.append(str(SCRIPTS_PATH))
+
+import scrub
+from hash_index import build_index
+from hash_cache import HashCache
+from hash_root import sha256_file
+
+
+class TestScrub(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = Path(tempfile.mkdtemp())
+        self.lib = self.test_dir / "lib"
+        self.lib.mkdir()
+        for i in range(6):
+            (self.lib / f"t{i}.mp3").write_bytes(os.urandom(4096))
+        self.index = self.test_dir / "hash_index.tsv"
+        build_index(self.lib, self.index, sha256_file)
+        self.state = scrub.ScrubState(self.test_dir / "scrub_state.sqlite")
+        self.state.sync_index(self.index)
+
+    def tearDown(self):
+        self.state.close()
+        shutil.rmtree(self.test_dir)
+
+    def run_scrub(self, **kw):
+        report = io.StringIO()
+        stats = scrub.scrub(self.state, scrub.Budget(0, 0), report=report, **kw)
+        return stats, report.getvalue().splitlines()
+
+    def test_resume_oldest_first(self):
+        stats, _ = self.run_scrub(max_files=4)
+        self.assertEqual(stats["OK"], 4)
+        verified = {p for p, *_ in self.state.conn.execute("SELECT path FROM files WHERE verified_at > 0")}
+        stats, _ = self.run_scrub(max_files=2)
+        self.assertEqual(stats["OK"], 2)
+        second = {p for p, *_ in self.state.conn.execute("SELECT path FROM files WHERE verified_at > 0")}
+        self.assertEqual(len(second - verified), 2)
+
+    def test_silent_corruption_vs_modified(self):
+        self.run_scrub()
+        bad = self.lib / "t1.mp3"
+        st = bad.stat()
+        with bad.open("r+b") as fh:
+            fh.seek(100)
+            fh.write(b"\xff\xfe")
+        os.utime(bad, ns=(st.st_atime_ns, st.st_mtime_ns))
+        retagged = self.lib / "t2.mp3"
+        retagged.write_bytes(b"new tags" + retagged.read_bytes())
+        os.utime(retagged, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+        stats, report = self.run_scrub()
+        self.assertEqual((stats["CORRUPT"], stats["MODIFIED"], stats["OK"]), (1, 1, 4))
+        self.assertEqual(len(report), 1)
+        rel, expected, actual = report[0].split("\t")
+        self.assertEqual(rel, "t1.mp3")
+        self.assertTrue(expected.startswith("A:") and actual.startswith("B:"))
+        # The retagged file stays MODIFIED on later passes.
+        stats, _ = self.run_scrub()
+        self.assertEqual(stats["MODIFIED"], 1)
+
+    def test_first_verify_tells_rot_from_rewrites(self):
+        # Rot between indexing and the first scrub: same size, mtime restored.
+        rotten = self.lib / "t1.mp3"
+        st = rotten.stat()
+        with rotten.open("r+b") as fh:
+            fh.write(b"\xff")
+        os.utime(rotten, ns=(st.st_atime_ns, st.st_mtime_ns))
+        # Retagged after indexing: mtime newer than the index.
+        retagged = self.lib / "t2.mp3"
+        retagged.write_bytes(b"new tags" + retagged.read_bytes())
+        later = self.index.stat().st_mtime_ns + 10**9
+        os.utime(retagged, ns=(later, later))
+        # Retagged too, but with an old mtime; hash_cache knows the new content for this stat.
+        old_mtime = self.lib / "t3.mp3"
+        st = old_mtime.stat()
+        old_mtime.write_bytes(b"other tags" + old_mtime.read_bytes())
+        os.utime(old_mtime, ns=(st.st_atime_ns, st.st_mtime_ns))
+        cache = HashCache(self.test_dir / "hash_cache.sqlite")
+        cache.store(old_mtime.stat(), sha256_file(old_mtime), "sha256")
+        try:
+            stats, report = self.run_scrub(cache=cache)
+        finally:
+            cache.close()
+        self.assertEqual((stats["CORRUPT"], stats["MODIFIED"], stats["OK"]), (1, 2, 3))
+        self.assertEqual([line.split("\t")[0] for line in report], ["t1.mp3"])
+        # The retagged files' own stat is pinned now; later passes keep them MODIFIED.
+        stats, _ = self.run_scrub()
+        self.assertEqual((stats["CORRUPT"], stats["MODIFIED"]), (1, 2))
+
+    def test_budget_paces_reads(self):
+        budget = scrub.Budget(0, 50)
+        start = time.monotonic()
+        for _ in range(10):
+            budget.spend(0)
+        self.assertGreaterEqual(time.monotonic() - start, 0.18)
+
+
+if __name__ == "__main__":
+    unittest.main()